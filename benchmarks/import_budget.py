@@ -0,0 +1,111 @@
+"""
+Import time budget of the modules that are imported at startup.
+
+Every module is imported in a fresh interpreter, the best of --repeat runs is compared with its
+budget, and the heavy dependencies that must only be imported on first use (zarr, scipy, the urdf
+packages, the Cloud SQL connector...) are checked to be absent afterwards. Exits with status 1 on
+any regression, prints the results as json. tests/test_import_budget.py runs the same checks.
+
+    python benchmarks/import_budget.py [--repeat 5] [--scale 1.5] [--output results.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# only imported once an episode is ingested or a logger is created
+LAZY_MODULES = ["zarr", "scipy", "trimesh", "rerun_loader_urdf", "urdf_parser_py"]
+
+# module -> (budget in ms, modules it must not import)
+BUDGETS = {
+    "mimic_viewer.loggers": (50, LAZY_MODULES + ["rerun"]),
+    "mimic_viewer.loggers.urdf_cache": (50, LAZY_MODULES + ["rerun"]),
+    "mimic_viewer.loggers.bimanual_049_logger": (500, LAZY_MODULES),
+    "mimic_viewer.loggers.single_hand_048_logger": (500, LAZY_MODULES),
+    "mimic_viewer.web_server.server": (1000, LAZY_MODULES + ["google.cloud.sql.connector", "ament_index_python"]),
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "imported": [name for name in {forbidden!r} if name in sys.modules]}}))
+"""
+
+def measure(module, forbidden, env):
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, forbidden=forbidden)],
+        env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1:]
+    return json.loads(result.stdout.strip().splitlines()[-1]), None
+
+def get_env():
+    """
+    Environment of the probes: this checkout of the package, and the configuration the server
+    reads from the environment at import time.
+    """
+    sqlite_path = os.path.join(tempfile.mkdtemp(), "import_budget.sqlite")
+    env = {
+        "MAX_RECORDINGS": "4",
+        "SERVER_IP_ADDRESS": "127.0.0.1",
+        "DEBUG": "",
+        "DB_BACKEND": "sqlite",
+        "DB_SQLITE_PATH": sqlite_path,
+        **os.environ,
+    }
+    # the probes measure this checkout, not whichever mimic_viewer is installed
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.join(REPO_ROOT, "src"), env.get("PYTHONPATH")]))
+    return env
+
+def check_module(module, env, repeat=5, scale=1.0):
+    """
+    Imports module repeat times and returns its result: status "ok", "over_budget" (too slow or
+    imports one of the modules it must not import) or "error" (the import failed).
+    """
+    budget_ms, forbidden = BUDGETS[module]
+    runs = []
+    error = None
+    for _ in range(repeat):
+        run, error = measure(module, forbidden, env)
+        if run is None:
+            break
+        runs.append(run)
+    if not runs:
+        return {"status": "error", "error": error}
+
+    best_ms = min(run["ms"] for run in runs)
+    imported = sorted({name for run in runs for name in run["imported"]})
+    ok = best_ms <= budget_ms * scale and not imported
+    return {
+        "status": "ok" if ok else "over_budget",
+        "ms": round(best_ms, 1),
+        "budget_ms": budget_ms * scale,
+        "eagerly_imported": imported,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every budget, for slower machines")
+    parser.add_argument("--output", help="also write the results to this json file")
+    args = parser.parse_args()
+
+    env = get_env()
+    results = {module: check_module(module, env, args.repeat, args.scale) for module in BUDGETS}
+    failed = any(result["status"] != "ok" for result in results.values())
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
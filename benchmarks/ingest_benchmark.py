@@ -0,0 +1,404 @@
+"""
+Throughput of the zarr loaders, the logging functions and whole episode ingests, on synthetic
+episodes (see synthetic_episode.py) so that it runs offline and the same on every machine.
+
+Cases:
+    loader/<point|batch|batch_prefetch>            reads an episode without logging it
+    log/<function>                                 runs a log_* function of loggers/utils.py on the
+                                                   rows of one topic, log_*_batch ones in batches
+    ingest/<point|batch|batch_prefetch|progressive>  loads an episode and logs it with its embodiment
+                                                   logger into a memory (or file, --sink) recording
+
+Every case runs in a fresh interpreter against the src/ of this checkout, the best of --repeat runs
+is kept and reported in rows/s and MB/s of values and timestamps, with the peak RSS of the run.
+The results are printed as json, with the commit and the parameters they were measured with.
+Given --compare, the cases that got slower than a previous results file by more than --tolerance
+are reported and the script exits with status 1.
+
+    python benchmarks/ingest_benchmark.py [--embodiment bimanual] [--duration 10] [--cases "ingest/*"]
+        [--repeat 3] [--sink memory] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from synthetic_episode import EMBODIMENTS, write_episode, write_urdfs
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOADER_CASES = ["loader/point", "loader/batch", "loader/batch_prefetch"]
+LOG_CASES = [
+    "log/log_transform", "log/log_transform_batch",
+    "log/log_base_transform", "log/log_base_transform_batch",
+    "log/log_joint_transform", "log/log_joint_transform_batch",
+    "log/log_quaternion_transform",
+    "log/log_image", "log/log_image_batch",
+    "log/log_scalar", "log/log_scalar_batch",
+    "log/log_hand_joints", "log/log_hand_joints_batch",
+    "log/log_wrist_pose", "log/log_wrist_pose_batch",
+    "log/log_efforts", "log/log_efforts_batch",
+]
+INGEST_CASES = ["ingest/point", "ingest/batch", "ingest/batch_prefetch", "ingest/progressive"]
+CASES = LOADER_CASES + LOG_CASES + INGEST_CASES
+
+def get_peak_rss_mb():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+def create_recording(config):
+    """
+    Returns (recording, function returning the size of what was logged in bytes).
+    """
+    import rerun as rr
+
+    recording = rr.RecordingStream("mimic_viewer_benchmark")
+    if config["sink"] == "file":
+        path = os.path.join(config["work_dir"], "benchmark.rrd")
+        recording.save(path)
+        def get_logged_bytes():
+            recording.flush(blocking=True)
+            return os.path.getsize(path)
+        return recording, get_logged_bytes
+
+    memory_recording = recording.memory_recording()
+    def get_logged_bytes():
+        recording.flush(blocking=True)
+        return len(memory_recording.drain_as_bytes())
+    return recording, get_logged_bytes
+
+def create_logger(config, recording):
+    from mimic_viewer.loggers.registry import get_logger_class
+
+    logger_name = "bimanual_049" if config["embodiment"] == "bimanual" else "single_hand_048"
+    logger = get_logger_class(logger_name)(config["urdf_path"], recording)
+    logger.reset()
+    return logger
+
+def read_topic(root, name, max_rows=None):
+    values = root[name][:max_rows]
+    timestamps = root[f"{name}_timestamps"][:max_rows]
+    return values, timestamps
+
+# ------------------------------------------------------------------------------------------------
+# cases, each one sets up a run and returns a function that does the measured work and returns
+# (rows, bytes of values and timestamps, extra results)
+
+def prepare_loader_case(config, mode):
+    from mimic_viewer.data_sources.chunk_cache import open_zarr
+    from mimic_viewer.data_sources.zarr_batch_loader import ZarrBatchLoader
+    from mimic_viewer.data_sources.zarr_point_loader import ZarrPointLoader
+
+    def run():
+        root = open_zarr(config["episode_path"])
+        num_rows = num_bytes = 0
+        if mode == "point":
+            for _, _, value in ZarrPointLoader(root).get_data():
+                num_rows += 1
+                num_bytes += value.nbytes + 8
+            return num_rows, num_bytes, {}
+
+        with ThreadPoolExecutor(config["prefetch_workers"]) as executor:
+            loader = ZarrBatchLoader(root, executor if mode == "batch_prefetch" else None, config["readahead"])
+            for data_batches in loader.get_data(config["batch_size"], max_batch_bytes=config["max_batch_bytes"]):
+                for topic_batch in data_batches:
+                    num_rows += len(topic_batch["timestamps"])
+                    num_bytes += topic_batch["values"].nbytes + topic_batch["timestamps"].nbytes
+        return num_rows, num_bytes, {}
+    return run
+
+def prepare_log_case(config, function_name):
+    from scipy.spatial.transform import Rotation as R
+    import mimic_viewer.loggers.utils as utils
+    from mimic_viewer.data_sources.chunk_cache import open_zarr
+
+    root = open_zarr(config["episode_path"])
+    # infos of the embodiment logger, its urdfs are loaded outside of the measured runs
+    logger = create_logger(config, create_recording(config)[0])
+    function = getattr(utils, function_name)
+    batched = function_name.endswith("_batch")
+    max_rows = None if batched else config["point_rows"]
+
+    # log_rows(start, end, recording) calls a batch function on rows [start, end) of the topic,
+    # log_row(row, recording) a point function on a single row
+    if "hand_joints" in function_name:
+        info = logger.hand_joint_logging_infos[0]
+        values, timestamps = read_topic(root, info.topic_name, max_rows)
+        log_rows = lambda start, end, recording: function(info, values[start:end], timestamps[start:end], recording)
+        log_row = lambda row, recording: function(info, values[row], recording)
+    elif "wrist_pose" in function_name:
+        info = logger.wrist_pose_logging_infos[0]
+        values, timestamps = read_topic(root, info.topic_name, max_rows)
+        log_rows = lambda start, end, recording: function(info, values[start:end], timestamps[start:end], recording)
+        log_row = lambda row, recording: function(info, values[row], recording)
+    elif "image" in function_name:
+        info = logger.image_logging_infos[0]
+        values, timestamps = read_topic(root, info.topic_name, max_rows)
+        log_rows = lambda start, end, recording: function(info.entity_name, values[start:end], timestamps[start:end], recording, info.color_model)
+        log_row = lambda row, recording: function(info.entity_name, values[row], recording, info.color_model)
+    elif "efforts" in function_name or "scalar" in function_name:
+        if logger.efforts_logging_infos:
+            info = logger.efforts_logging_infos[0]
+        else:
+            # a single hand has no effort sensors, its joint commands stand in for them
+            info = utils.EffortsLoggingInfo(logger.hand_joint_logging_infos[0].topic_name, "efforts", lambda joint_index: f"/{joint_index}")
+        values, timestamps = read_topic(root, info.topic_name, max_rows)
+        if "efforts" in function_name:
+            log_rows = lambda start, end, recording: function(info, values[start:end], timestamps[start:end], recording)
+            log_row = lambda row, recording: function(info, values[row], recording)
+        else:
+            values = np.ascontiguousarray(values[:, 0])
+            log_rows = lambda start, end, recording: function("efforts/0", values[start:end], timestamps[start:end], recording)
+            log_row = lambda row, recording: function("efforts/0", values[row], recording)
+    else:
+        # transforms, the wrist poses of the episode
+        values, timestamps = read_topic(root, logger.wrist_pose_logging_infos[0].topic_name, max_rows)
+        translations = np.ascontiguousarray(values[:, :3, 3])
+        rotations = R.from_matrix(values[:, :3, :3])
+        quaternions = rotations.as_quat()
+        # the point functions take scipy rotations, they are built outside of the measured runs
+        rotation_objects = [rotations[row] for row in range(len(rotations))] if not batched else []
+        entity = "/world/transform"
+        axis_length = utils.JOINT_TRANSFORM_AXIS_SIZE
+        if function_name == "log_transform_batch":
+            log_rows = lambda start, end, recording: function(entity, translations[start:end], quaternions[start:end], timestamps[start:end], axis_length, recording)
+        elif batched:
+            log_rows = lambda start, end, recording: function(entity, translations[start:end], quaternions[start:end], timestamps[start:end], recording)
+        elif function_name == "log_quaternion_transform":
+            log_row = lambda row, recording: function(entity, translations[row], quaternions[row], axis_length, recording)
+        elif function_name == "log_transform":
+            log_row = lambda row, recording: function(entity, translations[row], rotation_objects[row], axis_length, recording)
+        else:
+            log_row = lambda row, recording: function(entity, translations[row], rotation_objects[row], recording)
+
+    def run():
+        recording, get_logged_bytes = create_recording(config)
+        if batched:
+            for start in range(0, len(timestamps), config["batch_size"]):
+                log_rows(start, start + config["batch_size"], recording)
+        else:
+            for row, timestamp in enumerate(timestamps):
+                recording.set_time("time", duration=timestamp / 1e9)
+                log_row(row, recording)
+        return len(timestamps), values.nbytes + timestamps.nbytes, {"logged_bytes": get_logged_bytes()}
+    return run
+
+def prepare_ingest_case(config, mode):
+    from mimic_viewer.data_sources.chunk_cache import open_zarr
+    from mimic_viewer.data_sources.zarr_batch_loader import ZarrBatchLoader
+    from mimic_viewer.data_sources.zarr_point_loader import ZarrPointLoader
+    from mimic_viewer.ingestion.progressive_ingest import ingest_episode_progressive
+
+    # loads the urdfs once, like the server does before its first ingest
+    create_logger(config, create_recording(config)[0])
+
+    def run():
+        recording, get_logged_bytes = create_recording(config)
+        logger = create_logger(config, recording)
+        root = open_zarr(config["episode_path"])
+        num_rows = 0
+        with ThreadPoolExecutor(config["prefetch_workers"]) as executor:
+            if mode == "point":
+                for data_point in ZarrPointLoader(root).get_data():
+                    logger.log_data_point(data_point)
+                    num_rows += 1
+            elif mode == "progressive":
+                num_rows = ingest_episode_progressive(
+                    root, logger, config["batch_size"], max_batch_bytes=config["max_batch_bytes"],
+                    executor=executor, readahead=config["readahead"],
+                )
+            else:
+                loader = ZarrBatchLoader(root, executor if mode == "batch_prefetch" else None, config["readahead"])
+                for data_batches in loader.get_data(config["batch_size"], max_batch_bytes=config["max_batch_bytes"]):
+                    logger.log_data_batches(data_batches)
+                    num_rows += sum(len(topic_batch["timestamps"]) for topic_batch in data_batches)
+        logger.close()
+        # progressive ingests log the cameras twice, the episode size is what they go through
+        return num_rows, logger.logged_bytes, {"logged_bytes": get_logged_bytes()}
+    return run
+
+def run_case(name, config):
+    """
+    Runs a case config["repeat"] times in this process and returns its results.
+    """
+    group, variant = name.split("/", 1)
+    prepare = {"loader": prepare_loader_case, "log": prepare_log_case, "ingest": prepare_ingest_case}[group]
+    run = prepare(config, variant)
+
+    best = None
+    for _ in range(config["repeat"]):
+        start = time.perf_counter()
+        num_rows, num_bytes, extra = run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, num_rows, num_bytes, extra)
+
+    elapsed, num_rows, num_bytes, extra = best
+    return {
+        "seconds": round(elapsed, 4),
+        "rows": num_rows,
+        "bytes": num_bytes,
+        "rows_per_s": round(num_rows / elapsed, 1),
+        "mb_per_s": round(num_bytes / elapsed / 1e6, 2),
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+        **extra,
+    }
+
+# ------------------------------------------------------------------------------------------------
+
+def get_git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+def get_versions():
+    versions = {"python": platform.python_version()}
+    for module_name in ("numpy", "zarr", "rerun"):
+        try:
+            versions[module_name] = __import__(module_name).__version__
+        except ImportError:
+            versions[module_name] = None
+    return versions
+
+def prepare_episode(args):
+    """
+    Writes the synthetic episode and urdfs of args to the work directory, once per set of parameters.
+    """
+    episode_name = f"{args.embodiment}_{args.duration:g}s_{args.image_size[0]}x{args.image_size[1]}_chunks{args.image_chunk_rows}-{args.chunk_rows}.zarr"
+    episode_path = os.path.join(args.work_dir, episode_name)
+    urdf_path = os.path.join(args.work_dir, "urdfs")
+    if not os.path.exists(os.path.join(episode_path, ".complete")):
+        print(f"Writing the synthetic episode {episode_path}", file=sys.stderr)
+        write_episode(episode_path, args.embodiment, args.duration, tuple(args.image_size), args.image_chunk_rows, args.chunk_rows)
+        open(os.path.join(episode_path, ".complete"), "w").close()
+    if not os.path.exists(os.path.join(urdf_path, "p48", "converted.urdf")):
+        write_urdfs(urdf_path)
+    return episode_path, urdf_path
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the change of throughput of every case measured in both results, and whether any
+    case got slower than the tolerance allows.
+    """
+    comparison = {}
+    regressed = False
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if "rows_per_s" not in result or not previous or "rows_per_s" not in previous:
+            continue
+        ratio = result["rows_per_s"] / previous["rows_per_s"]
+        status = "regression" if ratio < 1 - tolerance else "ok"
+        regressed |= status == "regression"
+        comparison[name] = {
+            "status": status,
+            "throughput_ratio": round(ratio, 3),
+            "peak_rss_mb_delta": round(result["peak_rss_mb"] - previous["peak_rss_mb"], 1),
+        }
+    return comparison, regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embodiment", choices=EMBODIMENTS, default="bimanual")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of the synthetic episode")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(240, 320), metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--image-chunk-rows", type=int, default=30)
+    parser.add_argument("--chunk-rows", type=int, default=1000, help="rows per chunk of the low dimensional topics")
+    parser.add_argument("--cases", nargs="*", default=["*"], help="glob patterns of the cases to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sink", choices=["memory", "file"], default="memory", help="where the recordings are logged to")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--max-batch-bytes", type=int, default=None)
+    parser.add_argument("--prefetch-workers", type=int, default=4)
+    parser.add_argument("--readahead", type=int, default=2)
+    parser.add_argument("--point-rows", type=int, default=1000, help="rows logged by the log_* point functions")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "mimic_viewer_benchmarks"), help="where the synthetic episodes are kept")
+    parser.add_argument("--output", help="also write the results to this json file")
+    parser.add_argument("--compare", help="results file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="throughput loss accepted by --compare")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, json.loads(args.config))))
+        return
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    episode_path, urdf_path = prepare_episode(args)
+    config = {
+        "episode_path": episode_path,
+        "urdf_path": urdf_path,
+        "work_dir": args.work_dir,
+        "embodiment": args.embodiment,
+        "sink": args.sink,
+        "repeat": args.repeat,
+        "batch_size": args.batch_size,
+        "max_batch_bytes": args.max_batch_bytes,
+        "prefetch_workers": args.prefetch_workers,
+        "readahead": args.readahead,
+        "point_rows": args.point_rows,
+    }
+
+    # the cases measure this checkout, not whichever mimic_viewer is installed
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.join(REPO_ROOT, "src"), env.get("PYTHONPATH")]))
+
+    cases = [name for name in CASES if any(fnmatch.fnmatch(name, pattern) for pattern in args.cases)]
+    results = {}
+    for name in cases:
+        print(f"Running {name}", file=sys.stderr)
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-case", name, "--config", json.dumps(config)],
+            env=env, capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            results[name] = {"status": "error", "error": process.stderr.strip().splitlines()[-1:]}
+            continue
+        results[name] = json.loads(process.stdout.strip().splitlines()[-1])
+
+    report = {
+        "commit": get_git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": {"platform": platform.platform(), "processor": platform.machine(), "cpu_count": os.cpu_count()},
+        "versions": get_versions(),
+        "parameters": {
+            **{key: value for key, value in config.items() if key not in ("episode_path", "urdf_path", "work_dir")},
+            "duration": args.duration,
+            "image_size": list(args.image_size),
+            "image_chunk_rows": args.image_chunk_rows,
+            "chunk_rows": args.chunk_rows,
+        },
+        "results": results,
+    }
+
+    failed = any(result.get("status") == "error" for result in results.values())
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("parameters") != report["parameters"]:
+            print("⚠️ Warning: the baseline was measured with other parameters, the comparison is not meaningful.", file=sys.stderr)
+        report["comparison"], regressed = compare(results, baseline.get("results", {}), args.tolerance)
+        report["baseline_commit"] = baseline.get("commit")
+        failed |= regressed
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Synthetic episodes and hand urdfs for the benchmarks.
+
+An episode is a zarr with the topics an embodiment logger handles, each data array next to its
+"_timestamps" array (int64 ns) like the recorded episodes. Values are smooth trajectories with a
+bit of noise so that they compress like real data, and the same arguments always write the same
+episode. The urdfs have the joint names of the mimic hands and a small mesh per link, they stand in
+for the ones of the mimic_viz package which is not needed to run the benchmarks.
+
+    python benchmarks/synthetic_episode.py /tmp/episode.zarr [--embodiment bimanual] [--duration 10]
+"""
+import argparse
+from dataclasses import dataclass
+import os
+
+import numpy as np
+
+EMBODIMENTS = ("bimanual", "single_hand")
+
+# joint names of the hand urdfs, per finger from the palm outwards
+HAND_JOINTS = {
+    "thumb": ["base2cmc", "cmc2mcp", "mcp2pp", "pp2dp_actuated"],
+    "index": ["base2mcp", "mcp2pp", "pp2mp", "mp2dp"],
+    "middle": ["base2mcp", "mcp2pp", "pp2mp", "mp2dp"],
+    "ring": ["base2mcp", "mcp2pp", "pp2mp", "mp2dp"],
+    "pinky": ["base2mcp", "mcp2pp", "pp2mp", "mp2dp"],
+}
+NUM_JOINTS = sum(len(joints) for joints in HAND_JOINTS.values())
+# every joint but the distal ones of the fingers is actuated
+NUM_ACTIONABLE_JOINTS = NUM_JOINTS - (len(HAND_JOINTS) - 1)
+
+# urdf directory -> hands written in it, see the embodiment loggers
+HAND_URDFS = ("p48", "p49", "p49l")
+
+@dataclass
+class TopicSpec:
+    name: str
+    row_shape: tuple
+    dtype: str
+    rate_hz: float
+    chunk_rows: int
+    kind: str # "joints", "pose", "efforts" or "image"
+
+def get_topic_specs(embodiment="bimanual", image_shape=(240, 320), image_chunk_rows=30, chunk_rows=1000):
+    """
+    Topics of an episode of embodiment, with rgb frames of image_shape (height, width).
+    Low rate image topics and high rate low dimensional topics are chunked separately.
+    """
+    image_row_shape = (*image_shape, 3)
+    if embodiment == "bimanual":
+        sides = ["left", "right"]
+        specs = [
+            TopicSpec(f"mimic_hand__{side}__joint_cmd", (NUM_ACTIONABLE_JOINTS,), "float64", 100, chunk_rows, "joints")
+            for side in sides
+        ]
+        specs += [
+            TopicSpec(f"mimic_hand__{side}__proprioceptive_state_positions", (NUM_JOINTS,), "float64", 100, chunk_rows, "joints")
+            for side in sides
+        ]
+        specs.append(TopicSpec("mimic_hand__right__motors_state_efforts", (NUM_ACTIONABLE_JOINTS,), "float64", 100, chunk_rows, "efforts"))
+        specs += [
+            TopicSpec(f"mimic__{side}__root__{pose}_pose", (4, 4), "float64", 100, chunk_rows, "pose")
+            for side in sides for pose in ("state", "commanded")
+        ]
+        cameras = ["fixed_0", "left__wrist_top", "right__wrist_top", "left__wrist_bottom", "right__wrist_bottom"]
+    elif embodiment == "single_hand":
+        specs = [
+            TopicSpec("mimic_hand__right__joint_cmd", (NUM_ACTIONABLE_JOINTS,), "float64", 100, chunk_rows, "joints"),
+            TopicSpec("mimic__right__root__commanded_pose", (4, 4), "float64", 100, chunk_rows, "pose"),
+        ]
+        cameras = ["fixed_0", "wrist_top", "wrist_bottom"]
+    else:
+        raise ValueError(f"Unknown embodiment '{embodiment}', expected one of {EMBODIMENTS}.")
+
+    specs += [TopicSpec(f"cameras__{camera}", image_row_shape, "uint8", 30, image_chunk_rows, "image") for camera in cameras]
+    return specs
+
+def make_values(spec, num_rows, rng):
+    from scipy.spatial.transform import Rotation as R
+
+    t = np.arange(num_rows) / spec.rate_hz
+    if spec.kind == "joints":
+        phases = rng.uniform(0, 2 * np.pi, spec.row_shape[0])
+        values = 30 * np.sin(2 * np.pi * 0.5 * t[:, None] + phases) + rng.normal(0, 0.5, (num_rows, spec.row_shape[0]))
+        # proprioception is recorded in radians, commands in degrees
+        return np.deg2rad(values) if "proprioceptive" in spec.name else values
+    if spec.kind == "efforts":
+        return np.abs(np.sin(2 * np.pi * 0.2 * t[:, None])) + rng.normal(0, 0.05, (num_rows, spec.row_shape[0]))
+    if spec.kind == "pose":
+        values = np.zeros((num_rows, 4, 4))
+        values[:, :3, :3] = R.from_rotvec(0.3 * np.stack([np.sin(t), np.cos(t), np.sin(0.5 * t)], axis=1)).as_matrix()
+        values[:, :3, 3] = 0.1 * np.stack([np.sin(t), np.cos(t), 0.5 + 0.1 * np.sin(2 * t)], axis=1)
+        values[:, 3, 3] = 1
+        return values
+    # a gradient that drifts across the frame, plus sensor noise
+    height, width, _ = spec.row_shape
+    base = np.add.outer(np.arange(height), np.arange(width)).astype(np.int64)
+    frames = np.empty((num_rows, *spec.row_shape), dtype=np.uint8)
+    for row in range(num_rows):
+        frame = (base + 4 * row) % 256
+        frames[row] = (frame[:, :, None] + rng.integers(0, 8, spec.row_shape)).astype(np.uint8)
+    return frames
+
+def write_episode(path, embodiment="bimanual", duration=10.0, image_shape=(240, 320), image_chunk_rows=30, chunk_rows=1000, seed=0):
+    """
+    Writes a synthetic episode of duration seconds to the zarr at path (replacing it) and returns
+    its topic specs. Image topics are written chunk by chunk to keep the memory use low.
+    """
+    import zarr
+
+    rng = np.random.default_rng(seed)
+    root = zarr.open(path, mode="w")
+    specs = get_topic_specs(embodiment, image_shape, image_chunk_rows, chunk_rows)
+    for spec in specs:
+        num_rows = max(1, int(duration * spec.rate_hz))
+        # topics are not recorded in sync, every one starts a little after the episode
+        timestamps = (rng.integers(0, 10_000_000) + np.arange(num_rows) * (1e9 / spec.rate_hz)).astype(np.int64)
+        root.create_dataset(f"{spec.name}_timestamps", data=timestamps, chunks=(spec.chunk_rows,))
+        array = root.create_dataset(spec.name, shape=(num_rows, *spec.row_shape), dtype=spec.dtype, chunks=(spec.chunk_rows, *spec.row_shape))
+        for start in range(0, num_rows, spec.chunk_rows):
+            end = min(start + spec.chunk_rows, num_rows)
+            array[start:end] = make_values(spec, end - start, rng)
+    return specs
+
+def write_hand_urdf(directory):
+    """
+    Writes directory/converted.urdf, a hand with the joints of HAND_JOINTS and an icosphere mesh per link.
+    """
+    import trimesh
+
+    os.makedirs(os.path.join(directory, "meshes"), exist_ok=True)
+    trimesh.creation.icosphere(subdivisions=3, radius=0.01).export(os.path.join(directory, "meshes", "phalanx.stl"))
+
+    links = ['<link name="base"><visual><geometry><box size="0.05 0.08 0.02"/></geometry><material name="grey"/></visual></link>']
+    joints = []
+    for finger_index, (finger, joint_names) in enumerate(HAND_JOINTS.items()):
+        parent = "base"
+        for joint_name in joint_names:
+            child = f"{finger}_{joint_name.split('2')[-1]}"
+            origin = f"{0.02 * finger_index - 0.04} 0 0.03" if parent == "base" else "0 0 0.02"
+            links.append(f'<link name="{child}"><visual><geometry><mesh filename="meshes/phalanx.stl"/></geometry><material name="grey"/></visual></link>')
+            joints.append(
+                f'<joint name="{finger}_{joint_name}" type="revolute"><parent link="{parent}"/><child link="{child}"/>'
+                f'<origin xyz="{origin}" rpy="0 0 0.1"/><axis xyz="1 0 0"/><limit lower="-1.6" upper="1.6" effort="1" velocity="1"/></joint>'
+            )
+            parent = child
+
+    with open(os.path.join(directory, "converted.urdf"), "w") as f:
+        f.write(
+            '<?xml version="1.0"?>\n<robot name="hand"><material name="grey"><color rgba="0.5 0.5 0.5 1"/></material>'
+            + "".join(links + joints)
+            + "</robot>\n"
+        )
+
+def write_urdfs(directory):
+    """
+    Writes the hand urdfs of every embodiment logger under directory, which can then be passed
+    as the urdf_path of the loggers.
+    """
+    for hand in HAND_URDFS:
+        write_hand_urdf(os.path.join(directory, hand))
+    return directory
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="zarr to write")
+    parser.add_argument("--embodiment", choices=EMBODIMENTS, default="bimanual")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(240, 320), metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--image-chunk-rows", type=int, default=30)
+    parser.add_argument("--chunk-rows", type=int, default=1000, help="rows per chunk of the low dimensional topics")
+    parser.add_argument("--urdfs", help="also write the hand urdfs to this directory")
+    args = parser.parse_args()
+
+    specs = write_episode(args.path, args.embodiment, args.duration, tuple(args.image_size), args.image_chunk_rows, args.chunk_rows)
+    print(f"Wrote {len(specs)} topics to {args.path}")
+    if args.urdfs:
+        write_urdfs(args.urdfs)
+        print(f"Wrote the hand urdfs to {args.urdfs}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from fsspec.utils import get_protocol
+from zarr.storage import FSStore, Store, normalize_store_arg
+
+from mimic_viewer.data_sources.topic_manifest import get_store_topic_manifest
+from mimic_viewer.tracing import span
+
+# temporary files are written next to the cache entries and renamed once complete
+_TMP_PREFIX = ".tmp-"
+
+class DiskChunkCache:
+    """
+    On disk cache of zarr store values (chunks and metadata), shared by every process of the host
+    that points at the same directory.
+
+    Entries are addressed by the sha256 of (namespace, key), the namespace being the url of the
+    zarr store, and written to a temporary file that is atomically renamed into place, so a crash
+    never leaves a partial entry behind. Reading an entry bumps its mtime, and once the cache grows
+    past max_bytes the least recently used entries are deleted until it is back under
+    low_watermark * max_bytes.
+
+    Episodes are assumed to be immutable once uploaded, entries are never revalidated against the store.
+    The size of the cache is only scanned on the first write (or stats), so opening a cache, e.g.
+    in every task of a sharded ingest, is cheap. Only the configuration is pickled.
+    """
+    def __init__(self, directory, max_bytes, low_watermark=0.9):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be a positive integer.")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_watermark = low_watermark
+        self.hits = self.misses = self.evictions = 0
+
+        self.__lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        # scanned on first use, see __get_current_bytes()
+        self.__current_bytes = None
+
+    def __getstate__(self):
+        return (self.directory, self.max_bytes, self.low_watermark)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @property
+    def current_bytes(self):
+        with self.__lock:
+            return self.__get_current_bytes()
+
+    def get_stats(self):
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "current_bytes": self.__get_current_bytes(),
+                "max_bytes": self.max_bytes,
+            }
+
+    def get(self, namespace, key):
+        path = self.__entry_path(namespace, key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+        except FileNotFoundError:
+            with self.__lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted since it was read, the value is still good
+            pass
+        with self.__lock:
+            self.hits += 1
+        return value
+
+    def contains(self, namespace, key):
+        return os.path.exists(self.__entry_path(namespace, key))
+
+    def put(self, namespace, key, value):
+        value = bytes(value)
+        if len(value) > self.max_bytes:
+            return
+        with self.__lock:
+            # scanned before the entry is written, so that it is not counted twice
+            self.__get_current_bytes()
+        path = self.__entry_path(namespace, key)
+        try:
+            # an overwritten entry no longer takes up its old size
+            previous_bytes = os.path.getsize(path)
+        except FileNotFoundError:
+            previous_bytes = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=_TMP_PREFIX, dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self.__lock:
+            self.__current_bytes += len(value) - previous_bytes
+            needs_eviction = self.__current_bytes > self.max_bytes
+        if needs_eviction:
+            self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache is under low_watermark * max_bytes.
+        The directory is rescanned, so entries written by other processes are accounted for.
+        """
+        with self.__lock:
+            entries = sorted(self.__scan_entries())
+            current_bytes = sum(size for _, _, size in entries)
+            target_bytes = self.max_bytes * self.low_watermark
+            for _, path, size in entries:
+                if current_bytes <= target_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except FileNotFoundError:
+                    # already evicted by another process
+                    pass
+                current_bytes -= size
+            self.__current_bytes = current_bytes
+
+    def __get_current_bytes(self):
+        """
+        Called with __lock held.
+        """
+        if self.__current_bytes is None:
+            self.__current_bytes = sum(size for _, _, size in self.__scan_entries())
+        return self.__current_bytes
+
+    def __entry_path(self, namespace, key):
+        digest = hashlib.sha256(f"{namespace}\0{key}".encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def __scan_entries(self):
+        """
+        Yields (mtime, path, size) of every complete entry of the cache.
+        """
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(_TMP_PREFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, entry.path, stat.st_size
+
+class DiskCachedStore(Store):
+    """
+    Read through zarr store that keeps the values of another store in a DiskChunkCache.
+    Listings are forwarded to the wrapped store.
+    """
+    def __init__(self, store, chunk_cache, namespace):
+        self._store = Store._ensure_store(store)
+        self._chunk_cache = chunk_cache
+        self._namespace = namespace
+
+    @property
+    def path(self):
+        # location of the wrapped store, the per process caches of topic manifests and timestamp indexes are keyed on it
+        return getattr(self._store, "path", self._namespace)
+
+    def __getitem__(self, key):
+        value = self._chunk_cache.get(self._namespace, key)
+        if value is None:
+            value = self._store[key]
+            self._chunk_cache.put(self._namespace, key, value)
+        return value
+
+    def getitems(self, keys, *, contexts):
+        values = {}
+        missing_keys = []
+        for key in keys:
+            value = self._chunk_cache.get(self._namespace, key)
+            if value is None:
+                missing_keys.append(key)
+            else:
+                values[key] = value
+
+        if missing_keys:
+            # the wrapped store may fetch the missing keys concurrently (e.g. FSStore)
+            with span("fetch_chunks", chunks=len(missing_keys), cached=len(values)):
+                fetched = self._store.getitems(missing_keys, contexts={key: contexts.get(key) for key in missing_keys})
+            for key, value in fetched.items():
+                self._chunk_cache.put(self._namespace, key, value)
+                values[key] = value
+        return values
+
+    def __contains__(self, key):
+        return self._chunk_cache.contains(self._namespace, key) or key in self._store
+
+    def __setitem__(self, key, value):
+        raise PermissionError("DiskCachedStore is read only.")
+
+    def __delitem__(self, key):
+        raise PermissionError("DiskCachedStore is read only.")
+
+    def __iter__(self):
+        return iter(self._store)
+
+    def __len__(self):
+        return len(self._store)
+
+    def keys(self):
+        return self._store.keys()
+
+    def listdir(self, path=None):
+        return self._store.listdir(path)
+
+    def getsize(self, path=None):
+        return self._store.getsize(path)
+
+    def close(self):
+        self._store.close()
+
+def open_zarr(url, chunk_cache=None, manifest=None):
+    """
+    Opens the group of a zarr read only. Remote stores (anything but local paths) are read through
+    chunk_cache when it is given. The metadata of the zarr comes from its manifest (see
+    get_store_topic_manifest), so opening the same url again and opening its arrays make no request.
+    manifest can be given when it was read elsewhere, e.g. in another process.
+    """
+    with span("open_zarr", url=url):
+        if chunk_cache is None or get_protocol(url) in ("file", "local"):
+            store = normalize_store_arg(url, mode="r")
+        else:
+            store = DiskCachedStore(FSStore(url, mode="r"), chunk_cache, namespace=url)
+        if manifest is None:
+            manifest = get_store_topic_manifest(store)
+        return manifest.open(store)
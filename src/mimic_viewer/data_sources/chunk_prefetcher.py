@@ -0,0 +1,88 @@
+from collections import deque
+
+from mimic_viewer.metrics import BYTES_READ, CHUNK_FETCH_SECONDS, CHUNK_READS_IN_FLIGHT, ROWS_READ
+from mimic_viewer.tracing import propagate, span
+
+class ChunkPrefetcher:
+    """
+    Reads row ranges of zarr data groups ahead of time on an executor, so that the reads of every
+    topic are in flight at the same time instead of one chunk after the other.
+
+    Every topic gets a list of (start, end) slices with schedule(), and get() returns the
+    (values, timestamps) of the next slice of that topic, in order. At most readahead slices per
+    topic are in flight or waiting to be consumed: a new read is only issued once get() takes one
+    out, so a slow consumer stops the reads instead of filling up memory.
+    """
+    def __init__(self, executor, readahead=2):
+        if readahead <= 0:
+            raise ValueError("readahead must be a positive integer.")
+        self.__executor = executor
+        self.__readahead = readahead
+        self.__arrays = {}
+        self.__remaining_slices = {}
+        self.__pending_reads = {}
+
+    def schedule(self, topic_slices):
+        """
+        topic_slices maps a topic name to a (data_array, timestamp_array, slices) tuple.
+        The first reads of all topics are submitted round robin, so every topic gets its
+        first slice before any topic gets its second one.
+        """
+        for name, (data_array, timestamp_array, slices) in topic_slices.items():
+            self.__arrays[name] = (data_array, timestamp_array)
+            self.__remaining_slices[name] = iter(slices)
+            self.__pending_reads[name] = deque()
+
+        for _ in range(self.__readahead):
+            for name in topic_slices:
+                self.__submit_next(name)
+
+    def get(self, name):
+        pending_reads = self.__pending_reads[name]
+        if not pending_reads:
+            raise IndexError(f"No more slices scheduled for '{name}'.")
+        future = pending_reads.popleft()
+        CHUNK_READS_IN_FLIGHT.dec()
+        self.__submit_next(name)
+        # time the consumer is stalled on a read that has not finished yet
+        with span("wait_rows", topic=name):
+            return future.result()
+
+    def close(self):
+        """
+        Cancels the reads that have not started yet. Reads that are already running are left to finish.
+        """
+        for pending_reads in self.__pending_reads.values():
+            for future in pending_reads:
+                future.cancel()
+            CHUNK_READS_IN_FLIGHT.dec(len(pending_reads))
+            pending_reads.clear()
+        self.__remaining_slices.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __submit_next(self, name):
+        next_slice = next(self.__remaining_slices[name], None)
+        if next_slice is None:
+            return
+        data_array, timestamp_array = self.__arrays[name]
+        self.__pending_reads[name].append(
+            self.__executor.submit(propagate(read_slice), name, data_array, timestamp_array, *next_slice)
+        )
+        CHUNK_READS_IN_FLIGHT.inc()
+
+def read_slice(name, data_array, timestamp_array, start, end, loader="prefetcher"):
+    """
+    Reads rows start to end of the values and timestamps of topic name, and records it in the metrics.
+    The read_rows span covers fetching and decompressing the chunks, remote stores read through
+    the chunk cache add a fetch_chunks span for the fetch alone.
+    """
+    with CHUNK_FETCH_SECONDS.time(loader=loader), span("read_rows", topic=name, start=start, end=end, loader=loader):
+        values, timestamps = data_array[start:end], timestamp_array[start:end]
+    ROWS_READ.inc(len(timestamps), topic=name)
+    BYTES_READ.inc(values.nbytes + timestamps.nbytes, topic=name)
+    return values, timestamps
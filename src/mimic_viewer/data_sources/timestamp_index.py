@@ -0,0 +1,186 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+
+import numpy as np
+
+@dataclass(frozen=True)
+class EpisodeWindow:
+    """
+    Part of an episode to load. start_time and end_time are in the unit of the *_timestamps
+    arrays (ns) and both inclusive, start_index and end_index are row indices (end exclusive)
+    applied to every data group. Unset bounds are open, and when both a time and an index range
+    are given a row has to be in both.
+    """
+    start_time: int | None = None
+    end_time: int | None = None
+    start_index: int | None = None
+    end_index: int | None = None
+
+    def get_row_range(self, timestamp_array, length):
+        start_row = max(self.start_index or 0, 0)
+        end_row = length if self.end_index is None else min(self.end_index, length)
+        if self.start_time is not None or self.end_time is not None:
+            time_start_row, time_end_row = get_timestamp_index(timestamp_array).find_row_range(
+                timestamp_array, self.start_time, self.end_time
+            )
+            start_row = max(start_row, time_start_row)
+            end_row = min(end_row, time_end_row)
+        return start_row, max(start_row, end_row)
+
+class TimestampIndex:
+    """
+    First and last timestamp of the chunks of a timestamp array, filled in as chunks are read.
+    Timestamps are expected to be sorted: find_row_range() binary searches the chunks holding the
+    bounds of a time window, reading about log2(number of chunks) chunks of an array the first
+    time and mostly the one or two chunks holding the bounds once the index knows the array.
+
+    A chunk that turns out not to be sorted, or out of order with the chunks read before it,
+    switches the index to the min and max of every chunk, which reads the whole array once.
+    find_row_range() then reads the chunks that can hold a timestamp of the window, from both
+    ends, until it finds the first and the last matching rows. Timestamps out of order in chunks
+    that are never read go unnoticed.
+    """
+    def __init__(self, chunk_size, length):
+        self.chunk_size = chunk_size
+        self.length = length
+        self.num_chunks = -(-length // chunk_size)
+        self.is_sorted = True
+        # chunk index -> (first timestamp, last timestamp) of the chunks read so far, sorted arrays only
+        self.__chunk_bounds = {}
+        # min and max of every chunk, unsorted arrays only
+        self.__chunk_mins = self.__chunk_maxs = None
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def build(cls, timestamp_array):
+        """
+        Reads nothing, chunks are read when find_row_range() needs them.
+        """
+        return cls(timestamp_array.chunks[0], len(timestamp_array))
+
+    def find_row_range(self, timestamp_array, start_time=None, end_time=None):
+        """
+        Returns (start_row, end_row) such that rows start_row to end_row - 1 have a timestamp
+        between start_time and end_time, both inclusive.
+        """
+        if self.length == 0:
+            return 0, 0
+
+        if self.is_sorted:
+            start_row = 0 if start_time is None else self.__search(timestamp_array, start_time, "left")
+            end_row = self.length if end_time is None else self.__search(timestamp_array, end_time, "right")
+            # the search may have found the array unsorted
+            if self.is_sorted:
+                return start_row, max(start_row, end_row)
+        return self.__find_unsorted_row_range(timestamp_array, start_time, end_time)
+
+    def __search(self, timestamp_array, timestamp, side):
+        """
+        np.searchsorted(timestamps, timestamp, side) of the whole array, the row is in the first
+        chunk whose last timestamp is >= timestamp ("left") or > timestamp ("right").
+        """
+        chunks = {}
+        low, high = 0, self.num_chunks
+        while low < high:
+            chunk_idx = (low + high) // 2
+            last_timestamp = self.__get_chunk_bounds(timestamp_array, chunk_idx, chunks)[1]
+            if last_timestamp > timestamp or (side == "left" and last_timestamp == timestamp):
+                high = chunk_idx
+            else:
+                low = chunk_idx + 1
+        if low == self.num_chunks:
+            return self.length
+        chunk = chunks[low] if low in chunks else self.__read_chunk(timestamp_array, low)
+        return low * self.chunk_size + int(np.searchsorted(chunk, timestamp, side=side))
+
+    def __get_chunk_bounds(self, timestamp_array, chunk_idx, chunks):
+        """
+        Chunks read to get their bounds are kept in chunks.
+        """
+        bounds = self.__chunk_bounds.get(chunk_idx)
+        if bounds is None:
+            chunk = chunks[chunk_idx] = self.__read_chunk(timestamp_array, chunk_idx)
+            bounds = (chunk[0], chunk[-1])
+        return bounds
+
+    def __read_chunk(self, timestamp_array, chunk_idx):
+        chunk_start = chunk_idx * self.chunk_size
+        chunk = timestamp_array[chunk_start:min(chunk_start + self.chunk_size, self.length)]
+        with self.__lock:
+            if not self.is_sorted or chunk_idx in self.__chunk_bounds:
+                return chunk
+            self.__chunk_bounds[chunk_idx] = (chunk[0], chunk[-1])
+            # the chunk is sorted and its bounds are between the ones of the chunks read before and after it
+            bounds = [self.__chunk_bounds[idx] for idx in sorted(self.__chunk_bounds)]
+            if np.any(chunk[1:] < chunk[:-1]) or any(previous[1] > bound[0] for previous, bound in zip(bounds, bounds[1:])):
+                self.is_sorted = False
+                self.__chunk_bounds = {}
+        return chunk
+
+    def __find_unsorted_row_range(self, timestamp_array, start_time, end_time):
+        with self.__lock:
+            if self.__chunk_mins is None:
+                timestamps = timestamp_array[:]
+                chunk_starts = np.arange(0, self.length, self.chunk_size)
+                self.__chunk_mins = np.minimum.reduceat(timestamps, chunk_starts)
+                self.__chunk_maxs = np.maximum.reduceat(timestamps, chunk_starts)
+
+        maybe_in_window = np.ones(self.num_chunks, dtype=bool)
+        if start_time is not None:
+            maybe_in_window &= self.__chunk_maxs >= start_time
+        if end_time is not None:
+            maybe_in_window &= self.__chunk_mins <= end_time
+        candidate_chunks = np.flatnonzero(maybe_in_window)
+
+        def find_rows(chunk_idx):
+            chunk_start = chunk_idx * self.chunk_size
+            chunk = timestamp_array[chunk_start:min(chunk_start + self.chunk_size, self.length)]
+            in_window = np.ones(len(chunk), dtype=bool)
+            if start_time is not None:
+                in_window &= chunk >= start_time
+            if end_time is not None:
+                in_window &= chunk <= end_time
+            return chunk_start + np.flatnonzero(in_window)
+
+        # rows spanning every matching timestamp
+        for first_idx, chunk_idx in enumerate(candidate_chunks):
+            rows = find_rows(chunk_idx)
+            if len(rows):
+                start_row = int(rows[0])
+                break
+        else:
+            return 0, 0
+        for chunk_idx in candidate_chunks[first_idx:][::-1]:
+            rows = find_rows(chunk_idx)
+            if len(rows):
+                return start_row, int(rows[-1]) + 1
+
+_index_cache : OrderedDict = OrderedDict()
+_index_cache_lock = threading.Lock()
+_INDEX_CACHE_SIZE = 1024
+
+def get_timestamp_index(timestamp_array):
+    """
+    Returns the TimestampIndex of timestamp_array, building it on first use. Indexes are cached
+    per process by the path of the store the chunks are read from and the array path, so
+    reopening an episode reuses the chunk bounds read for the previous windows. The chunk store is used rather than
+    the store because arrays opened from a topic manifest keep their metadata in memory.
+    """
+    store_path = getattr(timestamp_array.chunk_store, "path", None)
+    if store_path is None:
+        return TimestampIndex.build(timestamp_array)
+
+    key = (store_path, timestamp_array.path)
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+
+    index = TimestampIndex.build(timestamp_array)
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import json
+import math
+import threading
+
+import numpy as np
+import zarr
+from zarr.storage import ConsolidatedMetadataStore, KVStore
+
+from mimic_viewer.tracing import span
+
+CONSOLIDATED_METADATA_KEY = ".zmetadata"
+
+@dataclass(frozen=True)
+class TopicInfo:
+    name: str
+    length: int
+    dtype: str
+    row_shape: tuple
+    chunk_rows: int
+    timestamp_dtype: str
+    timestamp_chunk_rows: int
+
+    @property
+    def row_nbytes(self):
+        """
+        Uncompressed size of a row and its timestamp, in bytes.
+        """
+        return np.dtype(self.dtype).itemsize * math.prod(self.row_shape) + np.dtype(self.timestamp_dtype).itemsize
+
+@dataclass
+class TopicManifest:
+    """
+    The data groups of an episode zarr (topics, each with a "_timestamps" array of the same
+    length) and the metadata documents of its arrays, in the consolidated metadata format.
+    Manifests only hold plain data, they can be cached and sent to other processes.
+    """
+    # data group name -> info, sorted by name
+    topics: dict[str, TopicInfo]
+    # data groups without a timestamp array, which cannot be loaded
+    untimed_names: list[str]
+    # the consolidated metadata document (json) the manifest was built from
+    metadata_document: bytes = field(repr=False)
+    # whether the zarr had consolidated metadata, or the documents were read one by one
+    consolidated: bool = False
+
+    def open(self, store, path=""):
+        """
+        Opens the zarr group of store at path with its metadata read from the manifest, only the
+        chunks are read from store. Opening the arrays of the group makes no request.
+        """
+        return zarr.open_consolidated(KVStore({CONSOLIDATED_METADATA_KEY: self.metadata_document}), chunk_store=store, mode="r", path=path or None)
+
+# (store type, store path, group path) -> manifest, least recently used first
+_manifest_cache : OrderedDict = OrderedDict()
+_manifest_cache_lock = threading.Lock()
+MANIFEST_CACHE_SIZE = 1024
+
+def _get_cache_key(store, path):
+    store_path = getattr(store, "path", None)
+    if store_path is None or isinstance(store, ConsolidatedMetadataStore):
+        # stores without a location (e.g. in memory) are not cached
+        return None
+    return (type(store).__name__, str(store_path), path)
+
+def _decode(value):
+    # ConsolidatedMetadataStore hands out decoded documents
+    return value if isinstance(value, dict) else json.loads(value)
+
+def read_topic_manifest(store, path="") -> TopicManifest:
+    """
+    Builds the manifest of the zarr group of store at path, in two requests to the store: one
+    listing of the group, and either its consolidated metadata (.zmetadata, see
+    zarr.consolidate_metadata) or all the metadata documents of its arrays in a single getitems()
+    that remote stores (e.g. FSStore) serve concurrently.
+    """
+    prefix = f"{path}/" if path else ""
+    with span("read_topic_manifest", path=path):
+        names = sorted(store.listdir(path))
+        consolidated = not path and CONSOLIDATED_METADATA_KEY in names
+        if consolidated:
+            metadata = _decode(store[CONSOLIDATED_METADATA_KEY])["metadata"]
+        else:
+            keys = [f"{prefix}.zgroup", f"{prefix}.zattrs"] + [f"{prefix}{name}/.zarray" for name in names if not name.startswith(".")]
+            metadata = {key: _decode(value) for key, value in store.getitems(keys, contexts={}).items()}
+
+    metadata_document = json.dumps({"zarr_consolidated_format": 1, "metadata": metadata}).encode()
+    root = zarr.open_consolidated(KVStore({CONSOLIDATED_METADATA_KEY: metadata_document}), chunk_store=store, mode="r", path=path or None)
+    array_names = {name for name in names if f"{prefix}{name}/.zarray" in metadata}
+
+    topics = {}
+    untimed_names = []
+    for name in sorted(array_names):
+        if name.endswith("_timestamps"):
+            continue
+        timestamp_name = f"{name}_timestamps"
+        if timestamp_name not in array_names:
+            untimed_names.append(name)
+            continue
+        data_array = root[name]
+        timestamp_array = root[timestamp_name]
+        if len(data_array) != len(timestamp_array):
+            continue
+        topics[name] = TopicInfo(
+            name=name,
+            length=len(data_array),
+            dtype=data_array.dtype.str,
+            row_shape=tuple(data_array.shape[1:]),
+            chunk_rows=data_array.chunks[0],
+            timestamp_dtype=timestamp_array.dtype.str,
+            timestamp_chunk_rows=timestamp_array.chunks[0],
+        )
+    return TopicManifest(topics, untimed_names, metadata_document, consolidated)
+
+def get_topic_manifest(zarr_root) -> TopicManifest:
+    """
+    Returns the manifest of an opened zarr group, see get_store_topic_manifest().
+    """
+    return get_store_topic_manifest(zarr_root.store, zarr_root.path, chunk_store=zarr_root.chunk_store)
+
+def get_store_topic_manifest(store, path="", chunk_store=None) -> TopicManifest:
+    """
+    Returns the manifest of the zarr group of store at path, read once per location and process.
+    The location is the one of chunk_store when the metadata is stored apart from the chunks
+    (e.g. a group opened with consolidated metadata). Episodes are not modified once recorded,
+    cached manifests are never refreshed, see clear_topic_manifest_cache().
+    """
+    key = _get_cache_key(chunk_store if chunk_store is not None else store, path)
+    if key is not None:
+        with _manifest_cache_lock:
+            manifest = _manifest_cache.get(key)
+            if manifest is not None:
+                _manifest_cache.move_to_end(key)
+                return manifest
+
+    manifest = read_topic_manifest(store, path)
+    if key is not None:
+        with _manifest_cache_lock:
+            _manifest_cache[key] = manifest
+            while len(_manifest_cache) > MANIFEST_CACHE_SIZE:
+                _manifest_cache.popitem(last=False)
+    return manifest
+
+def clear_topic_manifest_cache():
+    with _manifest_cache_lock:
+        _manifest_cache.clear()
@@ -1,28 +1,98 @@
 from collections.abc import Generator
+import math
+
+from mimic_viewer.data_sources.chunk_prefetcher import ChunkPrefetcher, read_slice
+from mimic_viewer.data_sources.timestamp_index import EpisodeWindow
+from mimic_viewer.data_sources.topic_manifest import TopicManifest, get_topic_manifest
+from mimic_viewer.metrics import BYTES_READ, CHUNK_FETCH_SECONDS, ROWS_READ
+from mimic_viewer.tracing import span
 
 class ZarrBatchLoader:
-    def __init__(self, zarr_root):
-        self.__root = zarr_root
+    def __init__(self, zarr_root, executor=None, readahead=2, topics=None, window: EpisodeWindow | None = None, manifest: TopicManifest | None = None):
+        """
+        If an executor (e.g. a ThreadPoolExecutor) is given, the batches of all groups are read
+        concurrently on it, keeping up to readahead batches per group in flight.
+        If topics is given, only the data groups with those names are loaded.
+        If window is given, only the rows of every group inside that window are loaded.
+        The data groups are found in the manifest of the zarr (see get_topic_manifest), which is
+        read once per episode. manifest can be given when it was read elsewhere, e.g. in another process.
+        """
+        self.__manifest = manifest if manifest is not None else get_topic_manifest(zarr_root)
+        self.__executor = executor
+        self.__readahead = readahead
         self.__data_group_names = []
         self.__group_lengths = {}
+        # (start, end) rows of every group to load
+        self.__group_row_ranges = {}
+        # array handles are kept around so that batching does not go back to the store for metadata
+        self.__data_arrays = {}
+        self.__timestamp_arrays = {}
+
+        for name in self.__manifest.untimed_names:
+            if topics is None or name in topics:
+                print(f"Warning: Data group '{name}' found, but no corresponding timestamp group '{name}_timestamps'. Skipping.")
 
-        for name in self.__root.array_keys():
-            if not name.endswith('_timestamps'):
-                timestamp_name = f"{name}_timestamps"
-                if timestamp_name in self.__root.array_keys():
-                    data_array = self.__root[name]
-                    timestamp_array = self.__root[timestamp_name]
-                    if len(data_array) == len(timestamp_array):
-                        self.__data_group_names.append(name)
-                        self.__group_lengths[name] = len(data_array)
-                else:
-                    print(f"Warning: Data group '{name}' found, but no corresponding timestamp group '{timestamp_name}'. Skipping.")
+        # the arrays are opened from the metadata of the manifest, without going back to the store
+        arrays_root = self.__manifest.open(zarr_root.chunk_store, zarr_root.path)
+        for name, topic in self.__manifest.topics.items():
+            if topics is not None and name not in topics:
+                continue
+            data_array = arrays_root[name]
+            timestamp_array = arrays_root[f"{name}_timestamps"]
+            self.__data_group_names.append(name)
+            self.__group_lengths[name] = topic.length
+            self.__data_arrays[name] = data_array
+            self.__timestamp_arrays[name] = timestamp_array
+            if window is None:
+                self.__group_row_ranges[name] = (0, topic.length)
             else:
-                pass
+                self.__group_row_ranges[name] = window.get_row_range(timestamp_array, topic.length)
+
+    @property
+    def data_group_names(self) -> list[str]:
+        return list(self.__data_group_names)
+
+    @property
+    def manifest(self) -> TopicManifest:
+        return self.__manifest
+
+    def get_row_range(self, group_name):
+        """
+        (start, end) rows of group_name that will be loaded, end exclusive.
+        """
+        return self.__group_row_ranges[group_name]
+
+    def get_group_nbytes(self, group_name):
+        """
+        Uncompressed size of the rows of a data group (and their timestamps) that will be loaded, in bytes.
+        """
+        start_row, end_row = self.__group_row_ranges[group_name]
+        return (end_row - start_row) * self.__get_row_nbytes(group_name)
+
+    def __get_row_nbytes(self, group_name):
+        return self.__manifest.topics[group_name].row_nbytes
+
+    def get_chunk_aligned_batch_size(self, group_name, max_batch_bytes):
+        """
+        Returns the number of rows of group_name that fit in max_batch_bytes, rounded down to a
+        whole number of the group's chunks. At least one chunk is always returned, so a single
+        chunk larger than the budget is still read in one go.
 
-        self.__data_group_names.sort()
+        When the timestamp array is chunked differently, batches are made of whole chunks of both
+        arrays (the least common multiple of the two chunk sizes) as long as that fits in
+        max_batch_bytes. Otherwise only the data chunks are whole and a timestamp chunk may be
+        read by two batches, timestamps being much smaller than the values they go with.
+        """
+        topic = self.__manifest.topics[group_name]
+        row_nbytes = self.__get_row_nbytes(group_name)
+        chunk_rows = topic.chunk_rows
+        common_chunk_rows = math.lcm(chunk_rows, topic.timestamp_chunk_rows)
+        if common_chunk_rows * row_nbytes <= max_batch_bytes:
+            chunk_rows = common_chunk_rows
+        num_chunks = max(1, max_batch_bytes // (row_nbytes * chunk_rows))
+        return num_chunks * chunk_rows
 
-    def get_data(self, batch_size) -> Generator[list[dict], None, None]:
+    def get_data(self, batch_size=1000, max_batch_bytes=None) -> Generator[list[dict], None, None]:
         """
         This method goes through every available data group of the zarr.
         There are two types of group, "data groups" and "timestamp groups", for every data group,
@@ -33,26 +103,62 @@ class ZarrBatchLoader:
         timestamps for each data group).
         the next yield gives the next batch next time and so on until the whole zarr is traversed, at which point it breaks.
         It handles data groups of different length by not returning a dictionary if its value array would be empty.
+        If max_batch_bytes is given, batch_size is ignored and every group gets its own batch size instead:
+        as many whole chunks of the group as fit in max_batch_bytes (see get_chunk_aligned_batch_size),
+        so that slices never straddle chunk boundaries and camera groups do not hold as many rows as joint groups.
         """
         if not self.__data_group_names:
             return
 
-        current_group_indices = {name: 0 for name in self.__data_group_names}
+        if max_batch_bytes is None:
+            group_batch_sizes = {name: batch_size for name in self.__data_group_names}
+        else:
+            group_batch_sizes = {
+                name: self.get_chunk_aligned_batch_size(name, max_batch_bytes)
+                for name in self.__data_group_names
+            }
 
-        while True:
-            batch_data = []
-            for group_name in self.__data_group_names:
-                start_idx = current_group_indices[group_name]
-                group_length = self.__group_lengths[group_name]
+        group_slices = {}
+        for name in self.__data_group_names:
+            start_row, end_row = self.__group_row_ranges[name]
+            group_batch_size = group_batch_sizes[name]
+            if max_batch_bytes is None:
+                boundaries = range(start_row + group_batch_size, end_row, group_batch_size)
+            else:
+                # a window may start in the middle of a chunk, the first slice ends at the next batch boundary
+                first_boundary = (start_row // group_batch_size + 1) * group_batch_size
+                boundaries = range(first_boundary, end_row, group_batch_size)
+            slice_starts = [start_row, *boundaries]
+            group_slices[name] = [
+                (start_idx, end_idx)
+                for start_idx, end_idx in zip(slice_starts, [*boundaries, end_row])
+                if start_idx < end_idx
+            ]
 
-                if start_idx < group_length:
-                    end_idx = start_idx + batch_size
-                    actual_end_idx = min(end_idx, group_length)
+        prefetcher = None
+        if self.__executor is not None:
+            prefetcher = ChunkPrefetcher(self.__executor, self.__readahead)
+            prefetcher.schedule({
+                name: (self.__data_arrays[name], self.__timestamp_arrays[name], slices)
+                for name, slices in group_slices.items()
+            })
 
-                    data_array = self.__root[group_name]
-                    timestamp_array = self.__root[f"{group_name}_timestamps"]
-                    values = data_array[start_idx:actual_end_idx]
-                    timestamps = timestamp_array[start_idx:actual_end_idx]
+        try:
+            num_batches = max((len(slices) for slices in group_slices.values()), default=0)
+            for batch_idx in range(num_batches):
+                batch_data = []
+                for group_name in self.__data_group_names:
+                    slices = group_slices[group_name]
+                    if batch_idx >= len(slices):
+                        continue
+
+                    if prefetcher is not None:
+                        values, timestamps = prefetcher.get(group_name)
+                    else:
+                        start_idx, end_idx = slices[batch_idx]
+                        values, timestamps = read_slice(
+                            group_name, self.__data_arrays[group_name], self.__timestamp_arrays[group_name], start_idx, end_idx, loader="batch"
+                        )
 
                     batch_data.append({
                         "topic_name": group_name,
@@ -60,9 +166,51 @@ class ZarrBatchLoader:
                         "timestamps": timestamps
                     })
 
-                    current_group_indices[group_name] = actual_end_idx
+                yield batch_data
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+
+    def get_decimated_data(self, step, batch_size=1000) -> Generator[list[dict], None, None]:
+        """
+        Same as get_data, but only yields every step-th row of every group, starting at the first
+        row of the group (see get_row_range). batch_size counts the rows that are yielded, not the
+        rows they are taken from. Only the chunks holding one of those rows are read, which makes
+        this a cheap preview of an episode when the chunks are small (e.g. camera groups).
+        """
+        if step <= 0:
+            raise ValueError("step must be a positive integer.")
+        if not self.__data_group_names:
+            return
+
+        group_slices = {}
+        for name in self.__data_group_names:
+            start_row, end_row = self.__group_row_ranges[name]
+            rows_per_batch = batch_size * step
+            group_slices[name] = [
+                (start_idx, min(start_idx + rows_per_batch, end_row))
+                for start_idx in range(start_row, end_row, rows_per_batch)
+            ]
+
+        num_batches = max((len(slices) for slices in group_slices.values()), default=0)
+        for batch_idx in range(num_batches):
+            batch_data = []
+            for group_name in self.__data_group_names:
+                slices = group_slices[group_name]
+                if batch_idx >= len(slices):
+                    continue
+
+                start_idx, end_idx = slices[batch_idx]
+                selection = slice(start_idx, end_idx, step)
+                with CHUNK_FETCH_SECONDS.time(loader="decimated"), span("read_rows", topic=group_name, start=start_idx, end=end_idx, step=step, loader="decimated"):
+                    values = self.__data_arrays[group_name].get_orthogonal_selection(selection)
+                    timestamps = self.__timestamp_arrays[group_name].get_orthogonal_selection(selection)
+                ROWS_READ.inc(len(timestamps), topic=group_name)
+                BYTES_READ.inc(values.nbytes + timestamps.nbytes, topic=group_name)
+                batch_data.append({
+                    "topic_name": group_name,
+                    "values": values,
+                    "timestamps": timestamps,
+                })
 
-            if not batch_data:
-                break
-            
-            yield batch_data
\ No newline at end of file
+            yield batch_data
@@ -1,27 +1,43 @@
 from collections.abc import Generator
 import numpy as np
 
+from mimic_viewer.data_sources.chunk_prefetcher import ChunkPrefetcher, read_slice
+from mimic_viewer.data_sources.timestamp_index import EpisodeWindow
+from mimic_viewer.data_sources.topic_manifest import TopicManifest, get_topic_manifest
+
 class ZarrPointLoader:
-    def __init__(self, zarr_root):
-        self.__root = zarr_root
+    def __init__(self, zarr_root, executor=None, readahead=2, window: EpisodeWindow | None = None, manifest: TopicManifest | None = None):
+        """
+        If an executor (e.g. a ThreadPoolExecutor) is given, the chunks of all groups are read
+        concurrently on it, keeping up to readahead chunks per group in flight.
+        If window is given, only the rows of every group inside that window are loaded.
+        The data groups are found in the manifest of the zarr, like in ZarrBatchLoader.
+        """
+        self.__manifest = manifest if manifest is not None else get_topic_manifest(zarr_root)
+        self.__executor = executor
+        self.__readahead = readahead
         self.__data_group_names = []
         self.__group_lengths = {}
+        # (start, end) rows of every group to load
+        self.__group_row_ranges = {}
 
-        for name in self.__root.array_keys():
-            if not name.endswith('_timestamps'):
-                timestamp_name = f"{name}_timestamps"
-                if timestamp_name in self.__root.array_keys():
-                    data_array = self.__root[name]
-                    timestamp_array = self.__root[timestamp_name]
-                    if len(data_array) == len(timestamp_array):
-                        self.__data_group_names.append(name)
-                        self.__group_lengths[name] = len(data_array)
-                else:
-                    print(f"Warning: Data group '{name}' found, but no corresponding timestamp group '{timestamp_name}'. Skipping.")
-            else:
-                pass
+        # array handles, opened from the metadata of the manifest
+        self.__data_arrays = {}
+        self.__timestamp_arrays = {}
+
+        for name in self.__manifest.untimed_names:
+            print(f"Warning: Data group '{name}' found, but no corresponding timestamp group '{name}_timestamps'. Skipping.")
 
-        self.__data_group_names.sort()
+        arrays_root = self.__manifest.open(zarr_root.chunk_store, zarr_root.path)
+        for name, topic in self.__manifest.topics.items():
+            self.__data_group_names.append(name)
+            self.__group_lengths[name] = topic.length
+            self.__data_arrays[name] = arrays_root[name]
+            self.__timestamp_arrays[name] = arrays_root[f"{name}_timestamps"]
+            if window is None:
+                self.__group_row_ranges[name] = (0, topic.length)
+            else:
+                self.__group_row_ranges[name] = window.get_row_range(self.__timestamp_arrays[name], topic.length)
 
     def get_data(self) -> Generator[tuple[str, float, np.ndarray], None, None]:
         """
@@ -31,20 +47,48 @@ class ZarrPointLoader:
         When called, this method yields a tuple of (data group name, timestamp, value). when it first needs data
         from a new chunk, it loads the entire chunk at once and keeps it in memory in order to prevent slow 
         calls to the zarr filesystem. it goes through the first index of every data group, then the second index,
-        and so on until all groups are done at which point it returns
+        and so on until all groups are done at which point it returns.
+        With a window, the first index is the first row of every group inside the window.
         """
         if not self.__data_group_names:
             return
 
-        chunk_sizes = {name: self.__root[name].chunks[0] for name in self.__data_group_names}
+        chunk_sizes = {name: self.__manifest.topics[name].chunk_rows for name in self.__data_group_names}
+
+        # The (start, end) rows of every chunk to read, clipped to the window of the group.
+        chunk_slices = {}
+        for name in self.__data_group_names:
+            start_row, end_row = self.__group_row_ranges[name]
+            chunk_size = chunk_sizes[name]
+            chunk_slices[name] = [
+                (max(chunk_start, start_row), min(chunk_start + chunk_size, end_row))
+                for chunk_start in range((start_row // chunk_size) * chunk_size, end_row, chunk_size)
+            ]
+
+        # the groups are traversed chunk after chunk, so the prefetcher can read them in that order
+        prefetcher = None
+        if self.__executor is not None:
+            prefetcher = ChunkPrefetcher(self.__executor, self.__readahead)
+            prefetcher.schedule({
+                name: (self.__data_arrays[name], self.__timestamp_arrays[name], chunk_slices[name])
+                for name in self.__data_group_names
+            })
 
+        try:
+            yield from self.__iterate(chunk_sizes, prefetcher)
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+
+    def __iterate(self, chunk_sizes, prefetcher):
         # Caches to hold the currently loaded chunk for each group.
-        # The key is the group name, and the value is a tuple of (chunk_index, chunk_data).
+        # The key is the group name, and the value is a tuple of (chunk_index, first_row, chunk_data).
         data_chunk_cache = {}
         timestamp_chunk_cache = {}
 
-        # Find the length of the longest group to define the global iteration range.
-        max_len = max(self.__group_lengths.values()) if self.__group_lengths else 0
+        # Find the length of the longest window to define the global iteration range.
+        window_lengths = {name: end_row - start_row for name, (start_row, end_row) in self.__group_row_ranges.items()}
+        max_len = max(window_lengths.values())
 
         # --- 2. Iteration ---
         # Iterate from the first to the last index across all groups.
@@ -53,30 +97,39 @@ class ZarrPointLoader:
             for name in self.__data_group_names:
 
                 # Process only if the index `i` is valid for the current group.
-                if i < self.__group_lengths[name]:
+                if i < window_lengths[name]:
                     chunk_size = chunk_sizes[name]
+                    start_row, end_row = self.__group_row_ranges[name]
+                    row = start_row + i
                     
                     # --- 3. Chunk Management ---
-                    # Calculate which chunk is needed for the current index `i`.
-                    required_chunk_idx = i // chunk_size
-                    current_chunk_idx = data_chunk_cache.get(name, (-1, None))[0]
+                    # Calculate which chunk is needed for the current row.
+                    required_chunk_idx = row // chunk_size
+                    current_chunk_idx = data_chunk_cache.get(name, (-1, 0, None))[0]
 
                     # If the required chunk is not the one in memory, load it.
                     if required_chunk_idx != current_chunk_idx:
-                        # Define the slice for reading the new chunk from Zarr.
-                        chunk_start = required_chunk_idx * chunk_size
-                        chunk_end = min(chunk_start + chunk_size, self.__group_lengths[name])
-                        
+                        # Define the slice for reading the new chunk from Zarr, clipped to the window.
+                        chunk_start = max(required_chunk_idx * chunk_size, start_row)
+                        chunk_end = min((required_chunk_idx + 1) * chunk_size, end_row)
+                        if prefetcher is not None:
+                            # The prefetcher hands out the chunks of a group in order.
+                            data_chunk, timestamp_chunk = prefetcher.get(name)
+                        else:
+                            data_chunk, timestamp_chunk = read_slice(
+                                name, self.__data_arrays[name], self.__timestamp_arrays[name], chunk_start, chunk_end, loader="point"
+                            )
+
                         # Load the new data and timestamp chunks into the caches.
-                        data_chunk_cache[name] = (required_chunk_idx, self.__root[name][chunk_start:chunk_end])
-                        timestamp_chunk_cache[name] = (required_chunk_idx, self.__root[f"{name}_timestamps"][chunk_start:chunk_end])
+                        data_chunk_cache[name] = (required_chunk_idx, chunk_start, data_chunk)
+                        timestamp_chunk_cache[name] = (required_chunk_idx, chunk_start, timestamp_chunk)
 
                     # --- 4. Yield Data ---
                     # Calculate the index of the data point within the cached chunk.
-                    index_in_chunk = i % chunk_size
+                    index_in_chunk = row - data_chunk_cache[name][1]
                     
                     # Retrieve the value and timestamp from the in-memory chunks.
-                    value = data_chunk_cache[name][1][index_in_chunk]
-                    timestamp = timestamp_chunk_cache[name][1][index_in_chunk]
+                    value = data_chunk_cache[name][2][index_in_chunk]
+                    timestamp = timestamp_chunk_cache[name][2][index_in_chunk]
 
-                    yield name, timestamp, value
\ No newline at end of file
+                    yield name, timestamp, value
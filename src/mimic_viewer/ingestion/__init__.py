@@ -0,0 +1,3 @@
+"""
+Ingestion subpackage, drives data sources into embodiment loggers.
+"""
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+
+from mimic_viewer.data_sources.zarr_batch_loader import ZarrBatchLoader
+
+def downscale_images(images, factor):
+    """
+    Keeps every factor-th pixel of a (T, H, W, ...) batch of images.
+    """
+    if factor <= 1:
+        return images
+    return np.ascontiguousarray(images[:, ::factor, ::factor])
+
+def ingest_episode_progressive(root, logger, batch_size=1000, max_batch_bytes=None, executor=None, readahead=2, window=None, decimation=10, downscale=2, job=None):
+    """
+    Logs an episode in two passes so that the whole timeline can be scrubbed early:
+    1. every topic that is not a camera of logger.image_logging_infos, in full, and every
+       decimation-th frame of every camera, downscaled by downscale
+    2. the camera frames at full resolution. Frames of the first pass are logged again at the
+       same timestamp when they were downscaled, which replaces them in the viewer, and are
+       skipped otherwise.
+    If job (an IngestJob) is given, its progress is updated and the ingest stops between batches
+    once it is cancelled. Returns the number of rows of the episode that were logged.
+    """
+    camera_topics = {image_logging_info.topic_name for image_logging_info in logger.image_logging_infos}
+    topic_loader = ZarrBatchLoader(root, window=window)
+    camera_topics = [name for name in topic_loader.data_group_names if name in camera_topics]
+    other_topics = [name for name in topic_loader.data_group_names if name not in camera_topics]
+
+    start_time = time.perf_counter()
+    num_rows = 0
+    if other_topics:
+        loader = ZarrBatchLoader(root, executor, readahead, topics=other_topics, window=window)
+        for data_batches in loader.get_data(batch_size, max_batch_bytes=max_batch_bytes):
+            if job is not None:
+                job.raise_if_cancelled()
+            logger.log_data_batches(data_batches)
+            num_rows += sum(len(topic_batch["timestamps"]) for topic_batch in data_batches)
+            if job is not None:
+                job.rows_logged = num_rows
+
+    if not camera_topics:
+        return num_rows
+
+    camera_loader = ZarrBatchLoader(root, executor, readahead, topics=camera_topics, window=window)
+    for data_batches in camera_loader.get_decimated_data(decimation, batch_size):
+        if job is not None:
+            job.raise_if_cancelled()
+        for topic_batch in data_batches:
+            topic_batch["values"] = downscale_images(topic_batch["values"], downscale)
+        logger.log_data_batches(data_batches)
+    logger.log_text(f"Preview logged in {time.perf_counter() - start_time:.1f}s, loading the remaining camera frames...")
+
+    # rows of each camera that were already logged at full resolution in the first pass are skipped
+    next_rows = {name: camera_loader.get_row_range(name)[0] for name in camera_topics}
+    for data_batches in camera_loader.get_data(batch_size, max_batch_bytes=max_batch_bytes):
+        if job is not None:
+            job.raise_if_cancelled()
+        for topic_batch in data_batches:
+            name = topic_batch["topic_name"]
+            batch_length = len(topic_batch["timestamps"])
+            first_row = next_rows[name]
+            next_rows[name] += batch_length
+            num_rows += batch_length
+            if downscale <= 1:
+                start_row = camera_loader.get_row_range(name)[0]
+                keep = (np.arange(first_row, first_row + batch_length) - start_row) % decimation != 0
+                topic_batch["values"] = topic_batch["values"][keep]
+                topic_batch["timestamps"] = topic_batch["timestamps"][keep]
+        logger.log_data_batches([topic_batch for topic_batch in data_batches if len(topic_batch["timestamps"])])
+        if job is not None:
+            job.rows_logged = num_rows
+
+    return num_rows
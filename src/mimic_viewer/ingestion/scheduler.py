@@ -0,0 +1,204 @@
+from collections import deque
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+# lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+class IngestCancelled(Exception):
+    """
+    Raised by IngestJob.raise_if_cancelled() to stop a job that was cancelled while running.
+    """
+
+class IngestJob:
+    """
+    One call of fn(job, *args, **kwargs) run by an IngestionScheduler. Jobs are cancelled
+    cooperatively: cancel() marks the job, a queued job is then never started and a running one
+    stops the next time it calls raise_if_cancelled(). A queued job that is dropped this way runs
+    cleanup(job, *args, **kwargs) instead of fn, to release what was handed to fn.
+    The arguments are let go once the job is finished.
+    """
+    def __init__(self, job_id, fn, args, kwargs, priority, description, metadata, cleanup=None):
+        self.job_id = job_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cleanup = cleanup
+        self.priority = priority
+        self.description = description
+        self.metadata = metadata
+        self.status = "queued"
+        self.error = None
+        self.rows_logged = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.__cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.__cancel_event.is_set()
+
+    def cancel(self):
+        self.__cancel_event.set()
+
+    def raise_if_cancelled(self):
+        if self.__cancel_event.is_set():
+            raise IngestCancelled(f"Job {self.job_id} was cancelled.")
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "description": self.description,
+            "priority": self.priority,
+            "status": self.status,
+            "error": self.error,
+            "rows_logged": self.rows_logged,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            **self.metadata,
+        }
+
+class IngestionScheduler:
+    """
+    Runs ingest jobs on num_workers dedicated threads, highest priority (lowest number) first and
+    in submission order within a priority. The last history_size finished jobs are kept so their
+    status can still be queried.
+    """
+    def __init__(self, num_workers=2, history_size=100):
+        if num_workers <= 0:
+            raise ValueError("num_workers must be a positive integer.")
+        self.__queue = []
+        self.__sequence = itertools.count()
+        self.__job_ids = itertools.count(1)
+        self.__jobs = {}
+        self.__finished_job_ids = deque()
+        self.__history_size = history_size
+        self.__condition = threading.Condition()
+        self.__shutting_down = False
+        self.__workers = [
+            threading.Thread(target=self.__run_worker, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self.__workers:
+            worker.start()
+
+    def submit(self, fn, *args, priority=PRIORITY_INTERACTIVE, description="", metadata=None, cleanup=None, **kwargs) -> IngestJob:
+        """
+        Queues fn(job, *args, **kwargs). metadata is added to the status of the job. cleanup is
+        called with the same arguments if the job is cancelled before it started (see IngestJob).
+        """
+        with self.__condition:
+            if self.__shutting_down:
+                raise RuntimeError("The ingestion scheduler is shut down.")
+            job = IngestJob(next(self.__job_ids), fn, args, kwargs, priority, description, metadata or {}, cleanup)
+            self.__jobs[job.job_id] = job
+            heapq.heappush(self.__queue, (priority, next(self.__sequence), job))
+            self.__condition.notify()
+        return job
+
+    def set_priority(self, job, priority) -> bool:
+        """
+        Moves a queued job to a higher priority (lower number), e.g. when somebody starts waiting
+        for a job that was submitted in the background. Returns whether the priority was changed.
+        """
+        with self.__condition:
+            if job.status != "queued" or job.cancelled or priority >= job.priority:
+                return False
+            job.priority = priority
+            # the entry with the old priority stays in the heap and is skipped when popped
+            heapq.heappush(self.__queue, (priority, next(self.__sequence), job))
+            self.__condition.notify()
+        return True
+
+    def get_job(self, job_id) -> IngestJob | None:
+        with self.__condition:
+            return self.__jobs.get(job_id)
+
+    def list_jobs(self) -> list[IngestJob]:
+        with self.__condition:
+            return list(self.__jobs.values())
+
+    def cancel(self, job_id) -> bool:
+        job = self.get_job(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def get_stats(self):
+        with self.__condition:
+            statuses = [job.status for job in self.__jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed", "cancelled")}
+
+    def shutdown(self, cancel_jobs=True):
+        with self.__condition:
+            self.__shutting_down = True
+            if cancel_jobs:
+                for job in self.__jobs.values():
+                    job.cancel()
+            self.__condition.notify_all()
+        for worker in self.__workers:
+            worker.join()
+
+    def __next_job(self):
+        with self.__condition:
+            while True:
+                while self.__queue:
+                    priority, _, job = heapq.heappop(self.__queue)
+                    if priority != job.priority or job.status != "queued":
+                        continue
+                    if not job.cancelled:
+                        job.status = "running"
+                        job.started_at = time.time()
+                    # a cancelled job is handed out too, the worker runs its cleanup outside of the lock
+                    return job
+                if self.__shutting_down:
+                    return None
+                self.__condition.wait()
+
+    def __run_worker(self):
+        while (job := self.__next_job()) is not None:
+            if job.status == "queued":
+                self.__drop(job)
+                continue
+            try:
+                job.fn(job, *job.args, **job.kwargs)
+                status = "cancelled" if job.cancelled else "done"
+            except IngestCancelled:
+                status = "cancelled"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                traceback.print_exc()
+                status = "failed"
+            with self.__condition:
+                self.__finish(job, status)
+
+    def __drop(self, job):
+        """
+        Finishes a job that was cancelled before it started.
+        """
+        if job.cleanup is not None:
+            try:
+                job.cleanup(job, *job.args, **job.kwargs)
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                traceback.print_exc()
+        with self.__condition:
+            self.__finish(job, "cancelled")
+
+    def __finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        # the arguments (loggers, recordings, cache writers) are not needed to report the status
+        job.fn = job.cleanup = None
+        job.args = ()
+        job.kwargs = {}
+        self.__finished_job_ids.append(job.job_id)
+        while len(self.__finished_job_ids) > self.__history_size:
+            self.__jobs.pop(self.__finished_job_ids.popleft(), None)
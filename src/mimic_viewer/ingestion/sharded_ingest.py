@@ -0,0 +1,114 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
+import os
+
+import rerun as rr
+
+from mimic_viewer.data_sources.chunk_cache import open_zarr
+from mimic_viewer.data_sources.zarr_batch_loader import ZarrBatchLoader
+from mimic_viewer.ingestion.scheduler import IngestCancelled
+
+def assign_topics_to_workers(topic_sizes, num_workers):
+    """
+    Splits topics into num_workers shards of roughly equal size. topic_sizes maps a topic name
+    to its size in bytes. Topics are placed largest first on the currently smallest shard, ties
+    being broken by name and shard index, so the same episode is always split the same way.
+    Returns one sorted list of topic names per worker, some of which may be empty.
+    """
+    if num_workers <= 0:
+        raise ValueError("num_workers must be a positive integer.")
+    shards = [[] for _ in range(num_workers)]
+    shard_sizes = [0] * num_workers
+    for topic_name in sorted(topic_sizes, key=lambda name: (-topic_sizes[name], name)):
+        worker_index = min(range(num_workers), key=lambda index: (shard_sizes[index], index))
+        shards[worker_index].append(topic_name)
+        shard_sizes[worker_index] += topic_sizes[topic_name]
+    return [sorted(shard) for shard in shards]
+
+def create_ingest_process_pool(num_workers):
+    # spawn rather than fork, the parent process runs rerun and grpc threads
+    return ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def ingest_topics(episode_url, topics, logger_class, urdf_path, application_id, recording_id, grpc_url, batch_size=1000, max_batch_bytes=None, chunk_cache=None, rrd_path=None, window=None, image_encodings=None, manifest=None):
+    """
+    Logs the given topics of an episode into the recording served at grpc_url. Runs in a worker
+    process, with its own RecordingStream using the recording id of the served recording, so the
+    viewer merges the data of all workers into a single recording. If rrd_path is given, the data
+    is also saved to that file. If window (an EpisodeWindow) is given, only the rows inside it are
+    logged. image_encodings is passed to the logger's set_image_encodings(), frames are encoded
+    on the worker's own thread. manifest is the TopicManifest of the episode, read by the parent
+    process so that the workers do not read the metadata again. Returns the number of rows logged.
+    """
+    recording = rr.RecordingStream(application_id, recording_id=recording_id, send_properties=False)
+    if rrd_path is not None:
+        recording.set_sinks(rr.GrpcSink(grpc_url), rr.FileSink(rrd_path))
+    else:
+        recording.connect_grpc(grpc_url)
+    try:
+        logger = logger_class(urdf_path, recording)
+        if image_encodings:
+            logger.set_image_encodings(image_encodings)
+        loader = ZarrBatchLoader(open_zarr(episode_url, chunk_cache, manifest), topics=topics, window=window, manifest=manifest)
+        num_rows = 0
+        for data_batches in loader.get_data(batch_size, max_batch_bytes=max_batch_bytes):
+            logger.log_data_batches(data_batches)
+            num_rows += sum(len(topic_batch["timestamps"]) for topic_batch in data_batches)
+        # open video segments
+        logger.flush()
+        recording.flush(blocking=True)
+        return num_rows
+    finally:
+        recording.disconnect()
+
+def ingest_episode_sharded(executor, episode_url, logger, grpc_url, num_shards, batch_size=1000, max_batch_bytes=None, chunk_cache=None, rrd_directory=None, window=None, job=None):
+    """
+    Splits the topics of an episode into num_shards shards (see assign_topics_to_workers) and logs
+    every shard in its own process of executor. Each worker builds a logger of the same class as
+    logger and connects to grpc_url, the address returned by logger.recording.serve_grpc().
+    The static data (urdfs, blueprint) is expected to be logged by logger beforehand, e.g. by reset().
+    Workers read through chunk_cache (a DiskChunkCache) when it is given, and save what they log
+    to rrd_directory/shard_<index>.rrd when rrd_directory is given. Shards are balanced on the
+    size of the rows inside window when it is given.
+    The size of every shard is added to logger.logged_bytes once the shard is logged.
+    If job (an IngestJob) is cancelled, the shards that have not started yet are dropped and
+    IngestCancelled is raised, running shards finish in their process.
+    Returns the total number of rows logged.
+    """
+    topic_loader = ZarrBatchLoader(open_zarr(episode_url, chunk_cache), window=window)
+    topic_sizes = {name: topic_loader.get_group_nbytes(name) for name in topic_loader.data_group_names}
+    shards = [shard for shard in assign_topics_to_workers(topic_sizes, num_shards) if shard]
+
+    futures = {
+        executor.submit(
+            ingest_topics,
+            episode_url,
+            shard,
+            type(logger),
+            logger.urdf_path,
+            logger.recording.get_application_id(),
+            logger.recording.get_recording_id(),
+            grpc_url,
+            batch_size,
+            max_batch_bytes,
+            chunk_cache,
+            os.path.join(rrd_directory, f"shard_{shard_index}.rrd") if rrd_directory is not None else None,
+            window,
+            logger.get_image_encodings(),
+            topic_loader.manifest,
+        ): sum(topic_sizes[topic_name] for topic_name in shard)
+        for shard_index, shard in enumerate(shards)
+    }
+    num_rows = 0
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+        for future in done:
+            num_rows += future.result()
+            logger.logged_bytes += futures[future]
+        if job is not None:
+            job.rows_logged = num_rows
+            if job.cancelled:
+                for future in pending:
+                    future.cancel()
+                raise IngestCancelled(f"Job {job.job_id} was cancelled.")
+    return num_rows
@@ -1,3 +1,11 @@
 """
 Loggers subpackage for embodiment logging.
-"""
\ No newline at end of file
+"""
+from mimic_viewer.loggers.registry import EMBODIMENT_LOGGERS, get_logger_class
+
+def __getattr__(name):
+    # the embodiment loggers are imported on first access, e.g. by from mimic_viewer.loggers import Bimanual049Logger
+    for logger_name, (_, class_name) in EMBODIMENT_LOGGERS.items():
+        if class_name == name:
+            return get_logger_class(logger_name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
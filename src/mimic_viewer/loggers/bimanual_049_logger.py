@@ -1,11 +1,10 @@
-import itertools
 import numpy as np
 from mimic_viewer.loggers.embodiment_logger import EmbodimentLogger
 import rerun as rr
-from rerun_loader_urdf import URDFLogger
-from scipy.spatial.transform import Rotation as R
 
+from mimic_viewer.loggers.urdf_cache import get_urdf_logger
 from mimic_viewer.loggers.utils import EffortsLoggingInfo, HandJointsLoggingInfo, ImageLoggingInfo, WristPoseLoggingInfo, log_base_transform, log_image, log_joint_transform
+from mimic_viewer.loggers.video_encoding import VIDEO_SEGMENTS_ENTITY_PATH
 
 class Bimanual049Logger(EmbodimentLogger):
     def __init__(self, urdf_path, recording = None):
@@ -33,19 +32,16 @@ class Bimanual049Logger(EmbodimentLogger):
         right_hand_urdf_path = self.urdf_path + "/p49/converted.urdf"
         left_hand_urdf_path = self.urdf_path + "/p49l/converted.urdf"
         
-        left_hand_logger = URDFLogger(
+        left_hand_logger = get_urdf_logger(
             left_hand_urdf_path, 
-            entity_path_prefix="/world/left/base/hand"
+            entity_path_prefix="/world/left/base/hand",
+            material_rgba=[0,0.6,0,0.6], # green
         )
-        right_hand_logger = URDFLogger(
+        right_hand_logger = get_urdf_logger(
             right_hand_urdf_path, 
-            entity_path_prefix="/world/right/base/hand"
+            entity_path_prefix="/world/right/base/hand",
+            material_rgba=[0,0.6,0,0.6], # green
         )
-        for material in itertools.chain(
-            left_hand_logger.urdf.materials,
-            right_hand_logger.urdf.materials,
-        ):
-            material.color.rgba = [0,0.6,0,0.6] # green
         
         self.hand_joint_logging_infos.extend(
             [
@@ -67,11 +63,11 @@ class Bimanual049Logger(EmbodimentLogger):
             ]
         )
 
-        left_hand_proprio_logger = URDFLogger(
+        left_hand_proprio_logger = get_urdf_logger(
             left_hand_urdf_path, 
             entity_path_prefix="/world/left/base/hand_proprio"
         )
-        right_hand_proprio_logger = URDFLogger(
+        right_hand_proprio_logger = get_urdf_logger(
             right_hand_urdf_path, 
             entity_path_prefix="/world/right/base/hand_proprio"
         )
@@ -218,6 +214,8 @@ class Bimanual049Logger(EmbodimentLogger):
         return filtered
 
     def reset(self):
+        from scipy.spatial.transform import Rotation as R
+
         super().reset()
         identity_rotation = R.from_matrix(np.eye(3))
         log_base_transform("/world", np.zeros((0,3)), identity_rotation, recording=self.recording)
@@ -228,7 +226,7 @@ class Bimanual049Logger(EmbodimentLogger):
         blueprint=rr.blueprint.Vertical(
             rr.blueprint.Tabs(
                 rr.blueprint.Horizontal(
-                    rr.blueprint.Spatial3DView(name="robot view", origin="/", contents=["/**"]),
+                    rr.blueprint.Spatial3DView(name="robot view", origin="/", contents=["/**", f"- /{VIDEO_SEGMENTS_ENTITY_PATH}/**"]),
                     rr.blueprint.Vertical(
                         rr.blueprint.Spatial2DView(name="fixed", origin="cameras/fixed_0"),
                         rr.blueprint.Horizontal(
@@ -250,7 +248,7 @@ class Bimanual049Logger(EmbodimentLogger):
                 ),
                 rr.blueprint.Horizontal(
                     rr.blueprint.Vertical(
-                        rr.blueprint.Spatial3DView(name="robot view", origin="/", contents=["/**"]),
+                        rr.blueprint.Spatial3DView(name="robot view", origin="/", contents=["/**", f"- /{VIDEO_SEGMENTS_ENTITY_PATH}/**"]),
                         rr.blueprint.Grid(
                             name="motor efforts", 
                             grid_columns=4,
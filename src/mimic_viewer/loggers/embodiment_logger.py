@@ -1,16 +1,256 @@
+from collections import Counter
+import dataclasses
+from functools import partial
+import threading
+
+import numpy as np
 import rerun as rr
 
+from mimic_viewer.loggers.image_encoding import ImageEncoding
+from mimic_viewer.loggers.point_coalescer import PointCoalescer
 from mimic_viewer.loggers.utils import EffortsLoggingInfo, HandJointsLoggingInfo, ImageLoggingInfo, WristPoseLoggingInfo, log_efforts, log_efforts_batch, log_hand_joints, log_hand_joints_batch, log_image, log_image_batch, log_wrist_pose, log_wrist_pose_batch
+from mimic_viewer.loggers.video_encoding import VideoEncoding, VideoStreamLogger
+from mimic_viewer.metrics import BYTES_LOGGED, ROWS_LOGGED, UNKNOWN_TOPIC_BATCHES
+from mimic_viewer.tracing import span
+
+class LoggingInfoList(list):
+    """
+    A list that tells its owner whenever it is modified, so the topic dispatch table can be rebuilt.
+    """
+    def __init__(self, iterable=(), on_change=None):
+        super().__init__(iterable)
+        self._on_change = on_change
+
+    def _changed(self):
+        if self._on_change is not None:
+            self._on_change()
+
+    def _notify(method):
+        def wrapper(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self._changed()
+            return result
+        return wrapper
+
+    append = _notify(list.append)
+    extend = _notify(list.extend)
+    insert = _notify(list.insert)
+    remove = _notify(list.remove)
+    pop = _notify(list.pop)
+    clear = _notify(list.clear)
+    sort = _notify(list.sort)
+    reverse = _notify(list.reverse)
+    __setitem__ = _notify(list.__setitem__)
+    __delitem__ = _notify(list.__delitem__)
+    __iadd__ = _notify(list.__iadd__)
+    __imul__ = _notify(list.__imul__)
+
+    del _notify
+
+def _logging_info_list_property(attribute_name):
+    def getter(self):
+        return getattr(self, attribute_name)
+
+    def setter(self, value):
+        setattr(self, attribute_name, LoggingInfoList(value, on_change=self._invalidate_dispatch_table))
+        self._invalidate_dispatch_table()
+
+    return property(getter, setter)
 
 class EmbodimentLogger:
+    image_logging_infos = _logging_info_list_property("_image_logging_infos")
+    hand_joint_logging_infos = _logging_info_list_property("_hand_joint_logging_infos")
+    wrist_pose_logging_infos = _logging_info_list_property("_wrist_pose_logging_infos")
+    efforts_logging_infos = _logging_info_list_property("_efforts_logging_infos")
+
     def __init__(self, urdf_path, recording):
         self.urdf_path = urdf_path
+        # the coalescer's latency thread looks handlers up too, the table is built by one thread at a time
+        self._dispatch_table_lock = threading.RLock()
+        self._point_handlers = None
+        self._batch_handlers = None
+        self._video_topics = None
+        # topic_name -> VideoStreamLogger, kept across rebuilds of the dispatch table so that open segments survive
+        self._video_streams : dict[str, VideoStreamLogger] = {}
+        self._coalescer : PointCoalescer | None = None
+        self._image_encoding_executor = None
         self.recording : rr.RecordingStream = recording
+        self.unknown_topic_counts : Counter[str] = Counter()
+        # bytes of the values and timestamps handed to the logger, an estimate of the size of the recording
+        self.logged_bytes = 0
         self.image_logging_infos : list[ImageLoggingInfo] = []
         self.hand_joint_logging_infos : list[HandJointsLoggingInfo] = []
         self.wrist_pose_logging_infos : list[WristPoseLoggingInfo] = []
         self.efforts_logging_infos : list[EffortsLoggingInfo] = []
 
+    @property
+    def recording(self) -> rr.RecordingStream:
+        return self._recording
+
+    @recording.setter
+    def recording(self, recording):
+        # the handlers are bound to the recording, so they have to follow it
+        self._recording = recording
+        self._invalidate_dispatch_table()
+
+    @property
+    def image_encoding_executor(self):
+        """
+        Executor the frames of a batch are encoded on, for image topics with an encoding
+        (see set_image_encodings). None encodes them on the logging thread.
+        """
+        return self._image_encoding_executor
+
+    @image_encoding_executor.setter
+    def image_encoding_executor(self, executor):
+        self._image_encoding_executor = executor
+        self._invalidate_dispatch_table()
+
+    def get_image_encodings(self) -> dict[str, ImageEncoding | VideoEncoding | None]:
+        return {image_logging_info.topic_name: image_logging_info.encoding for image_logging_info in self.image_logging_infos}
+
+    def set_image_encodings(self, encodings):
+        """
+        encodings maps image topic names to an ImageEncoding or a VideoEncoding, or to None to log raw frames.
+        Topics that are not in encodings keep their current encoding.
+        """
+        for i, image_logging_info in enumerate(self.image_logging_infos):
+            if image_logging_info.topic_name in encodings:
+                self.image_logging_infos[i] = dataclasses.replace(image_logging_info, encoding=encodings[image_logging_info.topic_name])
+
+    def _invalidate_dispatch_table(self):
+        with self._dispatch_table_lock:
+            self._point_handlers = None
+            self._batch_handlers = None
+            self._video_topics = None
+
+    def _get_video_stream(self, image_logging_info):
+        video_stream = self._video_streams.get(image_logging_info.topic_name)
+        if video_stream is not None and (
+            video_stream.entity != image_logging_info.entity_name
+            or video_stream.encoding != image_logging_info.encoding
+            or video_stream.color_model != image_logging_info.color_model
+        ):
+            video_stream.flush()
+            video_stream = None
+        if video_stream is None:
+            video_stream = VideoStreamLogger(
+                image_logging_info.entity_name,
+                image_logging_info.encoding,
+                self.recording,
+                color_model=image_logging_info.color_model,
+            )
+        video_stream.recording = self.recording
+        return video_stream
+
+    def _build_dispatch_table(self):
+        """
+        Builds the topic_name -> handlers indexes used by log_data_point and log_data_batches.
+        Point handlers take a single value, batch handlers take (values, timestamps).
+        """
+        point_handlers : dict[str, list] = {}
+        batch_handlers : dict[str, list] = {}
+        video_streams : dict[str, VideoStreamLogger] = {}
+
+        def register(topic_name, point_handler, batch_handler):
+            point_handlers.setdefault(topic_name, []).append(point_handler)
+            batch_handlers.setdefault(topic_name, []).append(batch_handler)
+
+        for image_logging_info in self.image_logging_infos:
+            if isinstance(image_logging_info.encoding, VideoEncoding):
+                # video frames need their timestamp, log_data_point sends them as one row batches
+                video_stream = self._get_video_stream(image_logging_info)
+                video_streams[image_logging_info.topic_name] = video_stream
+                point_handlers.setdefault(image_logging_info.topic_name, [])
+                batch_handlers.setdefault(image_logging_info.topic_name, []).append(video_stream.log_batch)
+                continue
+            register(
+                image_logging_info.topic_name,
+                partial(log_image, image_logging_info.entity_name, recording=self.recording, color_model=image_logging_info.color_model, encoding=image_logging_info.encoding),
+                partial(
+                    log_image_batch,
+                    image_logging_info.entity_name,
+                    recording=self.recording,
+                    color_model=image_logging_info.color_model,
+                    encoding=image_logging_info.encoding,
+                    executor=self.image_encoding_executor,
+                ),
+            )
+        for hand_joint_logging_info in self.hand_joint_logging_infos:
+            register(
+                hand_joint_logging_info.topic_name,
+                partial(log_hand_joints, hand_joint_logging_info, recording=self.recording),
+                partial(log_hand_joints_batch, hand_joint_logging_info, recording=self.recording),
+            )
+        for wrist_pose_logging_info in self.wrist_pose_logging_infos:
+            register(
+                wrist_pose_logging_info.topic_name,
+                partial(log_wrist_pose, wrist_pose_logging_info, recording=self.recording),
+                partial(log_wrist_pose_batch, wrist_pose_logging_info, recording=self.recording),
+            )
+        for efforts_logging_info in self.efforts_logging_infos:
+            register(
+                efforts_logging_info.topic_name,
+                partial(log_efforts, efforts_logging_info, recording=self.recording),
+                partial(log_efforts_batch, efforts_logging_info, recording=self.recording),
+            )
+
+        for topic_name, video_stream in self._video_streams.items():
+            if video_streams.get(topic_name) is not video_stream:
+                video_stream.flush()
+
+        self._point_handlers = point_handlers
+        self._batch_handlers = batch_handlers
+        self._video_streams = video_streams
+        self._video_topics = set(video_streams)
+
+    def _get_dispatch_table(self):
+        """
+        Returns (point handlers, batch handlers, video topics), building them first if needed.
+        """
+        with self._dispatch_table_lock:
+            if self._point_handlers is None:
+                self._build_dispatch_table()
+            return self._point_handlers, self._batch_handlers, self._video_topics
+
+    def get_point_handlers(self, topic_name):
+        return self._get_dispatch_table()[0].get(topic_name)
+
+    def get_batch_handlers(self, topic_name):
+        return self._get_dispatch_table()[1].get(topic_name)
+
+    def enable_coalescing(self, max_rows=64, max_bytes=8 * 1024 * 1024, max_latency=0.1):
+        """
+        Makes log_data_point buffer points per topic and send them through the columnar
+        log_*_batch functions once a topic holds max_rows points or max_bytes bytes, or its oldest
+        point is older than max_latency seconds. Call flush() or close() to send what is left.
+        """
+        self.disable_coalescing()
+        self._coalescer = PointCoalescer(self._log_topic_batch, max_rows, max_bytes, max_latency)
+
+    def disable_coalescing(self):
+        if self._coalescer is not None:
+            coalescer = self._coalescer
+            self._coalescer = None
+            coalescer.close()
+
+    def flush(self):
+        """
+        Logs everything that is buffered: the points of the coalescer and the open video segments.
+        """
+        if self._coalescer is not None:
+            self._coalescer.flush()
+        for video_stream in self._video_streams.values():
+            video_stream.flush()
+
+    def close(self):
+        self.disable_coalescing()
+        self.flush()
+
+    def _log_topic_batch(self, topic_name, values, timestamps):
+        for handler in self.get_batch_handlers(topic_name) or ():
+            handler(values, timestamps)
+
     def set_blueprint(self):
         pass
 
@@ -18,6 +258,10 @@ class EmbodimentLogger:
         self.recording.set_time("time", duration=time)
 
     def reset(self):
+        # open video segments belong to the data that is cleared
+        with self._dispatch_table_lock:
+            self._video_streams = {}
+            self._invalidate_dispatch_table()
         self.recording.log("", rr.Clear(recursive=True))
         self.set_blueprint()
         self.set_time(0)
@@ -34,26 +278,29 @@ class EmbodimentLogger:
         data_point is a tuple of (topic_name, timestamp_ns, value)
         """
         key, ts, value = data_point
-        self.set_time(ts / 1e9)
+        point_handlers, _, video_topics = self._get_dispatch_table()
+        handlers = point_handlers.get(key)
+        if handlers is None:
+            self.unknown_topic_counts[key] += 1
+            UNKNOWN_TOPIC_BATCHES.inc()
+            return
+        num_bytes = getattr(value, "nbytes", 8) + 8
+        self.logged_bytes += num_bytes
+        ROWS_LOGGED.inc(topic=key)
+        BYTES_LOGGED.inc(num_bytes, topic=key)
 
-        for image_logging_info in self.image_logging_infos:
-            if image_logging_info.topic_name == key:
-                log_image(image_logging_info.entity_name, value, self.recording)
-                return
-        
-        for hand_joint_logging_info in self.hand_joint_logging_infos:
-            if hand_joint_logging_info.topic_name == key:
-                log_hand_joints(hand_joint_logging_info, value, self.recording)
-                return
-            
-        for wrist_pose_logging_info in self.wrist_pose_logging_infos:
-            if wrist_pose_logging_info.topic_name == key:
-                log_wrist_pose(wrist_pose_logging_info, value, self.recording)
-                return
+        if self._coalescer is not None:
+            self._coalescer.add(key, ts, value)
+            return
 
-        for efforts_logging_info in self.efforts_logging_infos:
-                if efforts_logging_info.topic_name == key:
-                    log_efforts(efforts_logging_info, value, self.recording)
+        if key in video_topics:
+            self._log_topic_batch(key, np.asarray(value)[None], np.array([ts]))
+            return
+
+        with span("log_point", topic=key):
+            self.set_time(ts / 1e9)
+            for handler in handlers:
+                handler(value)
     
     def log_data_batches(self, data_batches):
         """
@@ -62,25 +309,17 @@ class EmbodimentLogger:
         """
         for topic_batch in data_batches:
             key = topic_batch["topic_name"]
-            values = topic_batch["values"]
-            timestamps = topic_batch["timestamps"]
-
-            for wrist_pose_logging_info in self.wrist_pose_logging_infos:
-                if wrist_pose_logging_info.topic_name == key:
-                    log_wrist_pose_batch(wrist_pose_logging_info, values, timestamps, self.recording)
-
-            for hand_joint_logging_info in self.hand_joint_logging_infos:
-                if hand_joint_logging_info.topic_name == key:
-                    log_hand_joints_batch(hand_joint_logging_info, values, timestamps, self.recording)
-
-            for image_logging_info in self.image_logging_infos:
-                if image_logging_info.topic_name == key:
-                    log_image_batch(image_logging_info.entity_name, values, timestamps, self.recording)
-            
-            for efforts_logging_info in self.efforts_logging_infos:
-                if efforts_logging_info.topic_name == key:
-                    log_efforts_batch(efforts_logging_info, values, timestamps, self.recording)
-
-            
+            handlers = self.get_batch_handlers(key)
+            if handlers is None:
+                self.unknown_topic_counts[key] += 1
+                UNKNOWN_TOPIC_BATCHES.inc()
+                continue
+            num_bytes = topic_batch["values"].nbytes + topic_batch["timestamps"].nbytes
+            self.logged_bytes += num_bytes
+            ROWS_LOGGED.inc(len(topic_batch["timestamps"]), topic=key)
+            BYTES_LOGGED.inc(num_bytes, topic=key)
 
-            
\ No newline at end of file
+            # the spans of the handlers are tagged with the topic
+            with span("log_batch", topic=key, rows=len(topic_batch["timestamps"])):
+                for handler in handlers:
+                    handler(topic_batch["values"], topic_batch["timestamps"])
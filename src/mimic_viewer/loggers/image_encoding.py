@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+from functools import partial
+import io
+
+import numpy as np
+
+from mimic_viewer.tracing import propagate
+
+_MEDIA_TYPES = {"jpeg": "image/jpeg", "png": "image/png"}
+
+@dataclass(frozen=True)
+class ImageEncoding:
+    """
+    How the frames of a camera topic are compressed before being logged.
+    format is "jpeg" or "png", quality only applies to jpeg (1-95) and scale resizes
+    the frames before encoding (0.5 halves width and height).
+    Encoding needs pillow, install it with pip install ".[images]".
+    """
+    format: str = "jpeg"
+    quality: int = 85
+    scale: float = 1.0
+
+    def __post_init__(self):
+        if self.format not in _MEDIA_TYPES:
+            raise ValueError(f"Unknown image format '{self.format}', expected one of {list(_MEDIA_TYPES)}.")
+        if self.scale <= 0:
+            raise ValueError("scale must be positive.")
+
+    @property
+    def media_type(self):
+        return _MEDIA_TYPES[self.format]
+
+def _to_pil_image(image, color_model):
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError('Image encoding needs pillow, install it with pip install ".[images]"') from e
+
+    image = np.asarray(image)
+    if color_model == "BGR":
+        return Image.fromarray(np.ascontiguousarray(image[..., ::-1]), mode="RGB")
+    if color_model == "BGRA":
+        return Image.fromarray(np.ascontiguousarray(image[..., [2, 1, 0, 3]]), mode="RGBA")
+    if color_model in ("RGB", "RGBA", "L"):
+        return Image.fromarray(image.reshape(image.shape[:2]) if color_model == "L" else image, mode=color_model)
+    raise ValueError(f"Cannot encode images with color model '{color_model}'.")
+
+def encode_image(image, encoding, color_model="BGR"):
+    """
+    Returns the bytes of a single (H, W, C) uint8 image encoded as described by encoding.
+    """
+    pil_image = _to_pil_image(image, color_model)
+    if encoding.scale != 1.0:
+        # pillow is importable once _to_pil_image succeeded
+        from PIL import Image
+
+        width = max(1, round(pil_image.width * encoding.scale))
+        height = max(1, round(pil_image.height * encoding.scale))
+        pil_image = pil_image.resize((width, height), resample=Image.Resampling.BILINEAR)
+
+    buffer = io.BytesIO()
+    if encoding.format == "jpeg":
+        if pil_image.mode == "RGBA":
+            # jpeg has no alpha channel
+            pil_image = pil_image.convert("RGB")
+        pil_image.save(buffer, format="JPEG", quality=encoding.quality)
+    else:
+        pil_image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def encode_images(images, encoding, color_model="BGR", executor=None):
+    """
+    Encodes a (T, H, W, C) batch of images, in parallel on executor when one is given.
+    pillow releases the GIL while encoding, so a ThreadPoolExecutor is enough to use several cores.
+    """
+    encode = partial(encode_image, encoding=encoding, color_model=color_model)
+    if executor is None:
+        return [encode(image) for image in images]
+    return list(executor.map(propagate(encode), images))
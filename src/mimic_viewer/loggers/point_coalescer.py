@@ -0,0 +1,137 @@
+from dataclasses import dataclass, field
+import threading
+import time
+
+import numpy as np
+
+@dataclass
+class _TopicBuffer:
+    values: list = field(default_factory=list)
+    timestamps: list = field(default_factory=list)
+    num_bytes: int = 0
+    first_added_at: float = 0.0
+
+class PointCoalescer:
+    """
+    Buffers data points per topic and hands them over as (topic_name, values, timestamps) batches,
+    values and timestamps being stacked numpy arrays.
+
+    A topic is flushed as soon as it holds max_rows points or max_bytes bytes. When max_latency
+    (in seconds) is set, a background thread also flushes every topic whose oldest point has been
+    waiting for longer than that, so data never sits in the buffer when the stream goes quiet.
+    """
+    def __init__(self, flush_callback, max_rows=64, max_bytes=8 * 1024 * 1024, max_latency=0.1):
+        if max_rows <= 0:
+            raise ValueError("max_rows must be a positive integer.")
+        self.flush_callback = flush_callback
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+
+        self._buffers : dict[str, _TopicBuffer] = {}
+        self._condition = threading.Condition()
+        # held from taking a buffer out to sending it, so batches of a topic are sent in the
+        # order they were buffered whichever thread (caller or latency thread) sends them.
+        # Always taken before _condition
+        self._flush_lock = threading.Lock()
+        self._closed = False
+
+        self._latency_thread = None
+        if max_latency is not None:
+            self._latency_thread = threading.Thread(target=self._latency_loop, name="point-coalescer", daemon=True)
+            self._latency_thread.start()
+
+    def add(self, topic_name, timestamp, value):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot add data points to a closed PointCoalescer.")
+            buffer = self._buffers.get(topic_name)
+            if buffer is None:
+                buffer = _TopicBuffer(first_added_at=time.monotonic())
+                self._buffers[topic_name] = buffer
+                # wake up the latency thread, this may be the new earliest deadline
+                self._condition.notify()
+            buffer.values.append(value)
+            buffer.timestamps.append(timestamp)
+            buffer.num_bytes += getattr(value, "nbytes", 8)
+
+            full = len(buffer.values) >= self.max_rows or (
+                self.max_bytes is not None and buffer.num_bytes >= self.max_bytes
+            )
+
+        if full:
+            with self._flush_lock:
+                with self._condition:
+                    # the buffer may have been sent by another thread in the meantime
+                    buffer = self._buffers.pop(topic_name, None)
+                if buffer is not None:
+                    self._send(topic_name, buffer)
+
+    def flush(self):
+        """
+        Sends everything that is currently buffered.
+        """
+        with self._flush_lock:
+            with self._condition:
+                buffers = self._buffers
+                self._buffers = {}
+            for topic_name, buffer in buffers.items():
+                self._send(topic_name, buffer)
+
+    def close(self):
+        """
+        Flushes the remaining points and stops the latency thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._latency_thread is not None:
+            self._latency_thread.join()
+        self.flush()
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(buffer.values) for buffer in self._buffers.values())
+
+    def _send(self, topic_name, buffer):
+        """
+        Called with _flush_lock held.
+        """
+        if not buffer.values:
+            return
+        values = np.stack(buffer.values)
+        timestamps = np.asarray(buffer.timestamps)
+        self.flush_callback(topic_name, values, timestamps)
+
+    def _get_expired_topics(self, now):
+        return [
+            topic_name for topic_name, buffer in self._buffers.items()
+            if now - buffer.first_added_at >= self.max_latency
+        ]
+
+    def _latency_loop(self):
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                if not self._get_expired_topics(now):
+                    if self._buffers:
+                        oldest = min(buffer.first_added_at for buffer in self._buffers.values())
+                        self._condition.wait(timeout=max(oldest + self.max_latency - now, 0.0))
+                    else:
+                        self._condition.wait()
+                    continue
+
+            with self._flush_lock:
+                with self._condition:
+                    # looked up again, the buffers may have been sent while waiting for the lock
+                    expired_buffers = [
+                        (topic_name, self._buffers.pop(topic_name))
+                        for topic_name in self._get_expired_topics(time.monotonic())
+                    ]
+                for topic_name, buffer in expired_buffers:
+                    try:
+                        self._send(topic_name, buffer)
+                    except Exception as e:
+                        print(f"Warning: Failed to flush {len(buffer.values)} points of '{topic_name}': {e}")
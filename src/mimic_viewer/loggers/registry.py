@@ -0,0 +1,40 @@
+import importlib
+import threading
+
+# name -> (module, class) of every embodiment logger. The module is only imported the first
+# time its logger is asked for, so that importing the loggers package stays cheap.
+EMBODIMENT_LOGGERS = {
+    "bimanual_049": ("mimic_viewer.loggers.bimanual_049_logger", "Bimanual049Logger"),
+    "single_hand_048": ("mimic_viewer.loggers.single_hand_048_logger", "SingleHand048Logger"),
+}
+
+_logger_classes = {}
+_logger_classes_lock = threading.Lock()
+
+def get_logger_class(name):
+    """
+    Returns the embodiment logger class registered as name, importing its module on first use.
+    """
+    if name not in EMBODIMENT_LOGGERS:
+        raise KeyError(f"Unknown embodiment logger '{name}', expected one of {sorted(EMBODIMENT_LOGGERS)}.")
+    with _logger_classes_lock:
+        logger_class = _logger_classes.get(name)
+        if logger_class is None:
+            module_name, class_name = EMBODIMENT_LOGGERS[name]
+            logger_class = _logger_classes[name] = getattr(importlib.import_module(module_name), class_name)
+        return logger_class
+
+def get_logger_class_path(name):
+    """
+    "module.Class" of the logger registered as name, without importing it.
+    """
+    module_name, class_name = EMBODIMENT_LOGGERS[name]
+    return f"{module_name}.{class_name}"
+
+def get_logger_name_for_embodiment(embodiment_name):
+    """
+    Name of the logger of an embodiment of the database, every embodiment that is not bimanual
+    is logged as a single hand. A missing embodiment is assumed to be bimanual.
+    """
+    embodiment_name = embodiment_name or "bimanual"
+    return "bimanual_049" if "bimanual" in embodiment_name.lower() else "single_hand_048"
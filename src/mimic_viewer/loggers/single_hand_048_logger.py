@@ -2,21 +2,20 @@ import math
 import numpy as np
 from mimic_viewer.loggers.embodiment_logger import EmbodimentLogger
 import rerun as rr
-from rerun_loader_urdf import URDFLogger
-from scipy.spatial.transform import Rotation as R
 
+from mimic_viewer.loggers.urdf_cache import get_urdf_logger
 from mimic_viewer.loggers.utils import HandJointsLoggingInfo, ImageLoggingInfo, WristPoseLoggingInfo, log_base_transform, log_joint_transform
+from mimic_viewer.loggers.video_encoding import VIDEO_SEGMENTS_ENTITY_PATH
 
 class SingleHand048Logger(EmbodimentLogger):
     def __init__(self, urdf_path, recording = None):
         super().__init__(urdf_path, recording)
         self.__hand_urdf_path = self.urdf_path + "/p48/converted.urdf"
-        hand_logger = URDFLogger(
+        hand_logger = get_urdf_logger(
             self.__hand_urdf_path, 
-            entity_path_prefix="/world/base/hand"
+            entity_path_prefix="/world/base/hand",
+            material_rgba=[0,0.6,0,0.6], # green
         )
-        for material in hand_logger.urdf.materials:
-            material.color.rgba = [0,0.6,0,0.6] # green
 
         camera_topics = [
             "cameras__fixed_0",
@@ -53,6 +52,8 @@ class SingleHand048Logger(EmbodimentLogger):
         )
 
     def reset(self):
+        from scipy.spatial.transform import Rotation as R
+
         super().reset()
         identity_rotation = R.from_matrix(np.eye(3))
         log_base_transform("/world", np.zeros((0,3)), identity_rotation, recording=self.recording)
@@ -114,7 +115,7 @@ class SingleHand048Logger(EmbodimentLogger):
     def set_blueprint(self):
         blueprint = rr.blueprint.Vertical(
             rr.blueprint.Horizontal(
-                rr.blueprint.Spatial3DView(name="robot view", origin="/", contents=["/**"]),
+                rr.blueprint.Spatial3DView(name="robot view", origin="/", contents=["/**", f"- /{VIDEO_SEGMENTS_ENTITY_PATH}/**"]),
                 rr.blueprint.Vertical(
                     rr.blueprint.Spatial2DView(name="Fixed", origin="cameras/fixed_0"),
                     rr.blueprint.Horizontal(
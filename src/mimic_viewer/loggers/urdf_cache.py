@@ -0,0 +1,95 @@
+import functools
+import os
+import threading
+
+class _LogCallRecorder:
+    """
+    Stands in for a RecordingStream and keeps the log() calls made on it.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def log(self, entity_path, *entities, static=False, **kwargs):
+        self.calls.append((entity_path, entities, static, kwargs))
+
+@functools.lru_cache(maxsize=None)
+def _get_cached_urdf_logger_class():
+    """
+    CachedURDFLogger is defined on first use, rerun_loader_urdf imports the urdf packages and
+    trimesh, which make up most of the import time of the loggers.
+    """
+    from rerun_loader_urdf import URDFLogger
+
+    class CachedURDFLogger(URDFLogger):
+        """
+        URDFLogger whose static data (joint transforms and link meshes) is built once: the first
+        log() loads the meshes and keeps the resulting archetypes, which are already converted to
+        arrow, and every later log() sends those to the recording without touching the mesh files.
+        Instances are shared between embodiment loggers, see get_urdf_logger(), so they must not be
+        modified after they are created.
+        """
+        def __init__(self, filepath, entity_path_prefix=""):
+            super().__init__(filepath, entity_path_prefix=entity_path_prefix)
+            self.__static_log_calls = None
+            self.__lock = threading.Lock()
+            # entity paths of the joints and links, by name, walking the kinematic chain only once each
+            self.__joint_entity_paths = {}
+            self.__link_entity_paths = {}
+
+        def joint_entity_path(self, joint):
+            entity_path = self.__joint_entity_paths.get(joint.name)
+            if entity_path is None:
+                entity_path = self.__joint_entity_paths[joint.name] = super().joint_entity_path(joint)
+            return entity_path
+
+        def link_entity_path(self, link):
+            entity_path = self.__link_entity_paths.get(link.name)
+            if entity_path is None:
+                entity_path = self.__link_entity_paths[link.name] = super().link_entity_path(link)
+            return entity_path
+
+        def log(self, recording):
+            with self.__lock:
+                if self.__static_log_calls is None:
+                    recorder = _LogCallRecorder()
+                    super().log(recorder)
+                    self.__static_log_calls = recorder.calls
+            for entity_path, entities, static, kwargs in self.__static_log_calls:
+                recording.log(entity_path, *entities, static=static, **kwargs)
+
+    return CachedURDFLogger
+
+def __getattr__(name):
+    if name == "CachedURDFLogger":
+        return _get_cached_urdf_logger_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# (urdf path, entity path prefix, material color) -> (urdf mtime, logger)
+_urdf_logger_cache : dict = {}
+_urdf_logger_cache_lock = threading.Lock()
+
+def get_urdf_logger(urdf_path, entity_path_prefix="", material_rgba=None):
+    """
+    Returns the CachedURDFLogger of urdf_path, with every material set to material_rgba when given.
+    Loggers are cached per process and rebuilt when the urdf file is modified, so creating an
+    embodiment logger only parses its urdfs and loads their meshes once.
+    """
+    urdf_path = os.path.realpath(urdf_path)
+    mtime = os.stat(urdf_path).st_mtime_ns
+    key = (urdf_path, entity_path_prefix, tuple(material_rgba) if material_rgba is not None else None)
+    with _urdf_logger_cache_lock:
+        entry = _urdf_logger_cache.get(key)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+    logger = _get_cached_urdf_logger_class()(urdf_path, entity_path_prefix=entity_path_prefix)
+    if material_rgba is not None:
+        for material in logger.urdf.materials:
+            material.color.rgba = list(material_rgba)
+    with _urdf_logger_cache_lock:
+        _urdf_logger_cache[key] = (mtime, logger)
+    return logger
+
+def clear_urdf_logger_cache():
+    with _urdf_logger_cache_lock:
+        _urdf_logger_cache.clear()
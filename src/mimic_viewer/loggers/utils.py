@@ -1,23 +1,56 @@
 from collections.abc import Callable
 from dataclasses import dataclass, field
 import math
+from typing import TYPE_CHECKING
 import numpy as np
 import rerun as rr
-from scipy.spatial.transform import Rotation as R
-from rerun_loader_urdf import URDFLogger
-from urdf_parser_py.urdf import Joint
+
+from mimic_viewer.loggers.image_encoding import ImageEncoding, encode_image, encode_images
+from mimic_viewer.loggers.video_encoding import VideoEncoding
+from mimic_viewer.metrics import KINEMATICS_SECONDS, SEND_COLUMNS_SECONDS, SERIALIZATION_SECONDS
+from mimic_viewer.tracing import span
+
+# scipy and the urdf packages take most of the import time of the loggers, they are only imported
+# once a logger is created or a wrist pose is logged
+if TYPE_CHECKING:
+    from rerun_loader_urdf import URDFLogger
+    from urdf_parser_py.urdf import Joint
 
 JOINT_TRANSFORM_AXIS_SIZE = 0.02
 BASE_TRANSFORM_AXIS_SIZE = 0.06
 
+@dataclass
+class HandKinematicPlan:
+    """
+    Array form of a HandJointsLoggingInfo, compiled once so that a whole (T x J) matrix of
+    joint commands can be turned into (J x T x 4) quaternions with a few numpy operations.
+
+    For a revolute joint the logged rotation is origin * axis_angle(theta), which expands to
+    cos(theta / 2) * cos_terms + sin(theta / 2) * sin_terms, so only the per joint terms are stored.
+    """
+    entity_paths: list[str]
+    translations: np.ndarray # (J, 3)
+    cos_terms: np.ndarray # (J, 4) xyzw
+    sin_terms: np.ndarray # (J, 4) xyzw
+    half_angle_scales: np.ndarray # (J,) axis norm / 2
+    offsets: np.ndarray # (J,) in radians
+    command_scale: float # converts the incoming commands to radians
+    follower_sources: np.ndarray # (F,) index of the joint driving each follower
+    follower_entity_paths: list[str]
+    follower_translations: np.ndarray # (F, 3)
+
 @dataclass
 class HandJointsLoggingInfo:
     topic_name : str
-    logger : URDFLogger
-    actionable_joints : list[Joint]
-    joint_to_offset_map: dict[Joint, float] = field(default_factory = dict)
-    joint_to_follower_joint_map: dict[Joint, Joint] = field(default_factory = dict)
+    logger : "URDFLogger"
+    actionable_joints : "list[Joint]"
+    joint_to_offset_map: "dict[Joint, float]" = field(default_factory = dict)
+    joint_to_follower_joint_map: "dict[Joint, Joint]" = field(default_factory = dict)
     in_radians : bool = False
+    kinematic_plan : HandKinematicPlan = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.kinematic_plan = compile_hand_kinematic_plan(self)
 
 @dataclass
 class WristPoseLoggingInfo:
@@ -36,6 +69,61 @@ class ImageLoggingInfo:
     topic_name: str
     entity_name: str
     color_model: str = "BGR"
+    # frames are logged as rr.EncodedImage with an ImageEncoding, as video segments with a
+    # VideoEncoding and as raw rr.Image otherwise
+    encoding: ImageEncoding | VideoEncoding | None = None
+
+def compile_hand_kinematic_plan(hand_joint_logging_info):
+    from scipy.spatial.transform import Rotation as R
+
+    joints = hand_joint_logging_info.actionable_joints
+    num_joints = len(joints)
+
+    origin_quaternions = np.zeros((num_joints, 4))
+    axes = np.zeros((num_joints, 3))
+    for i, joint in enumerate(joints):
+        origin_quaternions[i] = R.from_euler("xyz", joint.origin.rpy).as_quat()
+        # urdf joints without an explicit axis rotate around x
+        axes[i] = joint.axis if joint.axis is not None else [1.0, 0.0, 0.0]
+
+    axis_norms = np.linalg.norm(axes, axis=1)
+    unit_axes = np.divide(axes, axis_norms[:, None], out=np.zeros_like(axes), where=axis_norms[:, None] > 0)
+
+    # hamilton product origin * (unit_axis * sin, cos), split into its cos and sin parts
+    origin_vectors = origin_quaternions[:, :3]
+    origin_scalars = origin_quaternions[:, 3]
+    sin_vectors = origin_scalars[:, None] * unit_axes + np.cross(origin_vectors, unit_axes)
+    sin_scalars = -np.einsum("ij,ij->i", origin_vectors, unit_axes)
+
+    followers = [
+        (i, hand_joint_logging_info.joint_to_follower_joint_map[joint])
+        for i, joint in enumerate(joints)
+        if joint in hand_joint_logging_info.joint_to_follower_joint_map
+    ]
+
+    return HandKinematicPlan(
+        entity_paths=[hand_joint_logging_info.logger.joint_entity_path(joint) for joint in joints],
+        translations=np.array([joint.origin.xyz for joint in joints], dtype=np.float64).reshape(num_joints, 3),
+        cos_terms=origin_quaternions,
+        sin_terms=np.concatenate([sin_vectors, sin_scalars[:, None]], axis=1),
+        half_angle_scales=axis_norms / 2,
+        offsets=np.deg2rad([hand_joint_logging_info.joint_to_offset_map.get(joint, 0.0) for joint in joints]),
+        command_scale=1.0 if hand_joint_logging_info.in_radians else math.pi / 180,
+        follower_sources=np.array([i for i, _ in followers], dtype=np.intp),
+        follower_entity_paths=[hand_joint_logging_info.logger.joint_entity_path(follower) for _, follower in followers],
+        follower_translations=np.array([follower.origin.xyz for _, follower in followers], dtype=np.float64).reshape(len(followers), 3),
+    )
+
+def compute_joint_quaternions(kinematic_plan, values):
+    """
+    values is a (T, J) matrix of joint commands, returns a (J, T, 4) array of xyzw quaternions
+    """
+    angles = values.T * kinematic_plan.command_scale + kinematic_plan.offsets[:, None]
+    half_angles = angles * kinematic_plan.half_angle_scales[:, None]
+    return (
+        np.cos(half_angles)[:, :, None] * kinematic_plan.cos_terms[:, None, :]
+        + np.sin(half_angles)[:, :, None] * kinematic_plan.sin_terms[:, None, :]
+    )
 
 def log_transform(entity, translation_vector, rotation_object, axis_length, recording):
     rotation_matrix = rotation_object.as_matrix()
@@ -47,26 +135,28 @@ def log_base_transform(entity, translation_vector, rotation_object, recording):
 def log_joint_transform(entity, translation_vector, rotation_object, recording):
     log_transform(entity, translation_vector, rotation_object, JOINT_TRANSFORM_AXIS_SIZE, recording)
 
-def log_image(entity, image, recording, color_model = "BGR"):
+def log_image(entity, image, recording, color_model = "BGR", encoding = None):
+    if encoding is not None:
+        recording.log(entity, rr.EncodedImage(contents=encode_image(image, encoding, color_model), media_type=encoding.media_type))
+        return
     recording.log(entity, rr.Image(image, color_model=color_model))
 
+def log_quaternion_transform(entity, translation_vector, quaternion, axis_length, recording):
+    recording.log(entity, rr.Transform3D(translation=translation_vector, quaternion=rr.Quaternion(xyzw=quaternion), axis_length=axis_length))
+
 def log_hand_joints(hand_joint_logging_info, values, recording):
     if len(values) != len(hand_joint_logging_info.actionable_joints):
         raise ValueError
-    for command, joint in zip(values, hand_joint_logging_info.actionable_joints):
-        if hand_joint_logging_info.in_radians:
-            command = command * 180 / math.pi
-        joint_entity = hand_joint_logging_info.logger.joint_entity_path(joint)
-        adjusted_command = (command + hand_joint_logging_info.joint_to_offset_map.get(joint, 0.0)) * math.pi / 180
-        initial_joint_rotation = R.from_euler("xyz", joint.origin.rpy)
-        joint_rotation = initial_joint_rotation * R.from_rotvec(np.array(joint.axis) * adjusted_command) 
-        log_joint_transform(joint_entity, joint.origin.xyz, joint_rotation, recording=recording)
-        if joint in hand_joint_logging_info.joint_to_follower_joint_map:
-            follower_joint = hand_joint_logging_info.joint_to_follower_joint_map[joint]
-            follower_joint_entity = hand_joint_logging_info.logger.joint_entity_path(follower_joint)
-            log_joint_transform(follower_joint_entity, follower_joint.origin.xyz, joint_rotation, recording=recording)
+    plan = hand_joint_logging_info.kinematic_plan
+    quaternions = compute_joint_quaternions(plan, np.asarray(values, dtype=np.float64)[None, :])[:, 0]
+    for entity, translation, quaternion in zip(plan.entity_paths, plan.translations, quaternions):
+        log_quaternion_transform(entity, translation, quaternion, JOINT_TRANSFORM_AXIS_SIZE, recording)
+    for source, entity, translation in zip(plan.follower_sources, plan.follower_entity_paths, plan.follower_translations):
+        log_quaternion_transform(entity, translation, quaternions[source], JOINT_TRANSFORM_AXIS_SIZE, recording)
 
 def log_wrist_pose(wrist_pose_logging_info, value, recording):
+    from scipy.spatial.transform import Rotation as R
+
     rotation = value[:3,:3]
     translation = value[:3,3]
     additional_rotation = wrist_pose_logging_info.additional_rotation * math.pi / 180
@@ -81,32 +171,51 @@ def log_efforts(efforts_logging_info, value, recording):
         effort = value[joint_index]
         log_scalar(f"{efforts_logging_info.entity_name}{efforts_logging_info.suffix_generator(joint_index)}", effort, recording)
 
-def log_transform_batch(entity, translation_vectors, rotation_objects, timestamps, axis_length, recording):
-    recording.send_columns(
-        entity,
-        indexes=[rr.TimeColumn("time", duration=timestamps / 1e9)],
-        columns=rr.Transform3D.columns(
+def send_batch_columns(entity, archetype_name, timestamps, columns, recording):
+    """
+    Sends the columns of a batch on the "time" timeline, timestamps being in nanoseconds.
+    """
+    with SEND_COLUMNS_SECONDS.time(archetype=archetype_name), span("send_columns", entity=entity, archetype=archetype_name, rows=len(timestamps)):
+        recording.send_columns(
+            entity,
+            indexes=[rr.TimeColumn("time", duration=timestamps / 1e9)],
+            columns=columns,
+        )
+
+def log_transform_batch(entity, translation_vectors, quaternions, timestamps, axis_length, recording):
+    """
+    translation_vectors is a (T, 3) array and quaternions a (T, 4) array of xyzw quaternions
+    """
+    with SERIALIZATION_SECONDS.time(archetype="Transform3D"):
+        columns = rr.Transform3D.columns(
             translation=translation_vectors,
-            quaternion=[rr.Quaternion(xyzw=r.as_quat()) for r in rotation_objects],
-            axis_length=[axis_length for _ in timestamps],
+            quaternion=quaternions,
+            axis_length=np.full(len(timestamps), axis_length, dtype=np.float32),
         )
-    )
+    send_batch_columns(entity, "Transform3D", timestamps, columns, recording)
 
-def log_base_transform_batch(entity, translation_vectors, rotation_objects, timestamps, recording):
-    log_transform_batch(entity, translation_vectors, rotation_objects, timestamps, BASE_TRANSFORM_AXIS_SIZE, recording)
+def log_base_transform_batch(entity, translation_vectors, quaternions, timestamps, recording):
+    log_transform_batch(entity, translation_vectors, quaternions, timestamps, BASE_TRANSFORM_AXIS_SIZE, recording)
 
-def log_joint_transform_batch(entity, translation_vectors, rotation_objects, timestamps, recording):
-    log_transform_batch(entity, translation_vectors, rotation_objects, timestamps, JOINT_TRANSFORM_AXIS_SIZE, recording)
+def log_joint_transform_batch(entity, translation_vectors, quaternions, timestamps, recording):
+    log_transform_batch(entity, translation_vectors, quaternions, timestamps, JOINT_TRANSFORM_AXIS_SIZE, recording)
+
+def log_image_batch(entity, values, timestamps, recording, color_model = "BGR", encoding = None, executor = None):
+    if encoding is not None:
+        with SERIALIZATION_SECONDS.time(archetype="EncodedImage"), span("image_batch", entity=entity, rows=len(values), encoding=encoding.media_type):
+            columns = rr.EncodedImage.columns(
+                blob=encode_images(values, encoding, color_model, executor),
+                media_type=[encoding.media_type] * len(values),
+            )
+        send_batch_columns(entity, "EncodedImage", timestamps, columns, recording)
+        return
 
-def log_image_batch(entity, values, timestamps, recording, color_model = "BGR"):
     first_image = values[0]
     height = first_image.shape[0]
     width = first_image.shape[1]
 
-    recording.send_columns(
-        entity,
-        indexes=[rr.TimeColumn("time", duration=timestamps / 1e9)],
-        columns=rr.Image.columns(
+    with SERIALIZATION_SECONDS.time(archetype="Image"), span("image_batch", entity=entity, rows=len(values), encoding=None):
+        columns = rr.Image.columns(
             buffer = values.view(np.uint8).reshape(len(values), -1),
             format=[rr.components.ImageFormat(
                 width=width,
@@ -115,14 +224,12 @@ def log_image_batch(entity, values, timestamps, recording, color_model = "BGR"):
                 channel_datatype="U8"
             )] * len(values)
         )
-    )
+    send_batch_columns(entity, "Image", timestamps, columns, recording)
 
 def log_scalar_batch(entity, values, timestamps, recording):
-    recording.send_columns(
-        entity, 
-        indexes = [rr.TimeColumn("time", duration=timestamps / 1e9)],
+    with SERIALIZATION_SECONDS.time(archetype="Scalars"):
         columns = rr.Scalars.columns(scalars=values)
-    )
+    send_batch_columns(entity, "Scalars", timestamps, columns, recording)
 
 def log_hand_joints_batch(hand_joint_logging_info, values, timestamps, recording):
     num_timestamps, num_joints = values.shape
@@ -131,47 +238,31 @@ def log_hand_joints_batch(hand_joint_logging_info, values, timestamps, recording
     if num_timestamps != len(timestamps):
         raise ValueError
 
-    for i, joint in enumerate(hand_joint_logging_info.actionable_joints):
-        joint_commands = values[:, i]
-
-        if hand_joint_logging_info.in_radians:
-            joint_commands = np.rad2deg(joint_commands)
+    plan = hand_joint_logging_info.kinematic_plan
+    with KINEMATICS_SECONDS.time(kind="hand_joints"), span("hand_joint_kinematics", topic=hand_joint_logging_info.topic_name, rows=num_timestamps):
+        quaternions = compute_joint_quaternions(plan, np.asarray(values, dtype=np.float64)) # (J, T, 4)
 
-        offset = hand_joint_logging_info.joint_to_offset_map.get(joint, 0.0)
-        adjusted_commands = np.deg2rad(joint_commands + offset)
-
-        translation_vectors = [t for t in np.tile(joint.origin.xyz, (num_timestamps, 1))]
-
-        initial_joint_rotation = R.from_euler("xyz", joint.origin.rpy)
-        joint_axis = np.array(joint.axis) # Shape: (3,)
-        
-        rotation_list = []
-        for j in range(num_timestamps):
-            single_rotation = initial_joint_rotation * R.from_rotvec(joint_axis * adjusted_commands[j])
-            rotation_list.append(single_rotation)
-        
-        joint_entity = hand_joint_logging_info.logger.joint_entity_path(joint)
+    for entity, translation, joint_quaternions in zip(plan.entity_paths, plan.translations, quaternions):
         log_joint_transform_batch(
-            entity=joint_entity,
-            translation_vectors=translation_vectors,
-            rotation_objects=rotation_list,
+            entity=entity,
+            translation_vectors=np.broadcast_to(translation, (num_timestamps, 3)),
+            quaternions=joint_quaternions,
             timestamps=timestamps,
             recording=recording
         )
 
-        if joint in hand_joint_logging_info.joint_to_follower_joint_map:
-            follower_joint = hand_joint_logging_info.joint_to_follower_joint_map[joint]
-            follower_joint_entity = hand_joint_logging_info.logger.joint_entity_path(follower_joint)
-            follower_translation_vectors = [t for t in np.tile(follower_joint.origin.xyz, (num_timestamps, 1))]
-            log_joint_transform_batch(
-                entity=follower_joint_entity,
-                translation_vectors=follower_translation_vectors,
-                rotation_objects=rotation_list,
-                timestamps=timestamps,
-                recording=recording
-            )
+    for source, entity, translation in zip(plan.follower_sources, plan.follower_entity_paths, plan.follower_translations):
+        log_joint_transform_batch(
+            entity=entity,
+            translation_vectors=np.broadcast_to(translation, (num_timestamps, 3)),
+            quaternions=quaternions[source],
+            timestamps=timestamps,
+            recording=recording
+        )
 
 def log_wrist_pose_batch(wrist_pose_logging_info, values, timestamps, recording):
+    from scipy.spatial.transform import Rotation as R
+
     if values.ndim != 3 or values.shape[1:] != (4, 4):
         raise ValueError
     
@@ -182,19 +273,18 @@ def log_wrist_pose_batch(wrist_pose_logging_info, values, timestamps, recording)
     rotation_matrices = values[:, :3, :3]  # Shape: (T, 3, 3)
     translations_array = values[:, :3, 3]   # Shape: (T, 3)
 
-    additional_rotation_rad = wrist_pose_logging_info.additional_rotation * math.pi / 180
-    additional_rotation_object = R.from_rotvec(additional_rotation_rad)
-
-    initial_rotations = R.from_matrix(rotation_matrices)
-    adjusted_rotations = initial_rotations * additional_rotation_object
+    with KINEMATICS_SECONDS.time(kind="wrist_pose"), span("wrist_pose_conversion", topic=wrist_pose_logging_info.topic_name, rows=num_timestamps):
+        additional_rotation_rad = wrist_pose_logging_info.additional_rotation * math.pi / 180
+        additional_rotation_object = R.from_rotvec(additional_rotation_rad)
 
-    translations = [t for t in translations_array]
-    rotations = [r for r in adjusted_rotations]
+        initial_rotations = R.from_matrix(rotation_matrices)
+        adjusted_rotations = initial_rotations * additional_rotation_object
+        quaternions = adjusted_rotations.as_quat()
 
     log_base_transform_batch(
         entity=wrist_pose_logging_info.entity_name,
-        translation_vectors=translations,
-        rotation_objects=rotations,
+        translation_vectors=translations_array,
+        quaternions=quaternions,
         timestamps=timestamps,
         recording=recording
     )
@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+from fractions import Fraction
+import io
+
+import numpy as np
+import rerun as rr
+
+from mimic_viewer.metrics import SEND_COLUMNS_SECONDS, SERIALIZATION_SECONDS
+from mimic_viewer.tracing import span
+
+# pts of the encoded frames are in microseconds from the first frame of their segment
+_VIDEO_TIME_BASE = Fraction(1, 1_000_000)
+_PIXEL_FORMATS = {"BGR": "bgr24", "RGB": "rgb24", "BGRA": "bgra", "RGBA": "rgba", "L": "gray"}
+# root of the entities the video segments are logged under, the robot views of the blueprints exclude it
+VIDEO_SEGMENTS_ENTITY_PATH = "videos"
+
+@dataclass(frozen=True)
+class VideoEncoding:
+    """
+    Encodes a camera topic into a video (H.264 by default) instead of logging its frames one by one.
+    The stream is cut into segments of at most segment_frames frames, every segment is logged as an
+    rr.AssetVideo and the frames as rr.VideoFrameReference rows pointing into it, so memory stays
+    bounded on long episodes. crf and preset are passed to the encoder, scale resizes the frames.
+    Encoding needs PyAV, install it with pip install ".[video]".
+    """
+    codec: str = "libx264"
+    crf: int = 23
+    preset: str = "veryfast"
+    segment_frames: int = 300
+    scale: float = 1.0
+
+    def __post_init__(self):
+        if self.segment_frames <= 0:
+            raise ValueError("segment_frames must be a positive integer.")
+        if self.scale <= 0:
+            raise ValueError("scale must be positive.")
+
+class VideoStreamLogger:
+    """
+    Streams the frames of one camera entity into video segments. Segments are logged under
+    videos/<entity>/segment_<index>, outside of the camera and robot views, and a new one is started when
+    the current one is full, when the frame size changes or when timestamps go back in time
+    (e.g. the full resolution pass of a progressive ingest). Call flush() to log the open segment.
+    """
+    def __init__(self, entity, encoding, recording, color_model="BGR"):
+        try:
+            import av
+        except ImportError as e:
+            raise ImportError('Video encoding needs PyAV, install it with pip install ".[video]"') from e
+        if color_model not in _PIXEL_FORMATS:
+            raise ValueError(f"Cannot encode videos with color model '{color_model}'.")
+
+        self.__av = av
+        self.entity = entity
+        self.encoding = encoding
+        self.recording = recording
+        self.color_model = color_model
+        self.num_segments = 0
+        self.__reset_segment()
+
+    def log_batch(self, values, timestamps):
+        with SERIALIZATION_SECONDS.time(archetype="VideoFrame"), span("image_batch", entity=self.entity, rows=len(values), encoding="video/mp4"):
+            self.__log_batch(values, timestamps)
+
+    def __log_batch(self, values, timestamps):
+        for image, timestamp in zip(values, timestamps):
+            timestamp = int(timestamp)
+            if self.__container is not None and (
+                image.shape != self.__frame_shape
+                or (timestamp - self.__segment_start) // 1000 <= (self.__timestamps[-1] - self.__segment_start) // 1000
+                or len(self.__timestamps) >= self.encoding.segment_frames
+            ):
+                self.flush()
+            if self.__container is None:
+                self.__open_segment(image.shape, timestamp)
+            self.__encode(image, timestamp)
+
+    def flush(self):
+        if self.__container is None:
+            return
+        for packet in self.__stream.encode():
+            self.__container.mux(packet)
+        self.__container.close()
+
+        asset_entity = f"{VIDEO_SEGMENTS_ENTITY_PATH}/{self.entity.strip('/')}/segment_{self.num_segments:05d}"
+        self.recording.log(asset_entity, rr.AssetVideo(contents=self.__buffer.getvalue(), media_type="video/mp4"), static=True)
+
+        timestamps = np.array(self.__timestamps, dtype=np.int64)
+        # in nanoseconds, with the same rounding as the pts of the encoded frames
+        video_timestamps = (timestamps - self.__segment_start) // 1000 * 1000
+        with SEND_COLUMNS_SECONDS.time(archetype="VideoFrameReference"), span("send_columns", entity=self.entity, archetype="VideoFrameReference", rows=len(timestamps)):
+            self.recording.send_columns(
+                self.entity,
+                indexes=[rr.TimeColumn("time", duration=timestamps / 1e9)],
+                columns=rr.VideoFrameReference.columns(
+                    timestamp=video_timestamps,
+                    video_reference=[asset_entity] * len(timestamps),
+                )
+            )
+        self.num_segments += 1
+        self.__reset_segment()
+
+    def __reset_segment(self):
+        self.__container = None
+        self.__stream = None
+        self.__buffer = None
+        self.__frame_shape = None
+        self.__segment_start = None
+        self.__timestamps = []
+
+    def __open_segment(self, frame_shape, timestamp):
+        height, width = frame_shape[:2]
+        self.__buffer = io.BytesIO()
+        self.__container = self.__av.open(self.__buffer, mode="w", format="mp4")
+        self.__stream = self.__container.add_stream(
+            self.encoding.codec,
+            options={"crf": str(self.encoding.crf), "preset": self.encoding.preset},
+        )
+        # yuv420p needs even sizes
+        self.__stream.width = max(2, round(width * self.encoding.scale) // 2 * 2)
+        self.__stream.height = max(2, round(height * self.encoding.scale) // 2 * 2)
+        self.__stream.pix_fmt = "yuv420p"
+        self.__stream.codec_context.time_base = _VIDEO_TIME_BASE
+        self.__frame_shape = frame_shape
+        self.__segment_start = timestamp
+
+    def __encode(self, image, timestamp):
+        image = np.ascontiguousarray(image)
+        if self.color_model == "L":
+            image = image.reshape(image.shape[:2])
+        frame = self.__av.VideoFrame.from_ndarray(image, format=_PIXEL_FORMATS[self.color_model])
+        frame = frame.reformat(width=self.__stream.width, height=self.__stream.height, format="yuv420p")
+        frame.pts = (timestamp - self.__segment_start) // 1000
+        frame.time_base = _VIDEO_TIME_BASE
+        for packet in self.__stream.encode(frame):
+            self.__container.mux(packet)
+        self.__timestamps.append(timestamp)
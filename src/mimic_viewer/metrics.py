@@ -0,0 +1,201 @@
+"""
+Process wide ingest metrics, rendered in the Prometheus text format by MetricsRegistry.render()
+(served on /metrics by the web server).
+
+Metrics are updated where the work happens, in the data sources, the loggers and the server.
+Values that already live somewhere else (recording manager, scheduler, caches) are read by
+collectors when the metrics are rendered. Ingest workers started with INGEST_WORKERS run in
+their own processes, the metrics they update are not visible in the server.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+# seconds, from a single chunk read on local disk to a whole episode
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = [*zip(label_names, label_values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} takes the labels {self.label_names}, got {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per bucket counts (not cumulative, the last one is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bucket] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state is not None else 0
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for upper_bound, bucket_count in zip((*self.buckets, math.inf), bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', _format_value(upper_bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.__metrics = {}
+        self.__collectors = []
+        self.__lock = threading.Lock()
+
+    def counter(self, name, documentation, label_names=()) -> Counter:
+        return self.__register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()) -> Gauge:
+        return self.__register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.__register(Histogram(name, documentation, label_names, buckets))
+
+    def add_collector(self, collector):
+        """
+        collector() is called before every render(), to update gauges from state kept elsewhere.
+        """
+        with self.__lock:
+            self.__collectors.append(collector)
+
+    def render(self):
+        with self.__lock:
+            collectors = list(self.__collectors)
+            metrics = list(self.__metrics.values())
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"⚠️ Warning: metrics collector failed: {e}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def __register(self, metric):
+        with self.__lock:
+            if metric.name in self.__metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered.")
+            self.__metrics[metric.name] = metric
+        return metric
+
+REGISTRY = MetricsRegistry()
+
+# data sources
+ROWS_READ = REGISTRY.counter("mimic_viewer_rows_read_total", "Rows read from zarr episodes.", ["topic"])
+BYTES_READ = REGISTRY.counter("mimic_viewer_bytes_read_total", "Bytes of values and timestamps read from zarr episodes.", ["topic"])
+CHUNK_FETCH_SECONDS = REGISTRY.histogram("mimic_viewer_chunk_fetch_seconds", "Time to read (fetch and decompress) a row range of a topic from zarr.", ["loader"])
+CHUNK_READS_IN_FLIGHT = REGISTRY.gauge("mimic_viewer_chunk_reads_in_flight", "Chunk reads submitted by the prefetchers and not consumed yet.")
+
+# loggers
+ROWS_LOGGED = REGISTRY.counter("mimic_viewer_rows_logged_total", "Rows handed to the embodiment loggers.", ["topic"])
+BYTES_LOGGED = REGISTRY.counter("mimic_viewer_bytes_logged_total", "Bytes of values and timestamps handed to the embodiment loggers.", ["topic"])
+# a single series, the names of unknown topics come from the episodes (see EmbodimentLogger.unknown_topic_counts)
+UNKNOWN_TOPIC_BATCHES = REGISTRY.counter("mimic_viewer_unknown_topic_batches_total", "Batches or points of topics no logger handles.")
+KINEMATICS_SECONDS = REGISTRY.histogram("mimic_viewer_kinematics_seconds", "Time to compute the transforms of a batch.", ["kind"])
+SERIALIZATION_SECONDS = REGISTRY.histogram("mimic_viewer_serialization_seconds", "Time to encode and convert a batch to rerun columns.", ["archetype"])
+SEND_COLUMNS_SECONDS = REGISTRY.histogram("mimic_viewer_send_columns_seconds", "Time spent in RecordingStream.send_columns.", ["archetype"])
+
+# server
+EPISODE_INGEST_SECONDS = REGISTRY.histogram("mimic_viewer_episode_ingest_seconds", "Time to ingest a whole episode.", ["mode"])
+EPISODE_INGEST_ROWS = REGISTRY.counter("mimic_viewer_episode_ingest_rows_total", "Rows of the episodes ingested by the server.", ["mode"])
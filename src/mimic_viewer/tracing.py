@@ -0,0 +1,154 @@
+"""
+Opt-in span tracing of the ingest, saved in the Chrome trace event format so that a single ingest
+can be looked at on a timeline (open the files in https://ui.perfetto.dev or chrome://tracing).
+
+Nothing is recorded until a Trace is activated with `with trace.activate(**tags):`. Inside, every
+`with span(name, **tags):` adds a complete event to the trace, tagged with its own tags and those
+of the spans and trace it is nested in. Without an active trace span() returns a shared no-op
+context manager, so instrumented code only pays for a context variable lookup.
+
+The active trace follows the current thread (and asyncio task). Work handed to an executor is
+only traced when it is wrapped with propagate(). Ingest worker processes (INGEST_WORKERS) are not
+traced.
+"""
+from contextlib import contextmanager, nullcontext
+import contextvars
+import json
+import os
+import threading
+import time
+
+# (trace, tags) of the innermost active span or trace
+_active_trace = contextvars.ContextVar("mimic_viewer_active_trace", default=None)
+
+_NO_SPAN = nullcontext()
+
+class Trace:
+    """
+    Events of one traced run, e.g. the ingest of an episode. At most max_events are kept, later
+    events are counted in dropped_events. metadata is saved with the trace.
+    """
+    def __init__(self, max_events=1_000_000, **metadata):
+        self.metadata = metadata
+        self.max_events = max_events
+        self.dropped_events = 0
+        self.__events = []
+        self.__thread_names = {}
+        self.__lock = threading.Lock()
+        self.__start_ns = time.perf_counter_ns()
+        self.__start_time = time.time()
+
+    @contextmanager
+    def activate(self, **tags):
+        """
+        Records the spans of the current thread in this trace, tagged with tags, until the block exits.
+        """
+        token = _active_trace.set((self, tags))
+        try:
+            yield self
+        finally:
+            _active_trace.reset(token)
+
+    def add_event(self, name, category, start_ns, end_ns, tags):
+        thread = threading.current_thread()
+        with self.__lock:
+            if len(self.__events) >= self.max_events:
+                self.dropped_events += 1
+                return
+            self.__thread_names.setdefault(thread.ident, thread.name)
+            self.__events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                # microseconds since the trace was created
+                "ts": (start_ns - self.__start_ns) / 1000,
+                "dur": (end_ns - start_ns) / 1000,
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": tags,
+            })
+
+    def to_chrome_trace(self):
+        with self.__lock:
+            events = list(self.__events)
+            thread_names = dict(self.__thread_names)
+            dropped_events = self.dropped_events
+        pid = os.getpid()
+        metadata_events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}}
+            for thread_id, thread_name in thread_names.items()
+        ]
+        return {
+            "traceEvents": metadata_events + events,
+            "displayTimeUnit": "ms",
+            "otherData": {**self.metadata, "start_time": self.__start_time, "dropped_events": dropped_events},
+        }
+
+    def save(self, path):
+        """
+        Writes the trace to path as json, replacing it at once so that a partially written trace is never seen.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+        os.replace(temporary_path, path)
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__events)
+
+class _Span:
+    __slots__ = ("trace", "name", "category", "tags", "start_ns", "token")
+
+    def __init__(self, trace, name, category, tags):
+        self.trace = trace
+        self.name = name
+        self.category = category
+        self.tags = tags
+
+    def __enter__(self):
+        # spans opened inside this one inherit its tags
+        self.token = _active_trace.set((self.trace, self.tags))
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end_ns = time.perf_counter_ns()
+        _active_trace.reset(self.token)
+        if exc_type is not None:
+            self.tags["error"] = exc_type.__name__
+        self.trace.add_event(self.name, self.category, self.start_ns, end_ns, self.tags)
+        return False
+
+def span(name, category="ingest", **tags):
+    """
+    Context manager recording the block as an event of the active trace, does nothing without one.
+    """
+    active = _active_trace.get()
+    if active is None:
+        return _NO_SPAN
+    trace, parent_tags = active
+    return _Span(trace, name, category, {**parent_tags, **tags})
+
+def get_active_trace() -> Trace | None:
+    active = _active_trace.get()
+    return active[0] if active is not None else None
+
+def propagate(fn):
+    """
+    Returns fn running in the active trace (and inside the current span) wherever it is called,
+    for work submitted to an executor. Returns fn itself when no trace is active.
+    """
+    active = _active_trace.get()
+    if active is None:
+        return fn
+
+    def traced(*args, **kwargs):
+        token = _active_trace.set(active)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _active_trace.reset(token)
+    return traced
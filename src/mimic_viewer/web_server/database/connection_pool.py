@@ -0,0 +1,158 @@
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+
+class PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+class ConnectionPool:
+    """
+    Thread safe pool of DB-API connections opened with connect().
+
+    At least min_size connections are kept open (see fill()) and at most max_size are open at
+    the same time, callers wait up to timeout seconds for one to be returned. Connections older
+    than max_lifetime seconds are closed instead of being reused, and a connection that sat idle
+    for more than health_check_interval seconds runs health_check_query before being handed out.
+    A connection is dropped when the code using it raises, since it may be in a broken state.
+    """
+    def __init__(self, connect, min_size=1, max_size=10, max_lifetime=1800.0, health_check_interval=30.0, health_check_query="SELECT 1", timeout=30.0):
+        if max_size <= 0 or min_size < 0 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size > 0.")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.health_check_query = health_check_query
+        self.timeout = timeout
+        self.opened = self.recycled = self.failed_health_checks = 0
+
+        self.__idle = deque()
+        self.__size = 0
+        self.__closed = False
+        self.__condition = threading.Condition()
+
+    @contextmanager
+    def connection(self):
+        entry = self.__acquire()
+        try:
+            yield entry.connection
+        except BaseException:
+            self.__close_entry(entry)
+            raise
+        else:
+            self.__release(entry)
+
+    def fill(self):
+        """
+        Opens connections until min_size are open.
+        """
+        while True:
+            with self.__condition:
+                if self.__closed or self.__size >= self.min_size:
+                    return
+                self.__size += 1
+            entry = self.__open()
+            self.__release(entry)
+
+    def get_stats(self):
+        with self.__condition:
+            return {
+                "size": self.__size,
+                "idle": len(self.__idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "opened": self.opened,
+                "recycled": self.recycled,
+                "failed_health_checks": self.failed_health_checks,
+            }
+
+    def close(self):
+        with self.__condition:
+            self.__closed = True
+            idle = list(self.__idle)
+            self.__idle.clear()
+            self.__condition.notify_all()
+        for entry in idle:
+            self.__close_entry(entry)
+
+    def __acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self.__condition:
+                entry = None
+                while True:
+                    if self.__closed:
+                        raise RuntimeError("The connection pool is closed.")
+                    if self.__idle:
+                        # most recently used first, so the extra connections go idle and expire
+                        entry = self.__idle.pop()
+                        break
+                    if self.__size < self.max_size:
+                        self.__size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for a database connection.")
+                    self.__condition.wait(remaining)
+
+            if entry is None:
+                return self.__open()
+            if self.__is_usable(entry):
+                entry.last_used_at = time.monotonic()
+                return entry
+            self.__close_entry(entry)
+
+    def __open(self):
+        """
+        Opens a connection for a slot that was already counted in __size.
+        """
+        try:
+            entry = PooledConnection(self.connect())
+        except BaseException:
+            with self.__condition:
+                self.__size -= 1
+                self.__condition.notify()
+            raise
+        with self.__condition:
+            self.opened += 1
+        return entry
+
+    def __is_usable(self, entry):
+        now = time.monotonic()
+        if now - entry.created_at > self.max_lifetime:
+            with self.__condition:
+                self.recycled += 1
+            return False
+        if now - entry.last_used_at > self.health_check_interval:
+            try:
+                cursor = entry.connection.cursor()
+                cursor.execute(self.health_check_query)
+                cursor.fetchall()
+            except Exception:
+                with self.__condition:
+                    self.failed_health_checks += 1
+                return False
+        return True
+
+    def __release(self, entry):
+        with self.__condition:
+            if not self.__closed:
+                entry.last_used_at = time.monotonic()
+                self.__idle.append(entry)
+                self.__condition.notify()
+                return
+        self.__close_entry(entry)
+
+    def __close_entry(self, entry):
+        try:
+            entry.connection.close()
+        except Exception:
+            pass
+        with self.__condition:
+            self.__size -= 1
+            self.__condition.notify()
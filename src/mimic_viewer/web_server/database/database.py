@@ -1,96 +1,240 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import configparser
-from contextlib import asynccontextmanager
+from functools import partial
 import os
+import sqlite3
+import threading
 
-from google.cloud.sql.connector import Connector
 from dotenv import load_dotenv
 
+from mimic_viewer.web_server.database.connection_pool import ConnectionPool
+
 load_dotenv()
 
 class DatabaseManager:
-    def __init__(self):
-        config = configparser.ConfigParser()
-        config.read(os.environ["DB_CONFIG_PATH"])
-        self.username = config["db"]["username"]
-        self.password = config["db"]["password"]
-        self.connection_string = config["db"]["connection_string"]
-        self.db_name = config["db"]["db_name"]
-
-        self.connector = Connector()
-
-    @asynccontextmanager
-    async def get_connection(self):
-        """Get a database connection."""
-            # Use Cloud SQL Connector
-        conn = self.connector.connect(
-            instance_connection_string=self.connection_string, 
-            driver="pg8000", 
-            user=self.username, 
-            password=self.password, 
-            db=self.db_name
+    """
+    Runs the episode queries on a pool of connections (see ConnectionPool). The drivers are
+    blocking, so every query runs on a dedicated thread pool with one thread per connection
+    and never on the event loop.
+    placeholder is the parameter marker of the driver, "%s" for pg8000 and "?" for sqlite3.
+    """
+    def __init__(self, connect, placeholder="%s", min_size=1, max_size=10, max_lifetime=1800.0, health_check_interval=30.0):
+        self.placeholder = placeholder
+        self.pool = ConnectionPool(
+            connect,
+            min_size=min_size,
+            max_size=max_size,
+            max_lifetime=max_lifetime,
+            health_check_interval=health_check_interval,
         )
-        
-        try:
-            yield conn
-        finally:
-            if conn:
-                conn.close()
+        self.executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix="db")
+
+    @classmethod
+    def from_config(cls, config_path, **pool_options):
+        """
+        Cloud SQL Postgres database, connected to with the credentials of the [db] section of config_path.
+        The Cloud SQL connector is only imported and created when the first connection is opened.
+        """
+        config = configparser.ConfigParser()
+        config.read(config_path)
+        connector = None
+        connector_lock = threading.Lock()
+
+        def connect():
+            nonlocal connector
+            with connector_lock:
+                if connector is None:
+                    from google.cloud.sql.connector import Connector
+                    connector = Connector()
+            return connector.connect(
+                instance_connection_string=config["db"]["connection_string"],
+                driver="pg8000",
+                user=config["db"]["username"],
+                password=config["db"]["password"],
+                db=config["db"]["db_name"],
+            )
+
+        return cls(connect, placeholder="%s", **pool_options)
+
+    @classmethod
+    def from_sqlite(cls, path, **pool_options):
+        """
+        Local stand-in for the Cloud SQL database: the sqlite file at path is attached as the
+        preproduction schema, so the same queries run on it. See create_sqlite_database().
+        """
+        def connect():
+            connection = sqlite3.connect(":memory:", check_same_thread=False)
+            connection.execute("ATTACH DATABASE ? AS preproduction", (path,))
+            return connection
+
+        return cls(connect, placeholder="?", **pool_options)
+
+    async def run(self, function, *args):
+        """
+        Calls function(connection, *args) on the DB thread pool and returns its result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(self.__run_with_connection, function, *args))
+
+    def __run_with_connection(self, function, *args):
+        with self.pool.connection() as conn:
+            return function(conn, *args)
+
+    async def open(self):
+        """
+        Opens the min_size connections of the pool ahead of the first request.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.pool.fill)
+
+    def close(self):
+        self.pool.close()
+        self.executor.shutdown(wait=False)
 
     async def get_episode_url(self, episode_id: int):
-        async with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Query the episodes table to get the URL
-            query = """
-                SELECT url 
-                FROM preproduction.episodes 
-                WHERE id = %s
-            """
-            
-            cursor.execute(query, (episode_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                return result[0]
-            else:
-                return None
-    
+        return await self.run(self._query_episode_url, episode_id)
+
     async def get_episode_info(self, episode_id: int):
-        async with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Query to get episode info with subdataset details
-            query = """
-                SELECT 
-                    e.id,
-                    e.url,
-                    e.uploaded_at,
-                    s.name as subdataset_name,
-                    s.description as subdataset_description,
-                    emb.name as embodiment_name,
-                    tm.name as teleop_mode_name
-                FROM preproduction.episodes e
-                LEFT JOIN preproduction.subdatasets s ON e.subdataset_id = s.id
-                LEFT JOIN preproduction.embodiments emb ON s.embodiment_id = emb.id
-                LEFT JOIN preproduction.teleop_modes tm ON s.teleop_mode_id = tm.id
-                WHERE e.id = %s
-            """
-            
-            cursor.execute(query, (episode_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                return {
-                    "id": result[0],
-                    "url": result[1],
-                    "uploaded_at": result[2],
-                    "subdataset_name": result[3],
-                    "subdataset_description": result[4],
-                    "embodiment_name": result[5],
-                    "teleop_mode_name": result[6],
-                }
-            else:
-                return None
-    
+        return await self.run(self._query_episode_info, episode_id)
+
+    async def get_episode_infos(self, episode_ids):
+        """
+        Infos of several episodes in one query, keyed by episode id. Episodes that do not exist are left out.
+        """
+        return await self.run(self._query_episode_infos, list(episode_ids))
+
+    async def get_subdataset_episode_infos(self, subdataset_name: str):
+        """
+        Infos of the episodes of a subdataset keyed by episode id, in episode id order.
+        """
+        return await self.run(self._query_subdataset_episode_infos, subdataset_name)
+
+    def _query_episode_url(self, conn, episode_id):
+        cursor = conn.cursor()
+
+        # Query the episodes table to get the URL
+        query = f"""
+            SELECT url
+            FROM preproduction.episodes
+            WHERE id = {self.placeholder}
+        """
+
+        cursor.execute(query, (episode_id,))
+        result = cursor.fetchone()
+
+        if result:
+            return result[0]
+        else:
+            return None
+
+    def _query_episode_info(self, conn, episode_id):
+        cursor = conn.cursor()
+
+        # Query to get episode info with subdataset details
+        query = f"""
+            {EPISODE_INFO_QUERY}
+            WHERE e.id = {self.placeholder}
+        """
+
+        cursor.execute(query, (episode_id,))
+        result = cursor.fetchone()
+
+        if result:
+            return episode_info_from_row(result)
+        else:
+            return None
+
+    def _query_episode_infos(self, conn, episode_ids):
+        if not episode_ids:
+            return {}
+        cursor = conn.cursor()
+
+        placeholders = ", ".join([self.placeholder] * len(episode_ids))
+        query = f"""
+            {EPISODE_INFO_QUERY}
+            WHERE e.id IN ({placeholders})
+        """
+
+        cursor.execute(query, tuple(episode_ids))
+        return {row[0]: episode_info_from_row(row) for row in cursor.fetchall()}
+
+    def _query_subdataset_episode_infos(self, conn, subdataset_name):
+        cursor = conn.cursor()
+
+        query = f"""
+            {EPISODE_INFO_QUERY}
+            WHERE s.name = {self.placeholder}
+            ORDER BY e.id
+        """
+
+        cursor.execute(query, (subdataset_name,))
+        return {row[0]: episode_info_from_row(row) for row in cursor.fetchall()}
+
+EPISODE_INFO_QUERY = """
+    SELECT
+        e.id,
+        e.url,
+        e.uploaded_at,
+        s.name as subdataset_name,
+        s.description as subdataset_description,
+        emb.name as embodiment_name,
+        tm.name as teleop_mode_name
+    FROM preproduction.episodes e
+    LEFT JOIN preproduction.subdatasets s ON e.subdataset_id = s.id
+    LEFT JOIN preproduction.embodiments emb ON s.embodiment_id = emb.id
+    LEFT JOIN preproduction.teleop_modes tm ON s.teleop_mode_id = tm.id
+"""
+
+def episode_info_from_row(row):
+    return {
+        "id": row[0],
+        "url": row[1],
+        "uploaded_at": row[2],
+        "subdataset_name": row[3],
+        "subdataset_description": row[4],
+        "embodiment_name": row[5],
+        "teleop_mode_name": row[6],
+    }
+
+def create_sqlite_database(path):
+    """
+    Creates the tables of the preproduction schema used by DatabaseManager in the sqlite file at
+    path, for local runs and tests with DatabaseManager.from_sqlite().
+    """
+    with sqlite3.connect(path) as connection:
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS embodiments (id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE IF NOT EXISTS teleop_modes (id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE IF NOT EXISTS subdatasets (
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                description TEXT,
+                embodiment_id INTEGER REFERENCES embodiments(id),
+                teleop_mode_id INTEGER REFERENCES teleop_modes(id)
+            );
+            CREATE TABLE IF NOT EXISTS episodes (
+                id INTEGER PRIMARY KEY,
+                url TEXT,
+                uploaded_at TEXT,
+                subdataset_id INTEGER REFERENCES subdatasets(id)
+            );
+        """)
+    connection.close()
+
+def create_database_manager():
+    """
+    DB_BACKEND="sqlite" uses the sqlite stand-in at DB_SQLITE_PATH, anything else the Cloud SQL
+    database of DB_CONFIG_PATH.
+    """
+    pool_options = {
+        "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+        "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+        "max_lifetime": float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800")),
+    }
+    if os.environ.get("DB_BACKEND", "cloudsql") == "sqlite":
+        return DatabaseManager.from_sqlite(os.environ["DB_SQLITE_PATH"], **pool_options)
+    return DatabaseManager.from_config(os.environ["DB_CONFIG_PATH"], **pool_options)
+
 # Global database manager instance
-db_manager = DatabaseManager()
\ No newline at end of file
+db_manager = create_database_manager()
@@ -0,0 +1,128 @@
+from collections import OrderedDict
+import threading
+import time
+
+from mimic_viewer.web_server.single_flight import SingleFlight
+
+class EpisodeMetadataCache:
+    """
+    In process cache of the episode infos of db_manager (see DatabaseManager.get_episode_info).
+
+    At most max_size episodes are kept, least recently used first out. An info is served for ttl
+    seconds after it was fetched, and an episode that does not exist is remembered as such for
+    negative_ttl seconds so that repeated requests for it do not reach the database either.
+    Concurrent misses of the same episode share one query.
+    """
+    def __init__(self, db_manager, max_size=10000, ttl=3600.0, negative_ttl=60.0):
+        if max_size <= 0:
+            raise ValueError("Max size must be a positive integer.")
+        self.db_manager = db_manager
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = self.negative_hits = self.misses = self.evictions = 0
+
+        # episode id -> (info or None, expiry time)
+        self.__entries: OrderedDict[int, tuple[dict | None, float]] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__queries = SingleFlight()
+
+    async def get_episode_info(self, episode_id: int):
+        found, info = self.__lookup(episode_id)
+        if found:
+            return info
+        return await self.__queries.run(episode_id, self.__fetch, episode_id)
+
+    async def get_episode_infos(self, episode_ids):
+        """
+        Infos of several episodes keyed by episode id, the ones missing from the cache are fetched
+        in a single query. Episodes that do not exist are left out.
+        """
+        infos = {}
+        missing = []
+        for episode_id in dict.fromkeys(episode_ids):
+            found, info = self.__lookup(episode_id)
+            if not found:
+                missing.append(episode_id)
+            elif info is not None:
+                infos[episode_id] = info
+
+        if missing:
+            fetched = await self.db_manager.get_episode_infos(missing)
+            for episode_id in missing:
+                self.put(episode_id, fetched.get(episode_id))
+            infos.update(fetched)
+        return infos
+
+    async def get_subdataset_episode_infos(self, subdataset_name: str):
+        """
+        Infos of the episodes of a subdataset in episode id order. Always queries the database,
+        the episodes found are cached.
+        """
+        infos = await self.db_manager.get_subdataset_episode_infos(subdataset_name)
+        for episode_id, info in infos.items():
+            self.put(episode_id, info)
+        return infos
+
+    def put(self, episode_id: int, info: dict | None):
+        """
+        Caches the info of an episode, None caches the episode as not existing.
+        """
+        expires_at = time.monotonic() + (self.ttl if info is not None else self.negative_ttl)
+        with self.__lock:
+            self.__entries[episode_id] = (info, expires_at)
+            self.__entries.move_to_end(episode_id)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, episode_id: int | None = None):
+        """
+        Forgets the info of an episode, or of every episode when episode_id is None.
+        """
+        with self.__lock:
+            if episode_id is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(episode_id, None)
+
+    def get_stats(self):
+        with self.__lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self.__entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else None,
+                "evictions": self.evictions,
+            }
+
+    async def __fetch(self, episode_id):
+        info = await self.db_manager.get_episode_info(episode_id)
+        self.put(episode_id, info)
+        return info
+
+    def __lookup(self, episode_id):
+        """
+        Returns (found, info), expired entries are dropped.
+        """
+        with self.__lock:
+            entry = self.__entries.get(episode_id)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self.__entries[episode_id]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.__entries.move_to_end(episode_id)
+            if entry[0] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return True, entry[0]
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
@@ -0,0 +1,48 @@
+from collections import deque
+import socket
+import threading
+
+def is_port_free(port, host="0.0.0.0"):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+class PortPool:
+    """
+    Ports the gRPC servers of the recordings are served on. acquire() hands out a port that no
+    recording uses and that could be bound at that moment, release() puts it back at the end of
+    the queue, so a port that was just closed is the last one to be handed out again.
+    """
+    def __init__(self, ports, host="0.0.0.0"):
+        self.host = host
+        self.__free_ports = deque(ports)
+        self.__used_ports = set()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        with self.__lock:
+            for _ in range(len(self.__free_ports)):
+                port = self.__free_ports.popleft()
+                if is_port_free(port, self.host):
+                    self.__used_ports.add(port)
+                    return port
+                # taken by another process, retried once the other ports have been tried
+                self.__free_ports.append(port)
+        raise RuntimeError("No free gRPC port left.")
+
+    def release(self, port):
+        with self.__lock:
+            if port in self.__used_ports:
+                self.__used_ports.remove(port)
+                self.__free_ports.append(port)
+
+    def is_used(self, port):
+        with self.__lock:
+            return port in self.__used_ports
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__free_ports)
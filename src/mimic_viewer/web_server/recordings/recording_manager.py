@@ -1,70 +1,242 @@
+from collections import OrderedDict
 from dataclasses import dataclass, field
 import datetime
+import threading
+import time
+
 import rerun as rr
 
+from mimic_viewer.data_sources.timestamp_index import EpisodeWindow
+from mimic_viewer.web_server.recordings.port_pool import PortPool
+
 @dataclass
 class RecordingData:
     episode_id: int
     recording: rr.RecordingStream
     grpc_port: int
+    window: EpisodeWindow | None = None
+    # the logger the episode is ingested with, it counts the bytes handed to the recording
+    logger: object | None = None
+    # size of the .rrd files a cached episode was replayed from
+    cached_bytes: int = 0
+    # the job logging into the recording, cancelled when the recording is removed
+    ingest_job: object | None = None
     created_at: datetime.datetime = field(default_factory=datetime.datetime.now)
+    last_accessed_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def key(self):
+        return (self.episode_id, self.window)
+
+    @property
+    def logged_bytes(self):
+        return self.cached_bytes + (getattr(self.logger, "logged_bytes", 0) if self.logger is not None else 0)
 
 class RecordingDataManager:
-    def __init__(self, max_size):
+    """
+    Recordings currently served, at most max_size of them. Safe to use from request handlers and
+    background tasks at the same time.
+
+    Recordings are kept in least recently accessed order (find_by_episode_id counts as an access).
+    When a new one is added at capacity, when the logged bytes of all recordings go over max_bytes
+    or when a recording has not been accessed for ttl seconds, the least recently accessed ones are
+    disconnected and their gRPC ports go back to the port pool. The budget and the ttl are checked
+    by a background thread, see start_maintenance().
+    """
+    def __init__(self, max_size, max_bytes=None, ttl=None, ports=range(9001, 10001)):
         if max_size <= 0:
             raise ValueError("Max size must be a positive integer.")
         self.max_size = max_size
-        self._recordings: dict[int, RecordingData] = {}
-        self._used_ports: set[int] = set()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        # keyed by (episode id, window), every window of an episode is a recording of its own
+        self._recordings: OrderedDict[tuple[int, EpisodeWindow | None], RecordingData] = OrderedDict()
+        self._port_pool = PortPool(ports)
+        self._lock = threading.RLock()
+        self._maintenance_thread = None
+        self._stop_maintenance = threading.Event()
+        self._eviction_listeners = []
+
+    def add_eviction_listener(self, callback):
+        """
+        callback(recording_data) is called after a recording is removed, whether it was evicted,
+        reaped, removed with remove() or cleaned up by cleanup_all().
+        """
+        self._eviction_listeners.append(callback)
+
+    def acquire_port(self) -> int:
+        """
+        Returns a free port for the gRPC server of a new recording. Pass it to add() with the
+        recording, or give it back with release_port() if the recording is not added.
+        """
+        return self._port_pool.acquire()
+
+    def release_port(self, port: int):
+        self._port_pool.release(port)
+
+    def add(self, new_data: RecordingData) -> bool:
+        with self._lock:
+            if new_data.key in self._recordings:
+                print(f"⚠️ Warning: Episode ID '{new_data.episode_id}' already exists for window {new_data.window}. Ignoring.")
+                return False
+
+            if any(data.grpc_port == new_data.grpc_port for data in self._recordings.values()):
+                print(f"⚠️ Warning: gRPC port {new_data.grpc_port} is already in use. Ignoring.")
+                return False
+
+            to_remove = []
+            while len(self._recordings) >= self.max_size:
+                print(f"🗑️ Capacity reached. Evicting least recently used recording.")
+                to_remove.append(self._recordings.popitem(last=False)[1])
+
+            # Add the new recording data
+            new_data.last_accessed_at = time.monotonic()
+            self._recordings[new_data.key] = new_data
+            print(f"➕ Added recording for episode '{new_data.episode_id}' on port {new_data.grpc_port}.")
+
+        self._cleanup_evicted(to_remove)
+        return True
+
+    def find_by_episode_id(self, episode_id: str, window: EpisodeWindow | None = None) -> RecordingData | None:
+        with self._lock:
+            data = self._recordings.get((episode_id, window))
+            if data is not None:
+                data.last_accessed_at = time.monotonic()
+                self._recordings.move_to_end(data.key)
+            return data
+
+    def contains(self, episode_id: str, window: EpisodeWindow | None = None) -> bool:
+        """
+        Like find_by_episode_id() but without counting as an access.
+        """
+        with self._lock:
+            return (episode_id, window) in self._recordings
 
-    def add(self, new_data: RecordingData):
-        if new_data.episode_id in self._recordings:
-            print(f"⚠️ Warning: Episode ID '{new_data.episode_id}' already exists. Ignoring.")
+    def remove(self, episode_id: str, window: EpisodeWindow | None = None) -> bool:
+        with self._lock:
+            data = self._recordings.pop((episode_id, window), None)
+        if data is None:
+            return False
+        self._cleanup(data)
+        return True
+
+    def list_recordings(self) -> list[RecordingData]:
+        """
+        The recordings, least recently accessed first.
+        """
+        with self._lock:
+            return list(self._recordings.values())
+
+    def is_port_used(self, port: int) -> bool:
+        return self._port_pool.is_used(port)
+
+    def get_logged_bytes(self) -> int:
+        with self._lock:
+            return sum(data.logged_bytes for data in self._recordings.values())
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "recordings": len(self._recordings),
+                "max_recordings": self.max_size,
+                "logged_bytes": sum(data.logged_bytes for data in self._recordings.values()),
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "free_ports": len(self._port_pool),
+            }
+
+    def evict_over_budget(self):
+        """
+        Evicts least recently accessed recordings until the logged bytes fit in max_bytes.
+        The most recently accessed recording is always kept, even if it is larger than the budget.
+        """
+        if self.max_bytes is None:
             return
+        to_remove = []
+        with self._lock:
+            total_bytes = sum(data.logged_bytes for data in self._recordings.values())
+            while total_bytes > self.max_bytes and len(self._recordings) > 1:
+                data = self._recordings.popitem(last=False)[1]
+                total_bytes -= data.logged_bytes
+                to_remove.append(data)
+        if to_remove:
+            print(f"🗑️ Memory budget reached. Evicting {len(to_remove)} least recently used recording(s).")
+        self._cleanup_evicted(to_remove)
 
-        if new_data.grpc_port in self._used_ports:
-            print(f"⚠️ Warning: gRPC port {new_data.grpc_port} is already in use. Ignoring.")
+    def reap_idle(self):
+        """
+        Evicts the recordings that have not been accessed for more than ttl seconds.
+        """
+        if self.ttl is None:
             return
+        deadline = time.monotonic() - self.ttl
+        to_remove = []
+        with self._lock:
+            for key, data in list(self._recordings.items()):
+                if data.last_accessed_at >= deadline:
+                    # the rest was accessed more recently
+                    break
+                to_remove.append(self._recordings.pop(key))
+        if to_remove:
+            print(f"⏳ Reaping {len(to_remove)} idle recording(s).")
+        self._cleanup_evicted(to_remove)
 
-        if len(self._recordings) >= self.max_size:
-            print(f"🗑️ Capacity reached. Evicting oldest recording.")
-            self._evict_oldest()
+    def start_maintenance(self, interval=10.0):
+        """
+        Starts a daemon thread that calls reap_idle() and evict_over_budget() every interval seconds.
+        """
+        if self._maintenance_thread is not None:
+            return
+        self._stop_maintenance.clear()
 
-        # Add the new recording data
-        self._recordings[new_data.episode_id] = new_data
-        self._used_ports.add(new_data.grpc_port)
-        print(f"➕ Added recording for episode '{new_data.episode_id}' on port {new_data.grpc_port}.")
+        def run():
+            while not self._stop_maintenance.wait(interval):
+                try:
+                    self.reap_idle()
+                    self.evict_over_budget()
+                except Exception as e:
+                    print(f"⚠️ Warning: recording maintenance failed: {e}")
 
-    def find_by_episode_id(self, episode_id: str) -> RecordingData | None:
-        return self._recordings.get(episode_id)
+        self._maintenance_thread = threading.Thread(target=run, name="recording-maintenance", daemon=True)
+        self._maintenance_thread.start()
 
-    def is_port_used(self, port: int) -> bool:
-        return port in self._used_ports
+    def stop_maintenance(self):
+        if self._maintenance_thread is None:
+            return
+        self._stop_maintenance.set()
+        self._maintenance_thread.join()
+        self._maintenance_thread = None
 
     def _cleanup(self, data_to_remove: RecordingData):
-        data_to_remove.recording.disconnect()
-        self._used_ports.remove(data_to_remove.grpc_port)
+        try:
+            data_to_remove.recording.disconnect()
+        finally:
+            self._port_pool.release(data_to_remove.grpc_port)
+            for callback in self._eviction_listeners:
+                callback(data_to_remove)
+
+    def _cleanup_evicted(self, evicted):
+        for data in evicted:
+            with self._lock:
+                self.evictions += 1
+            self._cleanup(data)
 
     def cleanup_all(self):
-        if not self._recordings:
+        with self._lock:
+            all_data = list(self._recordings.values())
+            self._recordings.clear()
+
+        if not all_data:
             print("Manager is already empty. No cleanup needed.")
             return
 
-        print(f"✨ Applying cleanup to all {len(self._recordings)} recordings...")
-        all_episode_ids = list(self._recordings.keys())
-        for episode_id in all_episode_ids:
-            if episode_id in self._recordings:
-                data_to_remove = self._recordings.pop(episode_id)
-                self._cleanup(data_to_remove)
-        
-        print("✅ All recordings have been cleaned up and removed.")
+        print(f"✨ Applying cleanup to all {len(all_data)} recordings...")
+        for data_to_remove in all_data:
+            self._cleanup(data_to_remove)
 
-    def _evict_oldest(self):
-        if not self._recordings:
-            return
-        oldest_data = min(self._recordings.values(), key=lambda data: data.created_at)
-        self._recordings.pop(oldest_data.episode_id)
-        self._cleanup(oldest_data)
+        print("✅ All recordings have been cleaned up and removed.")
 
     def __len__(self):
-        return len(self._recordings)
\ No newline at end of file
+        with self._lock:
+            return len(self._recordings)
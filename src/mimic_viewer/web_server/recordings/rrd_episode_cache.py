@@ -0,0 +1,212 @@
+import dataclasses
+from dataclasses import dataclass
+import functools
+import glob
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import mimic_viewer.loggers
+
+_META_FILE_NAME = "meta.json"
+_TMP_PREFIX = ".tmp-"
+
+@functools.lru_cache(maxsize=None)
+def get_logger_version(logger_class):
+    """
+    Hash of the logger class name and of the source of the loggers package, so that any change to
+    the embodiment logger code invalidates the recordings that were produced with the old code.
+    logger_class is a class or its "module.Class" path (see registry.get_logger_class_path), which
+    does not need the logger to be imported.
+    """
+    logger_class_path = logger_class if isinstance(logger_class, str) else f"{logger_class.__module__}.{logger_class.__qualname__}"
+    digest = hashlib.sha256(logger_class_path.encode())
+    loggers_dir = os.path.dirname(inspect.getfile(mimic_viewer.loggers))
+    for path in sorted(glob.glob(os.path.join(loggers_dir, "*.py"))):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def serialize_image_encodings(image_encodings):
+    """
+    topic name -> encoding (see EmbodimentLogger.get_image_encodings) as plain json data, sorted
+    by topic name so that the same encodings always give the same cache key.
+    """
+    return {
+        topic_name: None if encoding is None else {"type": type(encoding).__name__, **dataclasses.asdict(encoding)}
+        for topic_name, encoding in sorted(image_encodings.items())
+    }
+
+@dataclass
+class CachedEpisode:
+    key: str
+    recording_id: str
+    rrd_paths: list[str]
+
+class RrdCacheWriter:
+    """
+    Collects the .rrd files of one ingest in a temporary directory. commit() moves the directory
+    into the cache in a single rename, abort() throws it away.
+    """
+    def __init__(self, cache, key, metadata):
+        self.__cache = cache
+        self.key = key
+        self.metadata = metadata
+        self.directory = tempfile.mkdtemp(prefix=_TMP_PREFIX, dir=cache.directory)
+        self.__done = False
+
+    def get_part_path(self, part_name):
+        return os.path.join(self.directory, f"{part_name}.rrd")
+
+    def commit(self, recording_id):
+        if self.__done:
+            return
+        self.__done = True
+        with open(os.path.join(self.directory, _META_FILE_NAME), "w") as f:
+            json.dump({**self.metadata, "recording_id": recording_id}, f)
+        self.__cache._commit(self.key, self.directory)
+
+    def abort(self):
+        if self.__done:
+            return
+        self.__done = True
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class RrdEpisodeCache:
+    """
+    Directory of fully ingested episodes saved as .rrd files, keyed by episode id, episode url,
+    logger version (see get_logger_version), window and camera encodings. Serving a cached episode only replays the files into
+    a fresh recording, no zarr read, kinematics or serialization happens.
+
+    Every entry is a directory with one or more .rrd parts and a meta.json. A lookup bumps the
+    mtime of the entry, and once the cache is larger than max_bytes the least recently used
+    entries are deleted until it is back under low_watermark * max_bytes.
+    """
+    def __init__(self, directory, max_bytes, low_watermark=0.9):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be a positive integer.")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_watermark = low_watermark
+        self.hits = self.misses = self.evictions = 0
+        self.__lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        # leftovers of ingests that were running when the server stopped
+        for path in glob.glob(os.path.join(self.directory, f"{_TMP_PREFIX}*")):
+            shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def make_key(episode_id, episode_url, logger_version, window=None, image_encodings=None):
+        """
+        image_encodings are the encodings of the logger's cameras, see EmbodimentLogger.get_image_encodings().
+        """
+        key = f"{episode_id}\0{episode_url}\0{logger_version}"
+        if window is not None:
+            # windows of an episode are cached separately, the whole episode keeps its old key
+            key += f"\0{window.start_time}\0{window.end_time}\0{window.start_index}\0{window.end_index}"
+        if image_encodings and any(encoding is not None for encoding in image_encodings.values()):
+            # so are encoded cameras, episodes logged with raw frames keep their old key
+            key += f"\0{json.dumps(serialize_image_encodings(image_encodings), sort_keys=True)}"
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def lookup(self, key) -> CachedEpisode | None:
+        entry_directory = os.path.join(self.directory, key)
+        meta_path = os.path.join(entry_directory, _META_FILE_NAME)
+        try:
+            with open(meta_path) as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            with self.__lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(meta_path)
+        except FileNotFoundError:
+            # evicted since it was read, its .rrd files may be gone too
+            pass
+
+        rrd_paths = sorted(glob.glob(os.path.join(entry_directory, "*.rrd")))
+        with self.__lock:
+            if not rrd_paths:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return CachedEpisode(
+            key=key,
+            recording_id=metadata["recording_id"],
+            rrd_paths=rrd_paths,
+        )
+
+    def begin(self, key, episode_id, episode_url, logger_version, window=None, image_encodings=None) -> RrdCacheWriter:
+        return RrdCacheWriter(
+            self,
+            key,
+            {
+                "episode_id": episode_id,
+                "episode_url": episode_url,
+                "logger_version": logger_version,
+                "window": dataclasses.asdict(window) if window is not None else None,
+                "image_encodings": serialize_image_encodings(image_encodings) if image_encodings is not None else None,
+            },
+        )
+
+    def purge_stale(self, logger_versions):
+        """
+        Deletes every entry that was produced by a logger version not in logger_versions.
+        """
+        for _, entry_directory, _ in self.__scan_entries():
+            try:
+                with open(os.path.join(entry_directory, _META_FILE_NAME)) as f:
+                    logger_version = json.load(f).get("logger_version")
+            except (FileNotFoundError, json.JSONDecodeError):
+                logger_version = None
+            if logger_version not in logger_versions:
+                shutil.rmtree(entry_directory, ignore_errors=True)
+
+    def get_stats(self):
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+            }
+
+    def evict(self):
+        with self.__lock:
+            entries = sorted(self.__scan_entries())
+            current_bytes = sum(size for _, _, size in entries)
+            target_bytes = self.max_bytes * self.low_watermark
+            for _, entry_directory, size in entries:
+                if current_bytes <= target_bytes:
+                    break
+                shutil.rmtree(entry_directory, ignore_errors=True)
+                self.evictions += 1
+                current_bytes -= size
+
+    def _commit(self, key, tmp_directory):
+        entry_directory = os.path.join(self.directory, key)
+        try:
+            os.rename(tmp_directory, entry_directory)
+        except OSError:
+            # another ingest of the same episode committed first
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+        self.evict()
+
+    def __scan_entries(self):
+        """
+        Yields (last access time, path, size in bytes) of every committed entry.
+        """
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.startswith(_TMP_PREFIX):
+                continue
+            try:
+                last_access = os.stat(os.path.join(entry.path, _META_FILE_NAME)).st_mtime
+                size = sum(part.stat().st_size for part in os.scandir(entry.path))
+            except FileNotFoundError:
+                continue
+            yield last_access, entry.path, size
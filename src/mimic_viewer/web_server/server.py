@@ -1,38 +1,204 @@
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
-from fastapi.responses import JSONResponse
-from mimic_viewer.data_sources.zarr_point_loader import ZarrPointLoader
+from fastapi.responses import JSONResponse, PlainTextResponse
+from mimic_viewer.data_sources.timestamp_index import EpisodeWindow
+from mimic_viewer.ingestion.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, IngestionScheduler
 import uvicorn
+import asyncio
+import dataclasses
+import functools
 import os
-import random
+import threading
+import time
 
-import zarr
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 import rerun as rr
-from ament_index_python.packages import get_package_share_directory
 
-from mimic_viewer.loggers.bimanual_049_logger import Bimanual049Logger
-from mimic_viewer.loggers.single_hand_048_logger import SingleHand048Logger
+from mimic_viewer.loggers.image_encoding import ImageEncoding
+from mimic_viewer.loggers.registry import EMBODIMENT_LOGGERS, get_logger_class, get_logger_class_path, get_logger_name_for_embodiment
+from mimic_viewer.loggers.video_encoding import VideoEncoding
+from mimic_viewer.metrics import EPISODE_INGEST_ROWS, EPISODE_INGEST_SECONDS, REGISTRY
+from mimic_viewer.tracing import Trace, span
 from mimic_viewer.web_server.database.database import db_manager
+from mimic_viewer.web_server.database.metadata_cache import EpisodeMetadataCache
 from mimic_viewer.web_server.recordings.recording_manager import RecordingData, RecordingDataManager
+from mimic_viewer.web_server.recordings.rrd_episode_cache import RrdEpisodeCache, get_logger_version
+from mimic_viewer.web_server.single_flight import SingleFlight
 
 load_dotenv()
 
 MAX_RECORDINGS = int(os.environ["MAX_RECORDINGS"])
 SERVER_IP_ADDRESS = os.environ["SERVER_IP_ADDRESS"]
 DEBUG=bool(os.environ["DEBUG"])
-recording_data_manager = RecordingDataManager(max_size=MAX_RECORDINGS)
+# recordings are evicted least recently used first once the data logged into them goes over MAX_RECORDINGS_BYTES,
+# and once nobody opened them for RECORDING_TTL_SECONDS. 0 disables either limit
+MAX_RECORDINGS_BYTES = int(os.environ.get("MAX_RECORDINGS_BYTES", "0")) or None
+RECORDING_TTL_SECONDS = float(os.environ.get("RECORDING_TTL_SECONDS", "0")) or None
+# ports the gRPC servers of the recordings are served on, 9000 is taken by the web viewer
+GRPC_PORT_MIN = int(os.environ.get("GRPC_PORT_MIN", "9001"))
+GRPC_PORT_MAX = int(os.environ.get("GRPC_PORT_MAX", "10000"))
+# "batch" sends every topic in send_columns chunks, "point" replays the episode one sample at a time,
+# "progressive" sends a decimated and downscaled preview of the cameras before their full frames
+INGEST_MODE = os.environ.get("INGEST_MODE", "batch")
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "1000"))
+# per topic byte budget of a batch, batches are then made of whole zarr chunks. 0 uses INGEST_BATCH_SIZE rows for every topic
+INGEST_MAX_BATCH_BYTES = int(os.environ.get("INGEST_MAX_BATCH_BYTES", str(64 * 1024 * 1024))) or None
+# chunk reads of all recordings share this pool, every topic keeps up to INGEST_READAHEAD reads in flight
+INGEST_PREFETCH_WORKERS = int(os.environ.get("INGEST_PREFETCH_WORKERS", "16"))
+INGEST_READAHEAD = int(os.environ.get("INGEST_READAHEAD", "2"))
+# number of processes an episode's topics are split across in batch mode, 0 ingests in the server process
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "0"))
+# number of episodes ingested at the same time, the other requests wait in a priority queue
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "2"))
+# zarr chunks downloaded from the bucket are kept on disk, shared by all recordings and ingest workers
+CHUNK_CACHE_DIR = os.environ.get("CHUNK_CACHE_DIR")
+CHUNK_CACHE_MAX_BYTES = int(os.environ.get("CHUNK_CACHE_MAX_BYTES", str(20 * 1024**3)))
+# fully ingested episodes are saved as .rrd files and replayed on the next request
+RRD_CACHE_DIR = os.environ.get("RRD_CACHE_DIR")
+RRD_CACHE_MAX_BYTES = int(os.environ.get("RRD_CACHE_MAX_BYTES", str(50 * 1024**3)))
+# progressive mode: the preview keeps every PROGRESSIVE_DECIMATION-th camera frame, shrunk by PROGRESSIVE_DOWNSCALE
+PROGRESSIVE_DECIMATION = int(os.environ.get("PROGRESSIVE_DECIMATION", "10"))
+PROGRESSIVE_DOWNSCALE = int(os.environ.get("PROGRESSIVE_DOWNSCALE", "2"))
+# camera frames are sent as "jpeg" or "png" images or as "h264" videos cut in segments of VIDEO_SEGMENT_FRAMES frames
+# when set, raw otherwise. Wrist cameras can be shrunk more than the fixed one
+IMAGE_ENCODING = os.environ.get("IMAGE_ENCODING") or None
+IMAGE_ENCODING_QUALITY = int(os.environ.get("IMAGE_ENCODING_QUALITY", "85"))
+IMAGE_ENCODING_SCALE = float(os.environ.get("IMAGE_ENCODING_SCALE", "1.0"))
+IMAGE_ENCODING_WRIST_SCALE = float(os.environ.get("IMAGE_ENCODING_WRIST_SCALE", str(IMAGE_ENCODING_SCALE)))
+IMAGE_ENCODING_WORKERS = int(os.environ.get("IMAGE_ENCODING_WORKERS", "8"))
+VIDEO_CRF = int(os.environ.get("VIDEO_CRF", "23"))
+VIDEO_SEGMENT_FRAMES = int(os.environ.get("VIDEO_SEGMENT_FRAMES", "300"))
+# episode infos are read from the database once and kept for EPISODE_CACHE_TTL_SECONDS, episodes that
+# do not exist for EPISODE_CACHE_NEGATIVE_TTL_SECONDS
+EPISODE_CACHE_SIZE = int(os.environ.get("EPISODE_CACHE_SIZE", "10000"))
+EPISODE_CACHE_TTL_SECONDS = float(os.environ.get("EPISODE_CACHE_TTL_SECONDS", "3600"))
+EPISODE_CACHE_NEGATIVE_TTL_SECONDS = float(os.environ.get("EPISODE_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+# every ingest is traced and saved to this directory as a Chrome trace (open it in https://ui.perfetto.dev), unset disables tracing
+TRACE_DIR = os.environ.get("TRACE_DIR") or None
+if IMAGE_ENCODING not in (None, "jpeg", "png", "h264"):
+    raise ValueError(f"Unknown IMAGE_ENCODING '{IMAGE_ENCODING}', expected 'jpeg', 'png' or 'h264'.")
+if INGEST_MODE not in ("batch", "point", "progressive"):
+    raise ValueError(f"Unknown INGEST_MODE '{INGEST_MODE}', expected 'batch', 'point' or 'progressive'.")
+chunk_read_executor = ThreadPoolExecutor(max_workers=INGEST_PREFETCH_WORKERS, thread_name_prefix="chunk-read") if INGEST_PREFETCH_WORKERS > 0 else None
+image_encoding_executor = ThreadPoolExecutor(max_workers=IMAGE_ENCODING_WORKERS, thread_name_prefix="image-encode") if IMAGE_ENCODING in ("jpeg", "png") and IMAGE_ENCODING_WORKERS > 0 else None
+# zarr, the loggers and their dependencies are imported when they are first needed, so that the
+# server starts answering requests quickly
+ingest_process_pool = None
+if INGEST_WORKERS > 0:
+    from mimic_viewer.ingestion.sharded_ingest import create_ingest_process_pool
+    ingest_process_pool = create_ingest_process_pool(INGEST_WORKERS)
+chunk_cache = None
+if CHUNK_CACHE_DIR:
+    from mimic_viewer.data_sources.chunk_cache import DiskChunkCache
+    chunk_cache = DiskChunkCache(CHUNK_CACHE_DIR, CHUNK_CACHE_MAX_BYTES)
+rrd_cache = RrdEpisodeCache(RRD_CACHE_DIR, RRD_CACHE_MAX_BYTES) if RRD_CACHE_DIR else None
+if rrd_cache is not None:
+    rrd_cache.purge_stale({get_logger_version(get_logger_class_path(logger_name)) for logger_name in EMBODIMENT_LOGGERS})
+recording_data_manager = RecordingDataManager(
+    max_size=MAX_RECORDINGS,
+    max_bytes=MAX_RECORDINGS_BYTES,
+    ttl=RECORDING_TTL_SECONDS,
+    ports=range(GRPC_PORT_MIN, GRPC_PORT_MAX + 1),
+)
+ingestion_scheduler = IngestionScheduler(num_workers=INGEST_CONCURRENCY)
+episode_metadata_cache = EpisodeMetadataCache(
+    db_manager,
+    max_size=EPISODE_CACHE_SIZE,
+    ttl=EPISODE_CACHE_TTL_SECONDS,
+    negative_ttl=EPISODE_CACHE_NEGATIVE_TTL_SECONDS,
+)
+
+def cancel_ingest_of_removed_recording(recording_data):
+    if recording_data.ingest_job is not None:
+        recording_data.ingest_job.cancel()
+
+recording_data_manager.add_eviction_listener(cancel_ingest_of_removed_recording)
+RECORDINGS = REGISTRY.gauge("mimic_viewer_recordings", "Recordings currently served.")
+MAX_RECORDINGS_GAUGE = REGISTRY.gauge("mimic_viewer_max_recordings", "MAX_RECORDINGS.")
+RECORDINGS_LOGGED_BYTES = REGISTRY.gauge("mimic_viewer_recordings_logged_bytes", "Bytes logged into all served recordings.")
+RECORDING_EVICTIONS = REGISTRY.gauge("mimic_viewer_recording_evictions", "Recordings evicted for capacity, memory budget or ttl since startup.")
+FREE_GRPC_PORTS = REGISTRY.gauge("mimic_viewer_free_grpc_ports", "Ports left to serve new recordings on.")
+RECORDING_ROWS_LOGGED = REGISTRY.gauge("mimic_viewer_recording_rows_logged", "Rows logged so far by the ingest of each served recording.", ["episode_id", "grpc_port", "status"])
+RECORDING_BYTES = REGISTRY.gauge("mimic_viewer_recording_logged_bytes", "Bytes logged into each served recording.", ["episode_id", "grpc_port"])
+INGEST_JOBS = REGISTRY.gauge("mimic_viewer_ingest_jobs", "Ingest jobs known to the scheduler, by status. queued is the depth of the queue.", ["status"])
+EPISODE_SETUPS_IN_FLIGHT = REGISTRY.gauge("mimic_viewer_episode_setups_in_flight", "/log_episode and /warm_up setups running.")
+EPISODE_CACHE = REGISTRY.gauge("mimic_viewer_episode_cache", "Episode metadata cache statistics.", ["stat"])
+DB_POOL = REGISTRY.gauge("mimic_viewer_db_pool", "Database connection pool statistics.", ["stat"])
+CHUNK_CACHE = REGISTRY.gauge("mimic_viewer_chunk_cache", "Disk chunk cache statistics.", ["stat"])
+
+def collect_server_metrics():
+    stats = recording_data_manager.get_stats()
+    RECORDINGS.set(stats["recordings"])
+    MAX_RECORDINGS_GAUGE.set(stats["max_recordings"])
+    RECORDINGS_LOGGED_BYTES.set(stats["logged_bytes"])
+    RECORDING_EVICTIONS.set(stats["evictions"])
+    FREE_GRPC_PORTS.set(stats["free_ports"])
+
+    RECORDING_ROWS_LOGGED.clear()
+    RECORDING_BYTES.clear()
+    for recording_data in recording_data_manager.list_recordings():
+        job = recording_data.ingest_job
+        if job is not None:
+            RECORDING_ROWS_LOGGED.set(job.rows_logged, episode_id=recording_data.episode_id, grpc_port=recording_data.grpc_port, status=job.status)
+        RECORDING_BYTES.set(recording_data.logged_bytes, episode_id=recording_data.episode_id, grpc_port=recording_data.grpc_port)
+
+    for status, count in ingestion_scheduler.get_stats().items():
+        INGEST_JOBS.set(count, status=status)
+    EPISODE_SETUPS_IN_FLIGHT.set(len(episode_setups))
+    for stat, value in episode_metadata_cache.get_stats().items():
+        if isinstance(value, (int, float)):
+            EPISODE_CACHE.set(value, stat=stat)
+    for stat, value in db_manager.pool.get_stats().items():
+        DB_POOL.set(value, stat=stat)
+    if chunk_cache is not None:
+        for stat, value in chunk_cache.get_stats().items():
+            CHUNK_CACHE.set(value, stat=stat)
+
+REGISTRY.add_collector(collect_server_metrics)
+# in flight setups of /log_episode, keyed by (episode id, window)
+episode_setups = SingleFlight()
+# running /warm_up tasks, referenced here so that they are not garbage collected
+warm_up_tasks = set()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global recording_data_manager
     # startup
     rr.serve_web_viewer(web_port=9000, open_browser=False)
+    threading.Thread(target=preload_ingest_modules, name="preload", daemon=True).start()
+    recording_data_manager.start_maintenance()
+    await db_manager.open()
     yield
     # cleanup
+    recording_data_manager.stop_maintenance()
     recording_data_manager.cleanup_all()
+    ingestion_scheduler.shutdown()
+    db_manager.close()
+    if chunk_read_executor is not None:
+        chunk_read_executor.shutdown(wait=False, cancel_futures=True)
+    if image_encoding_executor is not None:
+        image_encoding_executor.shutdown(wait=False, cancel_futures=True)
+    if ingest_process_pool is not None:
+        ingest_process_pool.shutdown(wait=False, cancel_futures=True)
+
+def preload_ingest_modules():
+    """
+    Imports the loggers and the zarr loaders in the background after startup, so that the first
+    /log_episode does not pay for it.
+    """
+    for logger_name in EMBODIMENT_LOGGERS:
+        get_logger_class(logger_name)
+    import mimic_viewer.data_sources.zarr_batch_loader
+    import mimic_viewer.data_sources.chunk_cache
+
+@functools.cache
+def get_urdfs_path():
+    from ament_index_python.packages import get_package_share_directory
+
+    return f"{get_package_share_directory('mimic_viz')}/urdf"
 
 def get_rerun_json_response(port):
     return JSONResponse(
@@ -51,33 +217,209 @@ app.add_middleware(
     allow_headers=["*"],         # Allows all request headers
 )
 
-def log_episode_background_task(logger, episode_url):
-    logger.log_text("Loading zarr data...", level=rr.TextLogLevel.WARN)
-    root = zarr.open(episode_url)
-    data_loader = ZarrPointLoader(root).get_data()
-    for index, data in enumerate(data_loader):
-        logger.log_data_point(data)
-    logger.log_text("All data has been logged!")
+def get_image_encoding(topic_name):
+    scale = IMAGE_ENCODING_WRIST_SCALE if "wrist" in topic_name else IMAGE_ENCODING_SCALE
+    if IMAGE_ENCODING == "h264":
+        return VideoEncoding(crf=VIDEO_CRF, segment_frames=VIDEO_SEGMENT_FRAMES, scale=scale)
+    return ImageEncoding(IMAGE_ENCODING, IMAGE_ENCODING_QUALITY, scale)
+
+def create_logger(logger_name):
+    """
+    Logger of an embodiment with the image encodings of the configuration. Its recording is set
+    once the episode is known not to be cached.
+    """
+    logger = get_logger_class(logger_name)(get_urdfs_path(), None)
+    if IMAGE_ENCODING:
+        logger.set_image_encodings({
+            topic_name: get_image_encoding(topic_name) for topic_name in logger.get_image_encodings()
+        })
+        logger.image_encoding_executor = image_encoding_executor
+    return logger
+
+def log_episode_background_task(job, logger, episode_url, grpc_url, rrd_cache_writer=None, window=None):
+    """
+    Runs on the ingestion scheduler. With TRACE_DIR set, the ingest is traced and the trace saved
+    there, its path is added to the status of the job.
+    """
+    if TRACE_DIR is None:
+        ingest_episode(job, logger, episode_url, grpc_url, rrd_cache_writer, window)
+        return
+
+    episode_id = job.metadata.get("episode_id")
+    trace = Trace(episode_id=episode_id, job_id=job.job_id, episode_url=episode_url, mode=INGEST_MODE, window=job.metadata.get("window"))
+    try:
+        with trace.activate(episode=episode_id), span("ingest_episode", mode=INGEST_MODE):
+            ingest_episode(job, logger, episode_url, grpc_url, rrd_cache_writer, window)
+    finally:
+        trace_path = os.path.join(TRACE_DIR, f"episode_{episode_id}_job_{job.job_id}.json")
+        try:
+            trace.save(trace_path)
+            job.metadata["trace_path"] = trace_path
+        except OSError as e:
+            print(f"⚠️ Warning: could not save the trace of job {job.job_id}: {e}")
+
+def ingest_episode(job, logger, episode_url, grpc_url, rrd_cache_writer=None, window=None):
+    """
+    job is checked between batches, so the ingest stops soon after the recording is evicted.
+    """
+    from mimic_viewer.data_sources.chunk_cache import open_zarr
+    from mimic_viewer.data_sources.zarr_batch_loader import ZarrBatchLoader
+    from mimic_viewer.data_sources.zarr_point_loader import ZarrPointLoader
+    from mimic_viewer.ingestion.progressive_ingest import ingest_episode_progressive
+    from mimic_viewer.ingestion.sharded_ingest import ingest_episode_sharded
+
+    try:
+        logger.log_text("Loading zarr data...", level=rr.TextLogLevel.WARN)
+        start_time = time.perf_counter()
+
+        num_rows = 0
+        if INGEST_MODE == "batch" and ingest_process_pool is not None:
+            num_rows = ingest_episode_sharded(
+                ingest_process_pool,
+                episode_url,
+                logger,
+                grpc_url,
+                INGEST_WORKERS,
+                INGEST_BATCH_SIZE,
+                max_batch_bytes=INGEST_MAX_BATCH_BYTES,
+                chunk_cache=chunk_cache,
+                rrd_directory=rrd_cache_writer.directory if rrd_cache_writer is not None else None,
+                window=window,
+                job=job,
+            )
+        elif INGEST_MODE == "batch":
+            root = open_zarr(episode_url, chunk_cache)
+            for data_batches in ZarrBatchLoader(root, chunk_read_executor, INGEST_READAHEAD, window=window).get_data(INGEST_BATCH_SIZE, max_batch_bytes=INGEST_MAX_BATCH_BYTES):
+                job.raise_if_cancelled()
+                logger.log_data_batches(data_batches)
+                num_rows += sum(len(topic_batch["timestamps"]) for topic_batch in data_batches)
+                job.rows_logged = num_rows
+        elif INGEST_MODE == "progressive":
+            num_rows = ingest_episode_progressive(
+                open_zarr(episode_url, chunk_cache),
+                logger,
+                INGEST_BATCH_SIZE,
+                max_batch_bytes=INGEST_MAX_BATCH_BYTES,
+                executor=chunk_read_executor,
+                readahead=INGEST_READAHEAD,
+                window=window,
+                decimation=PROGRESSIVE_DECIMATION,
+                downscale=PROGRESSIVE_DOWNSCALE,
+                job=job,
+            )
+        else:
+            root = open_zarr(episode_url, chunk_cache)
+            for data in ZarrPointLoader(root, chunk_read_executor, INGEST_READAHEAD, window=window).get_data():
+                job.raise_if_cancelled()
+                logger.log_data_point(data)
+                num_rows += 1
+                job.rows_logged = num_rows
+
+        # logs the open video segments
+        logger.flush()
+        elapsed = time.perf_counter() - start_time
+        EPISODE_INGEST_SECONDS.observe(elapsed, mode=INGEST_MODE)
+        EPISODE_INGEST_ROWS.inc(num_rows, mode=INGEST_MODE)
+        logger.log_text(f"All data has been logged! {num_rows} rows in {elapsed:.1f}s ({num_rows / max(elapsed, 1e-9):.0f} rows/s, {INGEST_MODE} ingest)")
+    except BaseException:
+        abort_ingest(job, logger, episode_url, grpc_url, rrd_cache_writer, window)
+        raise
+
+    if rrd_cache_writer is not None:
+        # the ingest recording tees into the cache file, disconnecting it closes the file
+        logger.recording.flush(blocking=True)
+        logger.recording.disconnect()
+        rrd_cache_writer.commit(logger.recording.get_recording_id())
+
+def abort_ingest(job, logger, episode_url, grpc_url, rrd_cache_writer=None, window=None):
+    """
+    Releases what an ingest was handed when it fails, or when it is cancelled before it started
+    (e.g. its recording was evicted while the job was queued).
+    """
+    if rrd_cache_writer is not None:
+        # the tee stream is not owned by the recording manager
+        logger.recording.disconnect()
+        rrd_cache_writer.abort()
+
+def replay_cached_episode_background_task(job, recording, cached_episode):
+    start_time = time.perf_counter()
+    for rrd_path in cached_episode.rrd_paths:
+        job.raise_if_cancelled()
+        recording.log_file_from_path(rrd_path)
+    recording.flush(blocking=True)
+    elapsed = time.perf_counter() - start_time
+    recording.log("logs", rr.TextLog(f"Replayed cached episode in {elapsed:.1f}s"))
+
+def add_recording_data(recording_data):
+    if not recording_data_manager.add(recording_data):
+        # the caller cleans up the recording, the manager did not take it
+        raise HTTPException(status_code=409, detail="The episode is already being logged")
 
 @app.api_route("/", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def blocked_endpoint():
     raise HTTPException(status_code=403)
 
 @app.get("/log_episode")
-async def log_episode(episode_id: int, background_tasks: BackgroundTasks):
+async def log_episode(
+    episode_id: int,
+    start_time: float | None = None,
+    end_time: float | None = None,
+    start_index: int | None = None,
+    end_index: int | None = None,
+):
+    """
+    start_time and end_time are in seconds on the "time" timeline of the viewer (both inclusive),
+    start_index and end_index are row indices applied to every topic (end exclusive). Only the
+    zarr chunks covering the window are read. Without any of them the whole episode is logged.
+    """
     global recording_data_manager
+    window = None
+    if any(bound is not None for bound in (start_time, end_time, start_index, end_index)):
+        window = EpisodeWindow(
+            start_time=round(start_time * 1e9) if start_time is not None else None,
+            end_time=round(end_time * 1e9) if end_time is not None else None,
+            start_index=start_index,
+            end_index=end_index,
+        )
+
     if DEBUG:
         print("trying to find episode data")
-    episode_recording_data = recording_data_manager.find_by_episode_id(episode_id)
+    episode_recording_data = recording_data_manager.find_by_episode_id(episode_id, window)
 
     if episode_recording_data is not None:
         if DEBUG:
             print("episode is currently logged")
+        prioritize_ingest(episode_recording_data)
         return get_rerun_json_response(episode_recording_data.grpc_port)
- 
+
+    # concurrent requests for the same episode wait for the same setup and get the same port
+    grpc_port = await episode_setups.run((episode_id, window), setup_episode_recording, episode_id, window)
+    # the setup may have been started by /warm_up
+    episode_recording_data = recording_data_manager.find_by_episode_id(episode_id, window)
+    if episode_recording_data is not None:
+        prioritize_ingest(episode_recording_data)
+    return get_rerun_json_response(grpc_port)
+
+def prioritize_ingest(recording_data):
+    """
+    Somebody is waiting for the recording, its ingest runs before the warm-ups if it is still queued.
+    """
+    if recording_data.ingest_job is not None:
+        ingestion_scheduler.set_priority(recording_data.ingest_job, PRIORITY_INTERACTIVE)
+
+async def setup_episode_recording(episode_id, window, priority=PRIORITY_INTERACTIVE):
+    """
+    Creates, serves and registers the recording of an episode, and queues its ingest with priority.
+    Returns the gRPC port the recording is served on.
+    """
+    # a request that arrived just before this setup started may have finished it already
+    episode_recording_data = recording_data_manager.find_by_episode_id(episode_id, window)
+    if episode_recording_data is not None:
+        return episode_recording_data.grpc_port
+
     if DEBUG:
         print("getting information about the episode from the db")
-    episode_info = await db_manager.get_episode_info(episode_id)
+    episode_info = await episode_metadata_cache.get_episode_info(episode_id)
     if not episode_info:
         raise HTTPException(status_code=404, detail="Episode not found")
     
@@ -85,40 +427,207 @@ async def log_episode(episode_id: int, background_tasks: BackgroundTasks):
     if not episode_url:
         raise HTTPException(status_code=404, detail="Episode URL not found")
     
-    # Determine if it's bimanual based on embodiment name
-    embodiment = episode_info.get("embodiment_name", "")
-    embodiment = embodiment or "bimanual" # handle embodiment being none
-    is_bimanual = "bimanual" in embodiment.lower()
+    logger_name = get_logger_name_for_embodiment(episode_info.get("embodiment_name"))
+    if DEBUG:
+        print("creating a new logger")
+    # created before the cache lookup, the encodings of its cameras are part of the cache key
+    logger = create_logger(logger_name)
+
+    rrd_cache_key = None
+    cached_episode = None
+    if rrd_cache is not None:
+        logger_version = get_logger_version(get_logger_class_path(logger_name))
+        image_encodings = logger.get_image_encodings()
+        rrd_cache_key = rrd_cache.make_key(episode_id, episode_url, logger_version, window, image_encodings)
+        cached_episode = rrd_cache.lookup(rrd_cache_key)
 
     if DEBUG:
         print("starting a new recording")
-    new_recording = rr.RecordingStream(f"viewing_{episode_id}")
-    
-    grpc_port = 0
-    while grpc_port < 9000 or recording_data_manager.is_port_used(grpc_port):
-        grpc_port = random.randint(9001, 10000)
-    
-    new_recording.serve_grpc(grpc_port=grpc_port, server_memory_limit="90%")
-    
-    if DEBUG:
-        print("creating a new logger")
-    pkg_share_path = get_package_share_directory("mimic_viz")
-    urdfs_path = f"{pkg_share_path}/urdf"
-    logger = Bimanual049Logger(urdfs_path, new_recording) if is_bimanual else SingleHand048Logger(urdfs_path, new_recording)
-    logger.reset()
-    logger.log_text(episode_url)
-
-    new_episode_recording_data = RecordingData(
-        episode_id=episode_id,
-        recording=new_recording,
-        grpc_port=grpc_port
+    # a cached episode is replayed under the recording id it was saved with
+    new_recording = rr.RecordingStream(
+        f"viewing_{episode_id}",
+        recording_id=cached_episode.recording_id if cached_episode is not None else None,
     )
+    
+    try:
+        grpc_port = recording_data_manager.acquire_port()
+    except RuntimeError:
+        raise HTTPException(status_code=503, detail="No port left to serve the recording")
+    try:
+        grpc_url = new_recording.serve_grpc(grpc_port=grpc_port, server_memory_limit="90%")
+    except BaseException:
+        recording_data_manager.release_port(grpc_port)
+        raise
 
-    recording_data_manager.add(new_episode_recording_data)
+    # the recording is served but nobody knows about it until it is added, a failure before
+    # that gives back everything it holds
+    rrd_cache_writer = None
+    ingest_recording = new_recording
+    ingest_job = None
+    try:
+        new_episode_recording_data = RecordingData(
+            episode_id=episode_id,
+            recording=new_recording,
+            grpc_port=grpc_port,
+            window=window,
+        )
+        job_metadata = {
+            "episode_id": episode_id,
+            "window": dataclasses.asdict(window) if window is not None else None,
+            "grpc_port": grpc_port,
+        }
 
-    background_tasks.add_task(log_episode_background_task, logger, episode_url)
+        if cached_episode is not None:
+            if DEBUG:
+                print("replaying the episode from the rrd cache")
+            new_episode_recording_data.cached_bytes = sum(os.path.getsize(rrd_path) for rrd_path in cached_episode.rrd_paths)
+            new_episode_recording_data.ingest_job = ingest_job = ingestion_scheduler.submit(
+                replay_cached_episode_background_task,
+                new_recording,
+                cached_episode,
+                priority=priority,
+                description=f"replay episode {episode_id}",
+                metadata=job_metadata,
+            )
+            add_recording_data(new_episode_recording_data)
+            return grpc_port
 
-    return get_rerun_json_response(grpc_port)
+        if rrd_cache is not None:
+            # log through a second stream with the same recording id that sends to the served
+            # recording and to the cache file at the same time
+            rrd_cache_writer = rrd_cache.begin(rrd_cache_key, episode_id, episode_url, logger_version, window, image_encodings)
+            ingest_recording = rr.RecordingStream(f"viewing_{episode_id}", recording_id=new_recording.get_recording_id(), send_properties=False)
+            ingest_recording.set_sinks(rr.GrpcSink(grpc_url), rr.FileSink(rrd_cache_writer.get_part_path("main")))
+
+        logger.recording = ingest_recording
+        logger.reset()
+        logger.log_text(episode_url)
+
+        new_episode_recording_data.logger = logger
+        new_episode_recording_data.ingest_job = ingest_job = ingestion_scheduler.submit(
+            log_episode_background_task,
+            logger,
+            episode_url,
+            grpc_url,
+            rrd_cache_writer,
+            window,
+            priority=priority,
+            description=f"ingest episode {episode_id}",
+            metadata=job_metadata,
+            cleanup=abort_ingest,
+        )
+        add_recording_data(new_episode_recording_data)
+
+        return grpc_port
+    except BaseException:
+        # the cancelled ingest aborts the writer too when it is dequeued (see abort_ingest), aborting twice does nothing
+        if ingest_job is not None:
+            ingest_job.cancel()
+        if rrd_cache_writer is not None:
+            rrd_cache_writer.abort()
+        if ingest_recording is not new_recording:
+            ingest_recording.disconnect()
+        new_recording.disconnect()
+        recording_data_manager.release_port(grpc_port)
+        raise
+
+@app.post("/warm_up")
+async def warm_up(
+    episode_ids: list[int] | None = Query(None),
+    subdataset: str | None = None,
+    limit: int | None = None,
+):
+    """
+    Prepares the recordings of episode_ids, or of the episodes of subdataset in episode id order,
+    so that the next /log_episode of one of them finds it already logged. Their ingests run after
+    every interactive one. Warm-ups never evict a recording: only as many episodes as there are
+    free recording slots are prepared, and the warm-up stops once the logged bytes of the
+    recordings reach MAX_RECORDINGS_BYTES.
+    """
+    if subdataset is not None:
+        episode_infos = await episode_metadata_cache.get_subdataset_episode_infos(subdataset)
+        if not episode_infos:
+            raise HTTPException(status_code=404, detail="Subdataset not found")
+        requested_ids = list(episode_infos)
+    elif episode_ids:
+        episode_infos = await episode_metadata_cache.get_episode_infos(episode_ids)
+        requested_ids = list(dict.fromkeys(episode_ids))
+    else:
+        raise HTTPException(status_code=400, detail="Either episode_ids or subdataset is required")
+    if limit is not None:
+        requested_ids = requested_ids[:limit]
+
+    not_found = [episode_id for episode_id in requested_ids if episode_id not in episode_infos]
+    already_logged = [episode_id for episode_id in requested_ids if episode_id in episode_infos and recording_data_manager.contains(episode_id)]
+    to_warm = [episode_id for episode_id in requested_ids if episode_id in episode_infos and episode_id not in already_logged]
+    free_slots = max(MAX_RECORDINGS - len(recording_data_manager), 0)
+    to_warm, skipped = to_warm[:free_slots], to_warm[free_slots:]
+
+    if to_warm:
+        task = asyncio.create_task(warm_up_episodes(to_warm))
+        warm_up_tasks.add(task)
+        task.add_done_callback(warm_up_tasks.discard)
+
+    return JSONResponse(status_code=202, content={
+        "warming": to_warm,
+        "already_logged": already_logged,
+        "skipped": skipped,
+        "not_found": not_found,
+    })
+
+async def warm_up_episodes(episode_ids):
+    for episode_id in episode_ids:
+        # interactive requests may have taken the free slots or filled the memory budget since
+        if len(recording_data_manager) >= MAX_RECORDINGS:
+            print(f"⚠️ Warning: no free recording left, warm-up stopped before episode {episode_id}.")
+            return
+        if MAX_RECORDINGS_BYTES is not None and recording_data_manager.get_logged_bytes() >= MAX_RECORDINGS_BYTES:
+            print(f"⚠️ Warning: memory budget reached, warm-up stopped before episode {episode_id}.")
+            return
+        if recording_data_manager.contains(episode_id):
+            continue
+        try:
+            await episode_setups.run((episode_id, None), setup_episode_recording, episode_id, None, PRIORITY_BACKGROUND)
+        except HTTPException as e:
+            print(f"⚠️ Warning: could not warm up episode {episode_id}: {e.detail}")
+        except Exception as e:
+            print(f"⚠️ Warning: could not warm up episode {episode_id}: {e}")
+        # let the requests that came in meanwhile through between two setups
+        await asyncio.sleep(0)
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs")
+async def list_jobs():
+    jobs = ingestion_scheduler.list_jobs()
+    return JSONResponse(content={
+        "stats": ingestion_scheduler.get_stats(),
+        "jobs": [job.to_dict() for job in sorted(jobs, key=lambda job: job.job_id, reverse=True)],
+    })
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: int):
+    job = ingestion_scheduler.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job.to_dict())
+
+@app.get("/episode_cache")
+async def get_episode_cache_stats():
+    return JSONResponse(content=episode_metadata_cache.get_stats())
+
+@app.delete("/episode_cache")
+async def invalidate_episode_cache(episode_id: int | None = None):
+    """
+    Forgets the cached info of episode_id, or of every episode without it.
+    """
+    episode_metadata_cache.invalidate(episode_id)
+    return JSONResponse(content=episode_metadata_cache.get_stats())
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,25 @@
+import asyncio
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key: the first run(key, ...) starts the coroutine in its own
+    task, every call with the same key made while it is running awaits that same task and gets
+    its result (or its exception). Since the work runs in a task, a caller that goes away (e.g. a
+    client that disconnects) does not cancel it for the others.
+    """
+    def __init__(self):
+        self.__tasks: dict[object, asyncio.Task] = {}
+
+    async def run(self, key, coroutine_function, *args, **kwargs):
+        task = self.__tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_function(*args, **kwargs))
+            self.__tasks[key] = task
+            task.add_done_callback(lambda _: self.__tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def is_running(self, key):
+        return key in self.__tasks
+
+    def __len__(self):
+        return len(self.__tasks)
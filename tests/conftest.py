@@ -0,0 +1,20 @@
+import pytest
+
+from synthetic_episode import write_episode, write_urdfs
+
+# small enough for the point ingest to be quick, with several chunks per topic and chunks of
+# different sizes for the cameras and the other topics
+EPISODE_PARAMETERS = {"duration": 1.0, "image_shape": (24, 32), "image_chunk_rows": 7, "chunk_rows": 32}
+
+@pytest.fixture(scope="session")
+def episode(tmp_path_factory):
+    """
+    (path, topic specs) of a synthetic bimanual episode, see benchmarks/synthetic_episode.py.
+    """
+    path = str(tmp_path_factory.mktemp("episodes") / "bimanual.zarr")
+    specs = write_episode(path, "bimanual", **EPISODE_PARAMETERS)
+    return path, specs
+
+@pytest.fixture(scope="session")
+def urdf_path(tmp_path_factory):
+    return write_urdfs(str(tmp_path_factory.mktemp("urdfs")))
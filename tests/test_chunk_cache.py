@@ -0,0 +1,80 @@
+import os
+import pickle
+
+import pytest
+
+from mimic_viewer.data_sources.chunk_cache import DiskChunkCache
+
+@pytest.fixture
+def directory_scans(monkeypatch):
+    scans = []
+    scandir = os.scandir
+
+    def counting_scandir(path="."):
+        scans.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+    return scans
+
+def test_entries_are_read_back(tmp_path):
+    cache = DiskChunkCache(str(tmp_path), 1000)
+    assert cache.get("episode", "joints/0") is None
+    cache.put("episode", "joints/0", b"abc")
+    assert cache.get("episode", "joints/0") == b"abc"
+    assert cache.get("other_episode", "joints/0") is None
+    assert cache.get_stats()["hits"] == 1 and cache.get_stats()["misses"] == 2
+
+def test_overwrites_are_counted_once(tmp_path):
+    cache = DiskChunkCache(str(tmp_path), 1000)
+    for _ in range(5):
+        cache.put("episode", "joints/0", b"x" * 100)
+    assert cache.current_bytes == 100
+    cache.put("episode", "joints/0", b"x" * 40)
+    assert cache.current_bytes == 40
+    assert cache.get_stats()["evictions"] == 0
+
+def test_existing_entries_are_counted(tmp_path):
+    DiskChunkCache(str(tmp_path), 1000).put("episode", "joints/0", b"x" * 100)
+    cache = DiskChunkCache(str(tmp_path), 1000)
+    cache.put("episode", "joints/1", b"x" * 50)
+    assert cache.current_bytes == 150
+
+def test_opening_and_unpickling_do_not_scan(tmp_path, directory_scans):
+    cache = DiskChunkCache(str(tmp_path), 1000)
+    cache.put("episode", "joints/0", b"x" * 100)
+    directory_scans.clear()
+
+    worker_cache = pickle.loads(pickle.dumps(cache))
+    assert worker_cache.get("episode", "joints/0") == b"x" * 100
+    assert directory_scans == []
+    # the size is scanned once, on the first write
+    worker_cache.put("episode", "joints/1", b"x" * 10)
+    worker_cache.put("episode", "joints/2", b"x" * 10)
+    assert directory_scans.count(str(tmp_path)) == 1
+    assert worker_cache.current_bytes == 120
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskChunkCache(str(tmp_path), 300, low_watermark=0.5)
+    for index in range(3):
+        cache.put("episode", f"joints/{index}", b"x" * 100)
+        # mtimes of entries written in the same tick would tie
+        os.utime(cache._DiskChunkCache__entry_path("episode", f"joints/{index}"), (index, index))
+    cache.put("episode", "joints/3", b"x" * 100)
+
+    assert cache.current_bytes <= 150
+    assert cache.get("episode", "joints/0") is None
+    assert cache.get("episode", "joints/3") == b"x" * 100
+
+def test_entries_evicted_after_they_were_read_are_hits(tmp_path, monkeypatch):
+    cache = DiskChunkCache(str(tmp_path), 1000)
+    cache.put("episode", "joints/0", b"abc")
+
+    def evict_then_utime(path, *args, **kwargs):
+        # another process evicts the entry between the read and the mtime bump
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evict_then_utime)
+    assert cache.get("episode", "joints/0") == b"abc"
+    assert cache.get_stats()["hits"] == 1 and cache.get_stats()["misses"] == 0
@@ -0,0 +1,172 @@
+import asyncio
+import importlib
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from mimic_viewer.web_server.database.connection_pool import ConnectionPool
+
+class Connections:
+    """
+    connect() of the pools under test, keeps every sqlite connection it opened.
+    """
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self):
+        connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.opened.append(connection)
+        return connection
+
+def is_closed(connection):
+    try:
+        connection.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+def test_fill_opens_min_size_connections():
+    connections = Connections()
+    pool = ConnectionPool(connections, min_size=2, max_size=4)
+    pool.fill()
+    assert len(connections.opened) == 2
+    assert pool.get_stats()["size"] == 2 and pool.get_stats()["idle"] == 2
+
+    # idle connections are reused before new ones are opened
+    with pool.connection(), pool.connection():
+        pass
+    assert len(connections.opened) == 2
+    pool.close()
+    assert all(is_closed(connection) for connection in connections.opened)
+
+def test_exhausted_pool_blocks_until_a_connection_is_returned():
+    pool = ConnectionPool(Connections(), min_size=0, max_size=2, timeout=5)
+    first = pool.connection()
+    first.__enter__()
+    with pool.connection():
+        acquired = threading.Event()
+
+        def wait_for_connection():
+            with pool.connection():
+                acquired.set()
+
+        waiter = threading.Thread(target=wait_for_connection)
+        waiter.start()
+        assert not acquired.wait(0.1)
+        first.__exit__(None, None, None)
+        assert acquired.wait(5)
+        waiter.join()
+    assert pool.get_stats()["size"] == 2
+
+def test_exhausted_pool_times_out():
+    pool = ConnectionPool(Connections(), min_size=0, max_size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(TimeoutError):
+            with pool.connection():
+                pass
+
+def test_connections_are_recycled_after_max_lifetime():
+    connections = Connections()
+    pool = ConnectionPool(connections, min_size=0, max_size=1, max_lifetime=0.05)
+    with pool.connection() as connection:
+        first = connection
+    time.sleep(0.1)
+    with pool.connection() as connection:
+        assert connection is not first
+    assert is_closed(first)
+    assert pool.get_stats()["recycled"] == 1
+    assert pool.get_stats()["size"] == 1
+
+def test_connection_is_dropped_when_its_user_raises():
+    connections = Connections()
+    pool = ConnectionPool(connections, min_size=0, max_size=1)
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connection() as connection:
+            connection.execute("SELECT * FROM missing_table")
+    assert is_closed(connections.opened[0])
+    assert pool.get_stats()["size"] == 0
+
+    # the slot is free again
+    with pool.connection() as connection:
+        assert connection is connections.opened[1]
+
+def test_broken_idle_connection_fails_its_health_check():
+    connections = Connections()
+    pool = ConnectionPool(connections, min_size=0, max_size=1, health_check_interval=0)
+    with pool.connection() as connection:
+        pass
+    # e.g. the server closed it while it was idle
+    connection.close()
+    time.sleep(0.01)
+    with pool.connection() as connection:
+        assert connection is connections.opened[1]
+    assert pool.get_stats()["failed_health_checks"] == 1
+
+def test_invalid_sizes_are_rejected():
+    for min_size, max_size in [(0, 0), (-1, 1), (3, 2)]:
+        with pytest.raises(ValueError):
+            ConnectionPool(Connections(), min_size=min_size, max_size=max_size)
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    pytest.importorskip("dotenv")
+    path = str(tmp_path / "episodes.sqlite")
+    # the module creates its global manager from the environment when it is imported
+    monkeypatch.setenv("DB_BACKEND", "sqlite")
+    monkeypatch.setenv("DB_SQLITE_PATH", path)
+    database = importlib.import_module("mimic_viewer.web_server.database.database")
+    database.create_sqlite_database(path)
+    with sqlite3.connect(path) as connection:
+        connection.executescript("""
+            INSERT INTO embodiments VALUES (1, 'bimanual_049'), (2, 'single_hand_048');
+            INSERT INTO teleop_modes VALUES (1, 'glove');
+            INSERT INTO subdatasets VALUES (1, 'pick', 'picking things', 1, 1), (2, 'place', NULL, 2, NULL);
+            INSERT INTO episodes VALUES
+                (3, 'gs://bucket/3.zarr', '2024-01-03', 1),
+                (1, 'gs://bucket/1.zarr', '2024-01-01', 1),
+                (2, 'gs://bucket/2.zarr', '2024-01-02', 2),
+                (4, 'gs://bucket/4.zarr', '2024-01-04', NULL);
+        """)
+    connection.close()
+    manager = database.DatabaseManager.from_sqlite(path, min_size=1, max_size=2)
+    yield manager
+    manager.close()
+
+def test_database_manager_queries(database):
+    async def run():
+        await database.open()
+        return await asyncio.gather(
+            database.get_episode_url(2),
+            database.get_episode_url(99),
+            database.get_episode_info(1),
+            database.get_episode_info(4),
+            database.get_episode_info(99),
+            database.get_episode_infos([2, 99, 3]),
+            database.get_episode_infos([]),
+            database.get_subdataset_episode_infos("pick"),
+            database.get_subdataset_episode_infos("missing"),
+        )
+
+    url, missing_url, info, info_without_subdataset, missing_info, infos, no_infos, subdataset_infos, missing_subdataset = asyncio.run(run())
+    assert url == "gs://bucket/2.zarr"
+    assert missing_url is None
+    assert info == {
+        "id": 1,
+        "url": "gs://bucket/1.zarr",
+        "uploaded_at": "2024-01-01",
+        "subdataset_name": "pick",
+        "subdataset_description": "picking things",
+        "embodiment_name": "bimanual_049",
+        "teleop_mode_name": "glove",
+    }
+    assert info_without_subdataset["subdataset_name"] is None and info_without_subdataset["embodiment_name"] is None
+    assert missing_info is None
+    assert sorted(infos) == [2, 3]
+    assert infos[2]["embodiment_name"] == "single_hand_048"
+    assert no_infos == {}
+    # in episode id order
+    assert list(subdataset_infos) == [1, 3]
+    assert missing_subdataset == {}
+    assert database.pool.get_stats()["size"] <= 2
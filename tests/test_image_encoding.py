@@ -0,0 +1,24 @@
+import io
+
+import numpy as np
+import pytest
+
+from mimic_viewer.loggers.image_encoding import ImageEncoding, encode_image, encode_images
+
+Image = pytest.importorskip("PIL.Image")
+
+def decode(data):
+    return np.asarray(Image.open(io.BytesIO(data)))
+
+def test_png_keeps_the_pixels_of_bgr_images():
+    image = np.random.default_rng(0).integers(0, 256, (24, 32, 3), dtype=np.uint8)
+    np.testing.assert_array_equal(decode(encode_image(image, ImageEncoding("png"))), image[..., ::-1])
+
+@pytest.mark.parametrize("format", ["jpeg", "png"])
+def test_scale_resizes_the_frames(format):
+    images = np.full((3, 24, 32, 3), 128, dtype=np.uint8)
+    for data in encode_images(images, ImageEncoding(format, scale=0.5)):
+        decoded = decode(data)
+        assert decoded.shape == (12, 16, 3)
+        # bilinear resampling of a flat image keeps its color
+        assert np.abs(decoded.astype(int) - 128).max() <= 2
@@ -0,0 +1,33 @@
+import importlib.util
+import os
+
+import pytest
+
+from import_budget import BUDGETS, LAZY_MODULES, check_module, get_env
+
+# slower machines (e.g. shared CI runners) can scale the budgets up
+SCALE = float(os.environ.get("IMPORT_BUDGET_SCALE", "1.0"))
+
+# the server needs the web extra (pip install ".[web]")
+REQUIRED_PACKAGES = {
+    "mimic_viewer.web_server.server": ["fastapi", "uvicorn", "dotenv"],
+}
+
+@pytest.fixture(scope="module")
+def env():
+    return get_env()
+
+@pytest.mark.parametrize("module", list(BUDGETS))
+def test_import_budget(module, env):
+    missing = [name for name in REQUIRED_PACKAGES.get(module, []) if importlib.util.find_spec(name) is None]
+    if missing:
+        pytest.skip(f"{module} needs {', '.join(missing)}")
+
+    result = check_module(module, env, repeat=3, scale=SCALE)
+    assert result["status"] != "error", result["error"]
+    assert result["eagerly_imported"] == []
+    assert result["ms"] <= result["budget_ms"]
+
+def test_heavy_dependencies_are_checked_everywhere():
+    for module, (_, forbidden) in BUDGETS.items():
+        assert set(LAZY_MODULES) <= set(forbidden), module
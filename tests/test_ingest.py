@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import rerun as rr
+import zarr
+
+from mimic_viewer.data_sources.chunk_cache import open_zarr
+from mimic_viewer.data_sources.zarr_batch_loader import ZarrBatchLoader
+from mimic_viewer.data_sources.zarr_point_loader import ZarrPointLoader
+from mimic_viewer.ingestion.progressive_ingest import ingest_episode_progressive
+from mimic_viewer.loggers.registry import get_logger_class
+
+class RecordedIngest:
+    """
+    Logger of the bimanual embodiment logging into a memory recording, that also keeps the last
+    value logged at every (topic, timestamp), i.e. what the viewer shows once the ingest is done.
+    """
+    def __init__(self, urdf_path):
+        self.recording = rr.RecordingStream("mimic_viewer_test")
+        self.memory_recording = self.recording.memory_recording()
+        self.logger = get_logger_class("bimanual_049")(urdf_path, self.recording)
+        self.logger.reset()
+        self.rows = {}
+        self.logged_rows = 0
+
+        log_data_point = self.logger.log_data_point
+        log_data_batches = self.logger.log_data_batches
+
+        def recording_log_data_point(data_point):
+            name, timestamp, value = data_point
+            self.record(name, [timestamp], [value])
+            log_data_point(data_point)
+
+        def recording_log_data_batches(data_batches):
+            for topic_batch in data_batches:
+                self.record(topic_batch["topic_name"], topic_batch["timestamps"], topic_batch["values"])
+            log_data_batches(data_batches)
+
+        self.logger.log_data_point = recording_log_data_point
+        self.logger.log_data_batches = recording_log_data_batches
+
+    def record(self, name, timestamps, values):
+        topic_rows = self.rows.setdefault(name, {})
+        for timestamp, value in zip(timestamps, values):
+            topic_rows[int(timestamp)] = np.asarray(value)
+        self.logged_rows += len(timestamps)
+
+    def get_logged_bytes(self):
+        self.logger.close()
+        self.recording.flush(blocking=True)
+        return len(self.memory_recording.drain_as_bytes())
+
+def assert_shows_episode(ingest, path):
+    root = zarr.open(path, mode="r")
+    names = [name for name in root.array_keys() if not name.endswith("_timestamps")]
+    assert sorted(ingest.rows) == sorted(names)
+    for name in names:
+        timestamps = root[f"{name}_timestamps"][:]
+        topic_rows = sorted(ingest.rows[name].items())
+        assert [timestamp for timestamp, _ in topic_rows] == timestamps.tolist(), name
+        np.testing.assert_array_equal(np.stack([value for _, value in topic_rows]), root[name][:], err_msg=name)
+    assert not ingest.logger.unknown_topic_counts
+
+@pytest.fixture
+def batch_ingest(episode, urdf_path):
+    ingest = RecordedIngest(urdf_path)
+    for data_batches in ZarrBatchLoader(open_zarr(episode[0])).get_data(50):
+        ingest.logger.log_data_batches(data_batches)
+    return ingest
+
+@pytest.mark.parametrize("coalescing", [False, True])
+def test_point_ingest_logs_the_same_rows_as_the_batch_ingest(episode, urdf_path, batch_ingest, coalescing):
+    path, _ = episode
+    ingest = RecordedIngest(urdf_path)
+    if coalescing:
+        ingest.logger.enable_coalescing(max_rows=16)
+    for data_point in ZarrPointLoader(open_zarr(path)).get_data():
+        ingest.logger.log_data_point(data_point)
+
+    assert_shows_episode(batch_ingest, path)
+    assert_shows_episode(ingest, path)
+    assert ingest.logger.logged_bytes == batch_ingest.logger.logged_bytes
+    assert ingest.get_logged_bytes() > 0 and batch_ingest.get_logged_bytes() > 0
+
+@pytest.mark.parametrize("downscale", [1, 2])
+def test_progressive_ingest_ends_up_with_the_full_episode(episode, urdf_path, batch_ingest, downscale):
+    path, _ = episode
+    ingest = RecordedIngest(urdf_path)
+    with ThreadPoolExecutor(2) as executor:
+        num_rows = ingest_episode_progressive(open_zarr(path), ingest.logger, 50, executor=executor, decimation=4, downscale=downscale)
+
+    assert num_rows == batch_ingest.logged_rows
+    # the preview frames are either replaced at full resolution or already were
+    assert_shows_episode(ingest, path)
+    # every 4th frame of the cameras is logged twice when the preview is downscaled, once otherwise
+    camera_lengths = [len(zarr.open(path, mode="r")[name]) for name in ingest.rows if name.startswith("cameras__")]
+    assert camera_lengths
+    expected_preview_rows = sum((length + 3) // 4 for length in camera_lengths) if downscale > 1 else 0
+    assert ingest.logged_rows - num_rows == expected_preview_rows
+    assert ingest.get_logged_bytes() > 0
@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation as R
+from urdf_parser_py.urdf import Joint, Pose
+
+from mimic_viewer.loggers.utils import HandJointsLoggingInfo, compute_joint_quaternions, log_hand_joints_batch
+
+class JointPaths:
+    """
+    The part of a URDFLogger the kinematic plan uses.
+    """
+    def joint_entity_path(self, joint):
+        return f"/hand/{joint.name}"
+
+def create_joints(rng, num_joints):
+    joints = []
+    for index in range(num_joints):
+        # unit, scaled and missing (x by default) axes
+        axis = [None, [0.0, 0.0, 1.0], list(rng.normal(size=3)), list(rng.normal(size=3) * 3)][index % 4]
+        origin = Pose(xyz=list(rng.normal(size=3) * 0.05), rpy=list(rng.uniform(-math.pi, math.pi, 3)))
+        joints.append(Joint(name=f"joint_{index}", joint_type="revolute", axis=axis, origin=origin))
+    return joints
+
+def get_reference_rotation(hand_joint_logging_info, joint, command):
+    """
+    The rotation of a joint as the embodiment loggers computed it before the plan, one joint and one command at a time.
+    """
+    if hand_joint_logging_info.in_radians:
+        command = command * 180 / math.pi
+    adjusted_command = (command + hand_joint_logging_info.joint_to_offset_map.get(joint, 0.0)) * math.pi / 180
+    axis = np.array(joint.axis if joint.axis is not None else [1.0, 0.0, 0.0])
+    return R.from_euler("xyz", joint.origin.rpy) * R.from_rotvec(axis * adjusted_command)
+
+@pytest.fixture
+def hand_joint_logging_info(request):
+    rng = np.random.default_rng(1)
+    joints = create_joints(rng, 8)
+    followers = create_joints(rng, 2)
+    return HandJointsLoggingInfo(
+        "hand_joints",
+        JointPaths(),
+        joints,
+        joint_to_offset_map={joints[1]: 30.0, joints[4]: -12.5},
+        joint_to_follower_joint_map={joints[2]: followers[0], joints[7]: followers[1]},
+        in_radians=request.param,
+    )
+
+@pytest.mark.parametrize("hand_joint_logging_info", [False, True], indirect=True)
+def test_plan_matches_the_per_joint_rotations(hand_joint_logging_info):
+    rng = np.random.default_rng(2)
+    scale = 1.0 if hand_joint_logging_info.in_radians else 180 / math.pi
+    values = rng.uniform(-math.pi, math.pi, (20, 8)) * scale
+    quaternions = compute_joint_quaternions(hand_joint_logging_info.kinematic_plan, values)
+    assert quaternions.shape == (8, 20, 4)
+
+    for joint_index, joint in enumerate(hand_joint_logging_info.actionable_joints):
+        expected = [get_reference_rotation(hand_joint_logging_info, joint, command).as_matrix() for command in values[:, joint_index]]
+        np.testing.assert_allclose(R.from_quat(quaternions[joint_index]).as_matrix(), expected, atol=1e-9, err_msg=joint.name)
+        # only the rotation is computed, the quaternions are unit ones
+        np.testing.assert_allclose(np.linalg.norm(quaternions[joint_index], axis=1), 1.0)
+
+class RecordedColumns:
+    """
+    Stands in for a RecordingStream and keeps the entities send_columns() was called with.
+    """
+    def __init__(self):
+        self.entities = []
+
+    def send_columns(self, entity, indexes, columns):
+        self.entities.append(entity)
+
+@pytest.mark.parametrize("hand_joint_logging_info", [False], indirect=True)
+def test_followers_get_the_rotation_of_their_joint(hand_joint_logging_info):
+    plan = hand_joint_logging_info.kinematic_plan
+    assert plan.follower_entity_paths == ["/hand/joint_0", "/hand/joint_1"]
+    assert plan.follower_sources.tolist() == [2, 7]
+    np.testing.assert_array_equal(
+        plan.follower_translations,
+        [hand_joint_logging_info.joint_to_follower_joint_map[hand_joint_logging_info.actionable_joints[i]].origin.xyz for i in (2, 7)],
+    )
+
+    recording = RecordedColumns()
+    log_hand_joints_batch(hand_joint_logging_info, np.zeros((3, 8)), np.arange(3), recording)
+    assert recording.entities == plan.entity_paths + plan.follower_entity_paths
+    with pytest.raises(ValueError):
+        log_hand_joints_batch(hand_joint_logging_info, np.zeros((3, 7)), np.arange(3), recording)
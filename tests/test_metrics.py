@@ -0,0 +1,89 @@
+import threading
+
+import numpy as np
+import pytest
+import rerun as rr
+
+from mimic_viewer.loggers.registry import get_logger_class
+from mimic_viewer.metrics import REGISTRY, UNKNOWN_TOPIC_BATCHES, MetricsRegistry
+
+def test_unknown_topics_are_counted_in_a_single_series(urdf_path):
+    recording = rr.RecordingStream("mimic_viewer_test")
+    recording.memory_recording()
+    logger = get_logger_class("bimanual_049")(urdf_path, recording)
+    unknown_batches = UNKNOWN_TOPIC_BATCHES.get()
+
+    logger.log_data_batches([
+        {"topic_name": f"episode_specific_{index}", "values": np.zeros((2, 3)), "timestamps": np.arange(2)}
+        for index in range(3)
+    ])
+    logger.log_data_point(("episode_specific_3", 0, np.zeros(3)))
+
+    assert UNKNOWN_TOPIC_BATCHES.get() == unknown_batches + 4
+    assert logger.unknown_topic_counts == {f"episode_specific_{index}": 1 for index in range(4)}
+    series = [line for line in REGISTRY.render().splitlines() if line.startswith("mimic_viewer_unknown_topic_batches_total")]
+    assert series == [f"mimic_viewer_unknown_topic_batches_total {unknown_batches + 4}"]
+
+def test_render_follows_the_prometheus_text_format():
+    registry = MetricsRegistry()
+    rows = registry.counter("rows_total", "Rows read.", ["topic"])
+    in_flight = registry.gauge("in_flight", "Reads in flight.")
+    seconds = registry.histogram("read_seconds", "Read time.", ["loader"], buckets=(0.5, 0.1))
+    rows.inc(3, topic="b")
+    rows.inc(topic='a "quoted"\\ topic\n')
+    rows.inc(2, topic="b")
+    in_flight.set(2.0)
+    for value in (0.05, 0.1, 0.3, 7.0):
+        seconds.observe(value, loader="zarr")
+
+    assert registry.render() == "\n".join([
+        "# HELP rows_total Rows read.",
+        "# TYPE rows_total counter",
+        'rows_total{topic="a \\"quoted\\"\\\\ topic\\n"} 1',
+        'rows_total{topic="b"} 5',
+        "# HELP in_flight Reads in flight.",
+        "# TYPE in_flight gauge",
+        "in_flight 2",
+        "# HELP read_seconds Read time.",
+        "# TYPE read_seconds histogram",
+        # cumulative, the upper bounds are inclusive
+        'read_seconds_bucket{loader="zarr",le="0.1"} 2',
+        'read_seconds_bucket{loader="zarr",le="0.5"} 3',
+        'read_seconds_bucket{loader="zarr",le="+Inf"} 4',
+        'read_seconds_sum{loader="zarr"} 7.45',
+        'read_seconds_count{loader="zarr"} 4',
+    ]) + "\n"
+
+def test_labels_and_names_are_checked():
+    registry = MetricsRegistry()
+    rows = registry.counter("rows_total", "Rows read.", ["topic"])
+    with pytest.raises(ValueError):
+        rows.inc()
+    with pytest.raises(ValueError):
+        rows.inc(topic="a", loader="zarr")
+    with pytest.raises(ValueError):
+        registry.gauge("rows_total", "Rows read.")
+
+def test_collectors_run_before_every_render_and_failures_are_skipped():
+    registry = MetricsRegistry()
+    recordings = registry.gauge("recordings", "Recordings served.")
+    state = {"recordings": 1}
+
+    def failing_collector():
+        raise RuntimeError("database is gone")
+
+    registry.add_collector(failing_collector)
+    registry.add_collector(lambda: recordings.set(state["recordings"]))
+    assert "recordings 1\n" in registry.render()
+    state["recordings"] = 2
+    assert "recordings 2\n" in registry.render()
+
+def test_counters_are_thread_safe():
+    registry = MetricsRegistry()
+    rows = registry.counter("rows_total", "Rows read.")
+    threads = [threading.Thread(target=lambda: [rows.inc() for _ in range(10000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert rows.get() == 40000
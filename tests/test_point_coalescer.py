@@ -0,0 +1,83 @@
+import threading
+import time
+
+import numpy as np
+
+from mimic_viewer.loggers.embodiment_logger import EmbodimentLogger
+from mimic_viewer.loggers.point_coalescer import PointCoalescer
+from mimic_viewer.loggers.utils import EffortsLoggingInfo
+
+def test_batches_are_sent_when_full_and_on_flush():
+    batches = []
+    coalescer = PointCoalescer(lambda *batch: batches.append(batch), max_rows=3, max_latency=None)
+    for timestamp in range(4):
+        coalescer.add("joints", timestamp, np.full(2, timestamp))
+    assert [(topic_name, list(timestamps)) for topic_name, _, timestamps in batches] == [("joints", [0, 1, 2])]
+    assert batches[0][1].shape == (3, 2)
+
+    coalescer.close()
+    assert [list(timestamps) for _, _, timestamps in batches] == [[0, 1, 2], [3]]
+
+def test_latency_thread_sends_quiet_topics():
+    sent = threading.Event()
+    coalescer = PointCoalescer(lambda *batch: sent.set(), max_rows=100, max_latency=0.01)
+    coalescer.add("joints", 0, np.zeros(2))
+    assert sent.wait(5)
+    coalescer.close()
+
+class SlowOnLatencyThread:
+    """
+    A value that is slow to stack on the latency thread, so the caller thread can fill and send
+    the next batch of the topic while the latency thread still holds the previous one.
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def __array__(self, dtype=None, copy=None):
+        if threading.current_thread().name == "point-coalescer":
+            time.sleep(1e-3)
+        return np.array([self.value], dtype=dtype)
+
+def test_batches_of_a_topic_are_sent_in_order():
+    sent = {"joints": [], "camera": []}
+    coalescer = PointCoalescer(lambda topic_name, values, timestamps: sent[topic_name].append(timestamps), max_rows=4, max_latency=1e-3)
+    for timestamp in range(600):
+        coalescer.add("joints" if timestamp % 3 else "camera", timestamp, SlowOnLatencyThread(timestamp))
+        if timestamp % 7 == 0:
+            # lets buffers expire now and then
+            time.sleep(2e-3)
+    coalescer.close()
+
+    for topic_name, batches in sent.items():
+        timestamps = np.concatenate(batches)
+        assert len(timestamps) == (400 if topic_name == "joints" else 200)
+        assert np.all(np.diff(timestamps) > 0), topic_name
+
+def test_dispatch_table_is_built_once_across_threads():
+    logger = EmbodimentLogger("unused", None)
+    logger.efforts_logging_infos = [EffortsLoggingInfo(f"topic_{i}", f"efforts/{i}", str) for i in range(50)]
+    builds = []
+    build = logger._build_dispatch_table
+
+    def counting_build():
+        builds.append(threading.current_thread().name)
+        # widens the window in which another thread would start a second build
+        time.sleep(0.01)
+        build()
+
+    logger._build_dispatch_table = counting_build
+    errors = []
+
+    def look_up():
+        try:
+            assert logger.get_batch_handlers("topic_7") is not None
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=look_up) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(builds) == 1
@@ -0,0 +1,130 @@
+import socket
+import time
+from types import SimpleNamespace
+
+import pytest
+import rerun as rr
+
+from mimic_viewer.web_server.recordings.port_pool import PortPool
+from mimic_viewer.web_server.recordings.recording_manager import RecordingData, RecordingDataManager
+
+PORTS = range(19401, 19405)
+
+def create_recording_data(manager, episode_id, logged_bytes=0, window=None):
+    recording = rr.RecordingStream("mimic_viewer_test")
+    recording.memory_recording()
+    logger = SimpleNamespace(logged_bytes=logged_bytes)
+    return RecordingData(episode_id, recording, manager.acquire_port(), window=window, logger=logger)
+
+@pytest.fixture
+def manager():
+    manager = RecordingDataManager(3, max_bytes=1000, ttl=60, ports=PORTS)
+    manager.removed = []
+    manager.add_eviction_listener(lambda recording_data: manager.removed.append(recording_data.episode_id))
+    yield manager
+    manager.cleanup_all()
+
+def test_least_recently_accessed_recording_is_evicted_at_capacity(manager):
+    for episode_id in range(3):
+        assert manager.add(create_recording_data(manager, episode_id))
+    # 0 becomes the most recently accessed one, contains() does not count as an access
+    assert manager.find_by_episode_id(0) is not None
+    assert manager.contains(1)
+
+    new_data = create_recording_data(manager, 3)
+    assert manager.add(new_data)
+    assert [data.episode_id for data in manager.list_recordings()] == [2, 0, 3]
+    assert manager.removed == [1]
+    assert manager.evictions == 1
+    # the port of the evicted recording is the last one handed out again
+    assert manager.get_stats()["free_ports"] == 1
+
+def test_windows_are_recordings_of_their_own(manager):
+    assert manager.add(create_recording_data(manager, 1))
+    window_data = create_recording_data(manager, 1, window=(0, 10))
+    assert manager.add(window_data)
+    assert manager.find_by_episode_id(1, (0, 10)) is window_data
+    duplicate = create_recording_data(manager, 1, window=(0, 10))
+    assert not manager.add(duplicate)
+    # a recording that is not added keeps its port until the caller releases it
+    assert manager.is_port_used(duplicate.grpc_port)
+    manager.release_port(duplicate.grpc_port)
+    assert not manager.is_port_used(duplicate.grpc_port)
+
+def test_recordings_over_the_byte_budget_are_evicted(manager):
+    recordings = [create_recording_data(manager, episode_id, logged_bytes=300) for episode_id in range(3)]
+    for recording_data in recordings:
+        assert manager.add(recording_data)
+    manager.evict_over_budget()
+    assert manager.removed == []
+
+    # bytes keep being logged after the recordings are added, replayed recordings count their .rrd files
+    recordings[2].logger.logged_bytes = 500
+    recordings[1].cached_bytes = 100
+    assert manager.get_logged_bytes() == 1200
+    manager.evict_over_budget()
+    assert manager.removed == [0]
+    assert manager.get_stats()["logged_bytes"] == 900
+
+    # the most recently accessed recording is kept even if it is larger than the budget
+    recordings[2].logger.logged_bytes = 5000
+    manager.evict_over_budget()
+    assert manager.removed == [0, 1]
+    assert [data.episode_id for data in manager.list_recordings()] == [2]
+    assert manager.get_stats()["free_ports"] == len(PORTS) - 1
+
+def test_idle_recordings_are_reaped(manager):
+    recordings = [create_recording_data(manager, episode_id) for episode_id in range(3)]
+    for recording_data in recordings:
+        assert manager.add(recording_data)
+    recordings[0].last_accessed_at -= 120
+    recordings[1].last_accessed_at -= 120
+    # accessing a recording keeps it alive
+    manager.find_by_episode_id(1)
+    manager.reap_idle()
+    assert manager.removed == [0]
+    assert manager.list_recordings() == [recordings[2], recordings[1]]
+    assert not manager.is_port_used(recordings[0].grpc_port)
+
+def test_maintenance_thread_applies_the_budget(manager):
+    for episode_id in range(2):
+        assert manager.add(create_recording_data(manager, episode_id, logged_bytes=600))
+    manager.start_maintenance(interval=0.01)
+    try:
+        deadline = time.monotonic() + 10
+        while manager.removed != [0]:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        manager.stop_maintenance()
+
+def test_remove_and_cleanup_all_give_every_port_back(manager):
+    for episode_id in range(3):
+        assert manager.add(create_recording_data(manager, episode_id))
+    assert manager.remove(1)
+    assert not manager.remove(1)
+    manager.cleanup_all()
+    assert len(manager) == 0
+    assert manager.removed == [1, 0, 2]
+    assert manager.get_stats()["free_ports"] == len(PORTS)
+    assert manager.evictions == 0
+
+def test_port_pool_skips_ports_bound_by_other_processes():
+    pool = PortPool(PORTS, host="127.0.0.1")
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", PORTS[0]))
+        assert pool.acquire() == PORTS[1]
+        # the bound port is retried after the others
+        assert [pool.acquire() for _ in range(2)] == [PORTS[2], PORTS[3]]
+        with pytest.raises(RuntimeError):
+            pool.acquire()
+    assert pool.acquire() == PORTS[0]
+    assert len(pool) == 0
+
+    pool.release(PORTS[2])
+    # releasing twice, or releasing a port that was not handed out, does nothing
+    pool.release(PORTS[2])
+    pool.release(1)
+    assert len(pool) == 1
+    assert not pool.is_used(PORTS[2])
+    assert pool.acquire() == PORTS[2]
@@ -0,0 +1,86 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from mimic_viewer.data_sources.timestamp_index import EpisodeWindow
+from mimic_viewer.loggers.image_encoding import ImageEncoding
+from mimic_viewer.loggers.video_encoding import VideoEncoding
+from mimic_viewer.web_server.recordings.rrd_episode_cache import RrdEpisodeCache
+
+RAW = {"cameras__fixed_0": None, "cameras__wrist_top": None}
+
+def make_key(window=None, image_encodings=None):
+    return RrdEpisodeCache.make_key(7, "gs://bucket/episode.zarr", "0123456789abcdef", window, image_encodings)
+
+def test_raw_frames_keep_the_key_without_encodings():
+    assert make_key(image_encodings=RAW) == make_key()
+    assert make_key(EpisodeWindow(start_index=10), RAW) == make_key(EpisodeWindow(start_index=10))
+
+def test_every_encoding_setting_changes_the_key():
+    encodings = [
+        ImageEncoding("jpeg", 85, 1.0),
+        ImageEncoding("jpeg", 60, 1.0),
+        ImageEncoding("jpeg", 85, 0.5),
+        ImageEncoding("png"),
+        VideoEncoding(crf=23, segment_frames=300),
+        VideoEncoding(crf=28, segment_frames=300),
+        VideoEncoding(crf=23, segment_frames=100),
+    ]
+    keys = {make_key(image_encodings={**RAW, "cameras__wrist_top": encoding}) for encoding in encodings}
+    assert len(keys) == len(encodings)
+    assert make_key() not in keys
+
+def test_key_does_not_depend_on_the_topic_order():
+    encodings = {"cameras__fixed_0": ImageEncoding("jpeg"), "cameras__wrist_top": ImageEncoding("jpeg", scale=0.5)}
+    assert make_key(image_encodings=encodings) == make_key(image_encodings=dict(reversed(encodings.items())))
+
+def test_encodings_are_saved_with_the_entry(tmp_path):
+    cache = RrdEpisodeCache(str(tmp_path), 10**9)
+    encodings = {"cameras__wrist_top": VideoEncoding(crf=28), "cameras__fixed_0": None}
+    key = make_key(image_encodings=encodings)
+    writer = cache.begin(key, 7, "gs://bucket/episode.zarr", "0123456789abcdef", image_encodings=encodings)
+    with open(writer.get_part_path("main"), "wb") as f:
+        f.write(b"rrd")
+    writer.commit("recording")
+
+    assert cache.lookup(key).recording_id == "recording"
+    with open(os.path.join(str(tmp_path), key, "meta.json")) as f:
+        metadata = json.load(f)
+    assert list(metadata["image_encodings"]) == ["cameras__fixed_0", "cameras__wrist_top"]
+    assert metadata["image_encodings"]["cameras__fixed_0"] is None
+    assert metadata["image_encodings"]["cameras__wrist_top"] == {
+        "type": "VideoEncoding", "codec": "libx264", "crf": 28, "preset": "veryfast", "segment_frames": 300, "scale": 1.0,
+    }
+
+def write_entry(cache, key):
+    writer = cache.begin(key, 7, "gs://bucket/episode.zarr", "0123456789abcdef")
+    with open(writer.get_part_path("main"), "wb") as f:
+        f.write(b"rrd")
+    writer.commit("recording")
+
+@pytest.mark.parametrize("evicted_files", ["meta", "entry"])
+def test_lookup_of_an_entry_evicted_after_its_metadata_was_read(tmp_path, monkeypatch, evicted_files):
+    cache = RrdEpisodeCache(str(tmp_path), 10**9)
+    key = make_key()
+    write_entry(cache, key)
+
+    def evict_then_utime(path, *args, **kwargs):
+        # another process evicts the entry between the read and the mtime bump
+        if evicted_files == "meta":
+            os.remove(path)
+        else:
+            shutil.rmtree(os.path.dirname(path))
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evict_then_utime)
+    cached_episode = cache.lookup(key)
+    if evicted_files == "meta":
+        # the .rrd files are still there to be replayed
+        assert cached_episode.recording_id == "recording"
+        assert cached_episode.rrd_paths == [os.path.join(str(tmp_path), key, "main.rrd")]
+        assert cache.get_stats()["hits"] == 1
+    else:
+        assert cached_episode is None
+        assert cache.get_stats()["misses"] == 1
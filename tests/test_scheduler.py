@@ -0,0 +1,92 @@
+import threading
+
+from mimic_viewer.ingestion.scheduler import IngestCancelled, IngestionScheduler
+
+def block_until(job, event, calls):
+    calls.append(("run", job.job_id))
+    event.wait(5)
+
+def test_jobs_cancelled_while_queued_run_their_cleanup_instead():
+    scheduler = IngestionScheduler(num_workers=1)
+    release = threading.Event()
+    calls = []
+    try:
+        running = scheduler.submit(block_until, release, calls)
+        queued = scheduler.submit(
+            lambda job, resource: calls.append(("run", job.job_id)),
+            "resource",
+            cleanup=lambda job, resource: calls.append(("cleanup", job.job_id, resource)),
+        )
+        queued.cancel()
+        release.set()
+    finally:
+        scheduler.shutdown(cancel_jobs=False)
+
+    assert calls == [("run", running.job_id), ("cleanup", queued.job_id, "resource")]
+    assert running.status == "done"
+    assert queued.status == "cancelled"
+
+def test_cleanup_is_not_called_for_jobs_that_ran():
+    scheduler = IngestionScheduler(num_workers=1)
+    calls = []
+
+    def cancelled_while_running(job):
+        job.cancel()
+        job.raise_if_cancelled()
+
+    try:
+        done = scheduler.submit(lambda job: calls.append("done"), cleanup=lambda job: calls.append("cleanup"))
+        cancelled = scheduler.submit(cancelled_while_running, cleanup=lambda job: calls.append("cleanup"))
+    finally:
+        scheduler.shutdown(cancel_jobs=False)
+
+    assert calls == ["done"]
+    assert done.status == "done"
+    assert cancelled.status == "cancelled"
+
+def test_shutdown_cleans_up_the_queued_jobs():
+    scheduler = IngestionScheduler(num_workers=1)
+    release = threading.Event()
+    cleaned_up = []
+    scheduler.submit(block_until, release, [])
+    queued = [scheduler.submit(lambda job: None, cleanup=lambda job: cleaned_up.append(job.job_id)) for _ in range(3)]
+    release.set()
+    scheduler.shutdown()
+
+    assert cleaned_up == [job.job_id for job in queued]
+    assert all(job.status == "cancelled" for job in queued)
+
+def test_failing_cleanup_is_reported_on_the_job():
+    scheduler = IngestionScheduler(num_workers=1)
+    release = threading.Event()
+
+    def failing_cleanup(job):
+        raise OSError("disk gone")
+
+    try:
+        scheduler.submit(block_until, release, [])
+        queued = scheduler.submit(lambda job: None, cleanup=failing_cleanup)
+        queued.cancel()
+        release.set()
+    finally:
+        scheduler.shutdown(cancel_jobs=False)
+
+    assert queued.status == "cancelled"
+    assert queued.error == "OSError: disk gone"
+
+def test_finished_jobs_let_go_of_their_arguments():
+    scheduler = IngestionScheduler(num_workers=1)
+
+    def fails(job, resource, option=None):
+        raise IngestCancelled()
+
+    try:
+        done = scheduler.submit(lambda job, resource, option=None: None, object(), option=object())
+        cancelled = scheduler.submit(fails, object())
+    finally:
+        scheduler.shutdown(cancel_jobs=False)
+
+    for job in (done, cancelled):
+        assert job.fn is None and job.cleanup is None
+        assert job.args == () and job.kwargs == {}
+    assert done.to_dict()["status"] == "done"
@@ -0,0 +1,200 @@
+import asyncio
+import importlib
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from mimic_viewer.web_server.recordings.rrd_episode_cache import RrdEpisodeCache
+
+GRPC_PORTS = range(19301, 19304)
+# all of them are the synthetic episode
+EPISODE_IDS = (1, 2, 3)
+
+@pytest.fixture(scope="module")
+def server_module(tmp_path_factory):
+    for module_name in ("dotenv", "uvicorn", "fastapi"):
+        pytest.importorskip(module_name)
+    # the server reads its configuration from the environment when it is imported
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in {
+            "MAX_RECORDINGS": "2",
+            "SERVER_IP_ADDRESS": "127.0.0.1",
+            "DEBUG": "",
+            "DB_BACKEND": "sqlite",
+            "DB_SQLITE_PATH": str(tmp_path_factory.mktemp("database") / "episodes.sqlite"),
+            "GRPC_PORT_MIN": str(GRPC_PORTS[0]),
+            "GRPC_PORT_MAX": str(GRPC_PORTS[-1]),
+        }.items():
+            monkeypatch.setenv(name, value)
+        server = importlib.import_module("mimic_viewer.web_server.server")
+    yield server
+    server.ingestion_scheduler.shutdown()
+
+@pytest.fixture
+def server(server_module, monkeypatch, episode, urdf_path):
+    """
+    The server module with the episodes of EPISODE_IDS being the synthetic episode, and no recording left behind.
+    """
+    async def get_episode_info(episode_id):
+        if episode_id not in EPISODE_IDS:
+            return None
+        return {"url": episode[0], "embodiment_name": "bimanual"}
+
+    async def get_episode_infos(episode_ids):
+        return {episode_id: await get_episode_info(episode_id) for episode_id in episode_ids if episode_id in EPISODE_IDS}
+
+    monkeypatch.setattr(server_module, "get_urdfs_path", lambda: urdf_path)
+    monkeypatch.setattr(server_module.episode_metadata_cache, "get_episode_info", get_episode_info)
+    monkeypatch.setattr(server_module.episode_metadata_cache, "get_episode_infos", get_episode_infos)
+    yield server_module
+    server_module.recording_data_manager.cleanup_all()
+
+def wait_for(job, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while job.status in ("queued", "running"):
+        assert time.monotonic() < deadline, f"job {job.job_id} is still {job.status}"
+        time.sleep(0.01)
+
+def get_free_ports(server):
+    return server.recording_data_manager.get_stats()["free_ports"]
+
+def test_failed_setups_give_their_port_and_cache_entry_back(server, monkeypatch, tmp_path):
+    rrd_cache = RrdEpisodeCache(str(tmp_path / "rrd"), 10**9)
+    monkeypatch.setattr(server, "rrd_cache", rrd_cache)
+    create_logger = server.create_logger
+
+    def create_failing_logger(logger_name):
+        logger = create_logger(logger_name)
+        def reset():
+            raise RuntimeError("no meshes")
+        logger.reset = reset
+        return logger
+
+    monkeypatch.setattr(server, "create_logger", create_failing_logger)
+    # more failures than there are ports
+    for _ in range(len(GRPC_PORTS) + 2):
+        with pytest.raises(RuntimeError, match="no meshes"):
+            asyncio.run(server.setup_episode_recording(1, None))
+        assert get_free_ports(server) == len(GRPC_PORTS)
+        assert os.listdir(rrd_cache.directory) == []
+
+    monkeypatch.setattr(server, "create_logger", create_logger)
+    grpc_port = asyncio.run(server.setup_episode_recording(1, None))
+    assert server.recording_data_manager.is_port_used(grpc_port)
+    wait_for(server.recording_data_manager.find_by_episode_id(1).ingest_job)
+
+def test_setup_that_is_not_added_cancels_its_ingest(server, monkeypatch):
+    submitted_jobs = []
+    submit = server.ingestion_scheduler.submit
+
+    def recording_submit(*args, **kwargs):
+        submitted_jobs.append(submit(*args, **kwargs))
+        return submitted_jobs[-1]
+
+    monkeypatch.setattr(server.ingestion_scheduler, "submit", recording_submit)
+    monkeypatch.setattr(server.recording_data_manager, "add", lambda recording_data: False)
+    with pytest.raises(server.HTTPException) as error:
+        asyncio.run(server.setup_episode_recording(1, None))
+    assert error.value.status_code == 409
+    assert get_free_ports(server) == len(GRPC_PORTS)
+    wait_for(submitted_jobs[0])
+    assert submitted_jobs[0].status == "cancelled"
+
+def test_concurrent_log_episode_requests_share_one_setup(server, monkeypatch):
+    setup_calls = []
+    setup_episode_recording = server.setup_episode_recording
+
+    async def counting_setup(*args):
+        setup_calls.append(args)
+        # the other requests come in while the setup is running
+        await asyncio.sleep(0.05)
+        return await setup_episode_recording(*args)
+
+    monkeypatch.setattr(server, "setup_episode_recording", counting_setup)
+
+    async def request_episode(count):
+        responses = await asyncio.gather(*(server.log_episode(1) for _ in range(count)))
+        return [json.loads(response.body) for response in responses]
+
+    responses = asyncio.run(request_episode(4))
+    assert len(setup_calls) == 1
+    assert len({response["url"] for response in responses}) == 1
+    assert len(server.recording_data_manager) == 1
+    assert get_free_ports(server) == len(GRPC_PORTS) - 1
+    assert len(server.episode_setups) == 0
+
+    # later requests find the recording without a setup
+    assert asyncio.run(request_episode(1)) == responses[:1]
+    assert len(setup_calls) == 1
+    wait_for(server.recording_data_manager.find_by_episode_id(1).ingest_job)
+
+def test_warm_ups_fill_the_free_slots_in_the_background(server):
+    release = threading.Event()
+    # the workers are busy, the ingests stay queued
+    blockers = [server.ingestion_scheduler.submit(lambda job: release.wait(30)) for _ in range(server.INGEST_CONCURRENCY)]
+
+    async def warm_up(episode_ids):
+        response = await server.warm_up(episode_ids=episode_ids, subdataset=None, limit=None)
+        await asyncio.gather(*list(server.warm_up_tasks))
+        assert response.status_code == 202
+        return json.loads(response.body)
+
+    async def log_episode(episode_id):
+        return json.loads((await server.log_episode(episode_id)).body)
+
+    try:
+        assert asyncio.run(warm_up([2, 3, 9])) == {"warming": [2, 3], "already_logged": [], "skipped": [], "not_found": [9]}
+        jobs = {episode_id: server.recording_data_manager.find_by_episode_id(episode_id).ingest_job for episode_id in (2, 3)}
+        for job in jobs.values():
+            assert job.status == "queued"
+            assert job.priority == server.PRIORITY_BACKGROUND
+        # warm-ups never evict a recording
+        assert asyncio.run(warm_up([1, 2])) == {"warming": [], "already_logged": [2], "skipped": [1], "not_found": []}
+        assert not server.recording_data_manager.contains(1)
+
+        # somebody waits for episode 3 now, its ingest goes before the other warm-up
+        asyncio.run(log_episode(3))
+        assert jobs[3].priority == server.PRIORITY_INTERACTIVE
+        assert jobs[2].priority == server.PRIORITY_BACKGROUND
+    finally:
+        release.set()
+    for job in blockers + list(jobs.values()):
+        wait_for(job)
+    assert jobs[3].status == jobs[2].status == "done"
+
+def test_metrics_endpoint_reports_the_served_recordings(server):
+    asyncio.run(server.log_episode(1))
+    recording_data = server.recording_data_manager.find_by_episode_id(1)
+    wait_for(recording_data.ingest_job)
+
+    response = asyncio.run(server.get_metrics())
+    assert response.media_type == "text/plain; version=0.0.4"
+    lines = response.body.decode().splitlines()
+    assert "# TYPE mimic_viewer_episode_ingest_seconds histogram" in lines
+    assert f'mimic_viewer_recording_rows_logged{{episode_id="1",grpc_port="{recording_data.grpc_port}",status="done"}} {recording_data.ingest_job.rows_logged}' in lines
+    # every sample line belongs to a metric declared before it
+    declared = set()
+    for line in lines:
+        if line.startswith("# TYPE "):
+            declared.add(line.split()[2])
+        elif not line.startswith("# "):
+            name = line.split("{")[0].split(" ")[0]
+            assert name in declared or name.rsplit("_", 1)[0] in declared, line
+
+def test_ingests_are_traced_to_trace_dir(server, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "TRACE_DIR", str(tmp_path))
+    asyncio.run(server.log_episode(1))
+    job = server.recording_data_manager.find_by_episode_id(1).ingest_job
+    wait_for(job)
+
+    with open(job.metadata["trace_path"]) as f:
+        chrome_trace = json.load(f)
+    assert os.path.dirname(job.metadata["trace_path"]) == str(tmp_path)
+    assert chrome_trace["otherData"]["episode_id"] == 1
+    events = [event for event in chrome_trace["traceEvents"] if event["ph"] == "X"]
+    names = {event["name"] for event in events}
+    assert {"ingest_episode", "read_rows", "log_batch", "send_columns"} <= names
+    assert all(event["args"]["episode"] == 1 for event in events)
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from mimic_viewer.web_server.single_flight import SingleFlight
+
+async def setup(calls, key, started, release):
+    calls.append(key)
+    started.set()
+    await release.wait()
+    if key == "failing":
+        raise RuntimeError("setup failed")
+    return f"port of {key}"
+
+def test_concurrent_calls_with_the_same_key_run_once():
+    async def main():
+        single_flight = SingleFlight()
+        calls = []
+        started, release = asyncio.Event(), asyncio.Event()
+        waiters = [asyncio.ensure_future(single_flight.run(key, setup, calls, key, started, release)) for key in ("a", "a", "b", "a")]
+        await started.wait()
+        assert single_flight.is_running("a") and len(single_flight) == 2
+        release.set()
+        assert await asyncio.gather(*waiters) == ["port of a", "port of a", "port of b", "port of a"]
+        assert calls == ["a", "b"]
+        # the key is free again once the call is done
+        assert len(single_flight) == 0
+        assert await single_flight.run("a", setup, calls, "a", started, release) == "port of a"
+        assert calls == ["a", "b", "a"]
+
+    asyncio.run(main())
+
+def test_every_waiter_gets_the_exception():
+    async def main():
+        single_flight = SingleFlight()
+        calls = []
+        started, release = asyncio.Event(), asyncio.Event()
+        waiters = [asyncio.ensure_future(single_flight.run("failing", setup, calls, "failing", started, release)) for _ in range(2)]
+        await started.wait()
+        release.set()
+        for result in await asyncio.gather(*waiters, return_exceptions=True):
+            assert isinstance(result, RuntimeError)
+        assert calls == ["failing"]
+        assert not single_flight.is_running("failing")
+
+    asyncio.run(main())
+
+def test_a_waiter_that_goes_away_does_not_cancel_the_others():
+    async def main():
+        single_flight = SingleFlight()
+        calls = []
+        started, release = asyncio.Event(), asyncio.Event()
+        first = asyncio.ensure_future(single_flight.run("a", setup, calls, "a", started, release))
+        second = asyncio.ensure_future(single_flight.run("a", setup, calls, "a", started, release))
+        await started.wait()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        release.set()
+        assert await second == "port of a"
+        assert calls == ["a"]
+
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+import zarr
+from zarr.storage import FSStore
+
+from mimic_viewer.data_sources import timestamp_index
+from mimic_viewer.data_sources.chunk_cache import DiskCachedStore, DiskChunkCache, open_zarr
+from mimic_viewer.data_sources.timestamp_index import EpisodeWindow, TimestampIndex
+from mimic_viewer.data_sources.topic_manifest import clear_topic_manifest_cache, get_store_topic_manifest
+from mimic_viewer.data_sources.zarr_batch_loader import ZarrBatchLoader
+from mimic_viewer.data_sources.zarr_point_loader import ZarrPointLoader
+
+NUM_ROWS = 500
+CHUNK_ROWS = 64
+
+@pytest.fixture
+def episode_path(tmp_path):
+    root = zarr.open(str(tmp_path / "episode.zarr"), mode="w")
+    for name, period in [("joints", 10_000_000), ("camera", 33_000_000)]:
+        root.create_dataset(name, data=np.arange(NUM_ROWS * 3, dtype=np.float64).reshape(NUM_ROWS, 3), chunks=(CHUNK_ROWS, 3))
+        root.create_dataset(f"{name}_timestamps", data=1_000 + np.arange(NUM_ROWS, dtype=np.int64) * period, chunks=(CHUNK_ROWS,))
+    return str(tmp_path / "episode.zarr")
+
+@pytest.fixture(autouse=True)
+def empty_caches(monkeypatch):
+    monkeypatch.setattr(timestamp_index, "_index_cache", OrderedDict())
+    clear_topic_manifest_cache()
+    yield
+    clear_topic_manifest_cache()
+
+@pytest.fixture
+def index_builds(monkeypatch):
+    builds = []
+    build = TimestampIndex.build.__func__
+
+    def counting_build(cls, timestamp_array):
+        builds.append(timestamp_array.path)
+        return build(cls, timestamp_array)
+
+    monkeypatch.setattr(TimestampIndex, "build", classmethod(counting_build))
+    return builds
+
+def test_window_row_ranges_match_the_timestamps(episode_path):
+    window = EpisodeWindow(start_time=200_000_000, end_time=2_000_000_000)
+    loader = ZarrBatchLoader(open_zarr(episode_path), window=window)
+    root = zarr.open(episode_path, mode="r")
+    for name in loader.data_group_names:
+        timestamps = root[f"{name}_timestamps"][:]
+        expected = (int(np.searchsorted(timestamps, window.start_time, side="left")), int(np.searchsorted(timestamps, window.end_time, side="right")))
+        assert loader.get_row_range(name) == expected
+
+def test_indexes_of_manifest_opened_arrays_are_cached(episode_path, index_builds):
+    window = EpisodeWindow(start_time=200_000_000, end_time=2_000_000_000)
+    ZarrBatchLoader(open_zarr(episode_path), window=window)
+    assert sorted(index_builds) == ["camera_timestamps", "joints_timestamps"]
+    assert len(timestamp_index._index_cache) == 2
+
+    # reopening the episode, with either loader, reuses the indexes
+    ZarrBatchLoader(open_zarr(episode_path), window=window)
+    ZarrPointLoader(open_zarr(episode_path), window=window)
+    assert len(index_builds) == 2
+
+def test_indexes_are_cached_through_the_chunk_cache(episode_path, index_builds, tmp_path):
+    chunk_cache = DiskChunkCache(str(tmp_path / "chunk_cache"), 10**9)
+    window = EpisodeWindow(end_time=2_000_000_000)
+    for _ in range(2):
+        store = DiskCachedStore(FSStore(f"file://{episode_path}", mode="r"), chunk_cache, namespace=episode_path)
+        ZarrBatchLoader(get_store_topic_manifest(store).open(store), window=window)
+    assert len(index_builds) == 2
+    assert {key[0] for key in timestamp_index._index_cache} == {store.path}
+
+def test_arrays_of_stores_without_a_path_are_not_cached(index_builds):
+    root = zarr.group()
+    root.create_dataset("joints", data=np.zeros((10, 3)), chunks=(4, 3))
+    root.create_dataset("joints_timestamps", data=np.arange(10, dtype=np.int64), chunks=(4,))
+    for _ in range(2):
+        ZarrBatchLoader(root, window=EpisodeWindow(start_time=3))
+    assert len(index_builds) == 2
+    assert not timestamp_index._index_cache
+
+class CountingStore(zarr.MemoryStore):
+    """
+    Counts the chunks read from it.
+    """
+    def __init__(self):
+        super().__init__()
+        self.chunk_reads = 0
+
+    def __getitem__(self, key):
+        if not key.rsplit("/", 1)[-1].startswith("."):
+            self.chunk_reads += 1
+        return super().__getitem__(key)
+
+def create_timestamp_array(timestamps, chunk_rows):
+    store = CountingStore()
+    timestamp_array = zarr.array(timestamps, chunks=(chunk_rows,), store=store)
+    store.chunk_reads = 0
+    return timestamp_array, store
+
+def get_expected_row_range(timestamps, start_time, end_time):
+    start_row = 0 if start_time is None else int(np.searchsorted(timestamps, start_time, side="left"))
+    end_row = len(timestamps) if end_time is None else int(np.searchsorted(timestamps, end_time, side="right"))
+    return start_row, max(start_row, end_row)
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 64, 1000])
+@pytest.mark.parametrize("repeated", [False, True])
+def test_row_ranges_match_a_scan_of_the_timestamps(chunk_rows, repeated):
+    rng = np.random.default_rng(chunk_rows)
+    timestamps = np.sort(rng.integers(0, 1_000, 300))
+    if repeated:
+        # runs of equal timestamps across chunk boundaries
+        timestamps = np.repeat(timestamps[:60], 5)
+    timestamp_array, _ = create_timestamp_array(timestamps, chunk_rows)
+    index = TimestampIndex.build(timestamp_array)
+    for start_time, end_time in [(None, None), (-5, None), (None, 2_000), (500, 500), (600, 300)] + [
+        tuple(sorted(rng.integers(-10, 1_010, 2))) for _ in range(50)
+    ]:
+        assert index.find_row_range(timestamp_array, start_time, end_time) == get_expected_row_range(timestamps, start_time, end_time)
+    assert index.is_sorted
+    assert TimestampIndex.build(zarr.array(np.zeros(0, dtype=np.int64))).find_row_range(None, 0, 10) == (0, 0)
+
+def test_only_a_few_chunks_of_long_arrays_are_read():
+    # an hour at 1kHz
+    timestamps = np.arange(3_600_000, dtype=np.int64) * 1_000_000
+    timestamp_array, store = create_timestamp_array(timestamps, 1000)
+    index = TimestampIndex.build(timestamp_array)
+    assert store.chunk_reads == 0
+
+    assert index.find_row_range(timestamp_array, 1_800_000_000_000, 1_820_000_000_000) == (1_800_000, 1_820_001)
+    # a binary search of the 3600 chunks for each bound
+    assert store.chunk_reads <= 2 * (int(np.ceil(np.log2(3600))) + 1)
+
+    # the chunks read for the first window narrow the search for the next ones
+    store.chunk_reads = 0
+    index.find_row_range(timestamp_array, 1_800_500_000_000, 1_819_500_000_000)
+    assert store.chunk_reads <= 4
+
+def test_unsorted_arrays_are_scanned_once():
+    timestamps = np.arange(10_000, dtype=np.int64)
+    timestamps[5_000:5_010] = timestamps[5_000:5_010][::-1]
+    timestamp_array, store = create_timestamp_array(timestamps, 100)
+    index = TimestampIndex.build(timestamp_array)
+    # the window is in the chunk that is out of order
+    assert index.find_row_range(timestamp_array, 5_003, 5_006) == (5_003, 5_007)
+    assert not index.is_sorted
+
+    # the min and max of every chunk are kept, the next windows only read the chunks that hold them
+    store.chunk_reads = 0
+    assert index.find_row_range(timestamp_array, 7_050, 7_250) == (7_050, 7_251)
+    assert store.chunk_reads <= 6
@@ -0,0 +1,104 @@
+import pickle
+import shutil
+
+import numpy as np
+import pytest
+import zarr
+from zarr.storage import DirectoryStore
+
+from mimic_viewer.data_sources.chunk_cache import open_zarr
+from mimic_viewer.data_sources.topic_manifest import clear_topic_manifest_cache, get_store_topic_manifest, get_topic_manifest, read_topic_manifest
+from mimic_viewer.data_sources.zarr_batch_loader import ZarrBatchLoader
+
+class CountingStore(DirectoryStore):
+    """
+    Counts the requests a remote store would get.
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self.requests = 0
+
+    def __getitem__(self, key):
+        self.requests += 1
+        return super().__getitem__(key)
+
+    def getitems(self, keys, *, contexts):
+        self.requests += 1
+        return {key: super(CountingStore, self).__getitem__(key) for key in keys if super(CountingStore, self).__contains__(key)}
+
+    def __contains__(self, key):
+        self.requests += 1
+        return super().__contains__(key)
+
+    def listdir(self, path=None):
+        self.requests += 1
+        return super().listdir(path)
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_topic_manifest_cache()
+    yield
+    clear_topic_manifest_cache()
+
+@pytest.fixture(scope="module")
+def consolidated_episode(episode, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("consolidated") / "bimanual.zarr")
+    shutil.copytree(episode[0], path)
+    zarr.consolidate_metadata(path)
+    return path
+
+def test_manifest_describes_every_topic(episode):
+    path, specs = episode
+    manifest = read_topic_manifest(DirectoryStore(path))
+    assert not manifest.consolidated
+    assert manifest.untimed_names == []
+    assert list(manifest.topics) == sorted(spec.name for spec in specs)
+    for spec in specs:
+        topic = manifest.topics[spec.name]
+        assert topic.length == max(1, int(1.0 * spec.rate_hz))
+        assert np.dtype(topic.dtype) == np.dtype(spec.dtype)
+        assert topic.row_shape == spec.row_shape
+        assert topic.chunk_rows == spec.chunk_rows
+        assert topic.row_nbytes == np.dtype(spec.dtype).itemsize * int(np.prod(spec.row_shape)) + 8
+
+def test_consolidated_metadata_gives_the_same_manifest(episode, consolidated_episode):
+    manifest = read_topic_manifest(DirectoryStore(episode[0]))
+    consolidated_manifest = read_topic_manifest(DirectoryStore(consolidated_episode))
+    assert consolidated_manifest.consolidated
+    assert consolidated_manifest.topics == manifest.topics
+
+@pytest.mark.parametrize("consolidated", [False, True])
+def test_episode_opens_in_two_requests_once(episode, consolidated_episode, consolidated):
+    store = CountingStore(consolidated_episode if consolidated else episode[0])
+    manifest = get_store_topic_manifest(store)
+    root = manifest.open(store)
+    ZarrBatchLoader(root)
+    assert store.requests == 2
+
+    # the same location is not read again, even through another store object
+    other_store = CountingStore(store.path)
+    assert get_store_topic_manifest(other_store) is manifest
+    ZarrBatchLoader(manifest.open(other_store))
+    assert other_store.requests == 0
+
+def test_untimed_and_mismatched_topics(tmp_path):
+    root = zarr.open(str(tmp_path / "episode.zarr"), mode="w")
+    root.create_dataset("joints", data=np.zeros((10, 2)), chunks=(4, 2))
+    root.create_dataset("joints_timestamps", data=np.arange(10), chunks=(4,))
+    root.create_dataset("untimed", data=np.zeros(5))
+    root.create_dataset("short", data=np.zeros(5))
+    root.create_dataset("short_timestamps", data=np.arange(4))
+    root.create_group("subgroup")
+
+    manifest = get_topic_manifest(zarr.open(str(tmp_path / "episode.zarr"), mode="r"))
+    assert list(manifest.topics) == ["joints"]
+    assert manifest.untimed_names == ["untimed"]
+
+def test_manifest_can_be_sent_to_another_process(episode):
+    path, _ = episode
+    manifest = pickle.loads(pickle.dumps(get_topic_manifest(open_zarr(path))))
+    loader = ZarrBatchLoader(open_zarr(path, manifest=manifest), manifest=manifest)
+    assert loader.manifest is manifest
+    assert sum(len(topic_batch["timestamps"]) for data_batches in loader.get_data() for topic_batch in data_batches) == sum(
+        topic.length for topic in manifest.topics.values()
+    )
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+import pytest
+
+from mimic_viewer.tracing import Trace, get_active_trace, propagate, span
+
+def get_events(trace):
+    return [event for event in trace.to_chrome_trace()["traceEvents"] if event["ph"] == "X"]
+
+def test_spans_do_nothing_without_an_active_trace():
+    assert get_active_trace() is None
+    with span("read_rows", topic="joints"):
+        pass
+    trace = Trace()
+    with trace.activate():
+        assert get_active_trace() is trace
+    assert get_active_trace() is None
+    with span("read_rows"):
+        pass
+    assert len(trace) == 0
+
+def test_nested_spans_inherit_the_tags():
+    trace = Trace(episode_id=1)
+    with trace.activate(episode=1):
+        with span("log_batch", topic="joints"):
+            with span("send_columns", category="rerun", rows=10):
+                pass
+        with pytest.raises(KeyError):
+            with span("log_point", topic="unknown"):
+                raise KeyError("unknown")
+
+    events = get_events(trace)
+    # events are added when their span ends
+    assert [(event["name"], event["cat"], event["args"]) for event in events] == [
+        ("send_columns", "rerun", {"episode": 1, "topic": "joints", "rows": 10}),
+        ("log_batch", "ingest", {"episode": 1, "topic": "joints"}),
+        ("log_point", "ingest", {"episode": 1, "topic": "unknown", "error": "KeyError"}),
+    ]
+    inner, outer, _ = events
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+def test_work_handed_to_an_executor_is_traced_when_propagated():
+    trace = Trace()
+
+    def read_rows(start):
+        with span("read_rows", start=start):
+            pass
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") as executor:
+        with trace.activate(episode=1), span("ingest_episode"):
+            executor.submit(read_rows, 0).result()
+            executor.submit(propagate(read_rows), 10).result()
+    assert propagate(read_rows) is read_rows
+
+    chrome_trace = trace.to_chrome_trace()
+    read_event, ingest_event = get_events(trace)
+    assert read_event["args"] == {"episode": 1, "start": 10}
+    assert read_event["tid"] != ingest_event["tid"]
+    thread_names = {event["tid"]: event["args"]["name"] for event in chrome_trace["traceEvents"] if event["ph"] == "M"}
+    assert thread_names[read_event["tid"]].startswith("prefetch")
+
+def test_saved_traces_are_chrome_traces(tmp_path):
+    trace = Trace(max_events=2, episode_id=1, window=None)
+    with trace.activate():
+        for index in range(3):
+            with span("read_rows", start=index):
+                pass
+    path = str(tmp_path / "traces" / "episode_1.json")
+    trace.save(path)
+
+    with open(path) as f:
+        chrome_trace = json.load(f)
+    assert chrome_trace == json.loads(json.dumps(trace.to_chrome_trace()))
+    assert chrome_trace["displayTimeUnit"] == "ms"
+    assert chrome_trace["otherData"]["episode_id"] == 1
+    assert chrome_trace["otherData"]["dropped_events"] == 1
+    assert [event["args"]["start"] for event in chrome_trace["traceEvents"] if event["ph"] == "X"] == [0, 1]
+    assert list(tmp_path.joinpath("traces").iterdir()) == [tmp_path / "traces" / "episode_1.json"]
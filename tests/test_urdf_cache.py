@@ -0,0 +1,56 @@
+import os
+
+import pytest
+from rerun_loader_urdf import URDFLogger
+from synthetic_episode import write_hand_urdf
+
+from mimic_viewer.loggers import urdf_cache
+from mimic_viewer.loggers.urdf_cache import _LogCallRecorder, clear_urdf_logger_cache, get_urdf_logger
+
+@pytest.fixture
+def hand_urdf(tmp_path):
+    write_hand_urdf(str(tmp_path / "hand"))
+    yield str(tmp_path / "hand" / "converted.urdf")
+    clear_urdf_logger_cache()
+
+def test_loggers_are_shared_until_the_urdf_changes(hand_urdf, tmp_path):
+    logger = get_urdf_logger(hand_urdf, "left")
+    assert isinstance(logger, urdf_cache.CachedURDFLogger)
+    assert get_urdf_logger(hand_urdf, "left") is logger
+    os.symlink(hand_urdf, tmp_path / "link.urdf")
+    assert get_urdf_logger(str(tmp_path / "link.urdf"), "left") is logger
+
+    # the prefix and the color are part of the key
+    assert get_urdf_logger(hand_urdf, "right") is not logger
+    colored = get_urdf_logger(hand_urdf, "left", material_rgba=(1.0, 0.0, 0.0, 1.0))
+    assert colored is not logger
+    assert all(material.color.rgba == [1.0, 0.0, 0.0, 1.0] for material in colored.urdf.materials)
+    assert all(material.color.rgba == [0.5, 0.5, 0.5, 1.0] for material in logger.urdf.materials)
+
+    mtime = os.stat(hand_urdf).st_mtime_ns
+    os.utime(hand_urdf, ns=(mtime + 10**9, mtime + 10**9))
+    rebuilt = get_urdf_logger(hand_urdf, "left")
+    assert rebuilt is not logger
+    assert get_urdf_logger(hand_urdf, "left") is rebuilt
+
+    clear_urdf_logger_cache()
+    assert get_urdf_logger(hand_urdf, "left") is not rebuilt
+
+def test_meshes_are_loaded_once(hand_urdf, monkeypatch):
+    logger = get_urdf_logger(hand_urdf, "left")
+    mesh_loads = []
+    load_meshes = URDFLogger.log
+
+    def counting_log(self, recording):
+        mesh_loads.append(self)
+        load_meshes(self, recording)
+
+    monkeypatch.setattr(URDFLogger, "log", counting_log)
+
+    recordings = [_LogCallRecorder() for _ in range(3)]
+    for recording in recordings:
+        logger.log(recording)
+    assert mesh_loads == [logger]
+    assert recordings[0].calls
+    assert recordings[0].calls == recordings[1].calls == recordings[2].calls
+    assert any(entity_path.startswith("left") for entity_path, _, _, _ in recordings[0].calls)
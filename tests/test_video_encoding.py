@@ -0,0 +1,66 @@
+import datetime
+
+import numpy as np
+import pytest
+import rerun as rr
+import rerun.dataframe as rd
+
+from mimic_viewer.loggers.video_encoding import VideoEncoding, VideoStreamLogger
+
+pytest.importorskip("av")
+
+FRAME_PERIOD = 33_000_000
+
+def read_frame_references(path, entity):
+    """
+    time in ns -> (segment entity, timestamp in the segment) of the frames of entity, the last ones
+    logged at every time.
+    """
+    view = rd.load_recording(path).view(index="time", contents=f"{entity}/**")
+    references = {}
+    for row in view.select().read_all().to_pylist():
+        # datetime.timedelta, in microseconds
+        references[round(row["time"] / datetime.timedelta(microseconds=1)) * 1000] = (row[f"/{entity}:VideoFrameReference:video_reference"][0], row[f"/{entity}:VideoFrameReference:timestamp"][0])
+    return references
+
+def get_segment_entity(index):
+    return f"videos/cameras/fixed_0/segment_{index:05d}"
+
+def test_segments_roll_over_and_frames_point_into_them(tmp_path):
+    path = str(tmp_path / "video.rrd")
+    recording = rr.RecordingStream("mimic_viewer_test")
+    recording.save(path)
+    video_stream = VideoStreamLogger("cameras/fixed_0", VideoEncoding(segment_frames=4), recording)
+
+    frames = np.zeros((6, 24, 32, 3), dtype=np.uint8)
+    # full after 4 frames
+    video_stream.log_batch(frames, np.arange(6) * FRAME_PERIOD)
+    # the frame size changes
+    video_stream.log_batch(np.zeros((2, 12, 16, 3), dtype=np.uint8), np.arange(6, 8) * FRAME_PERIOD)
+    # time goes back, e.g. the full resolution pass of a progressive ingest
+    video_stream.log_batch(frames[:2], np.arange(2) * FRAME_PERIOD)
+    video_stream.flush()
+    assert video_stream.num_segments == 4
+    recording.flush(blocking=True)
+    recording.disconnect()
+
+    # frames are referenced from the start of their segment
+    assert read_frame_references(path, "cameras/fixed_0") == {
+        0: (get_segment_entity(3), 0),
+        1 * FRAME_PERIOD: (get_segment_entity(3), FRAME_PERIOD),
+        2 * FRAME_PERIOD: (get_segment_entity(0), 2 * FRAME_PERIOD),
+        3 * FRAME_PERIOD: (get_segment_entity(0), 3 * FRAME_PERIOD),
+        4 * FRAME_PERIOD: (get_segment_entity(1), 0),
+        5 * FRAME_PERIOD: (get_segment_entity(1), FRAME_PERIOD),
+        6 * FRAME_PERIOD: (get_segment_entity(2), 0),
+        7 * FRAME_PERIOD: (get_segment_entity(2), FRAME_PERIOD),
+    }
+    segment_entities = {column.entity_path for column in rd.load_recording(path).schema().component_columns() if column.archetype == "rerun.archetypes.AssetVideo"}
+    assert segment_entities == {f"/{get_segment_entity(index)}" for index in range(4)}
+
+def test_flush_without_frames_logs_nothing():
+    recording = rr.RecordingStream("mimic_viewer_test")
+    recording.memory_recording()
+    video_stream = VideoStreamLogger("cameras/fixed_0", VideoEncoding(), recording)
+    video_stream.flush()
+    assert video_stream.num_segments == 0
@@ -0,0 +1,218 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import numpy as np
+import pytest
+import zarr
+
+from mimic_viewer.data_sources.chunk_cache import open_zarr
+from mimic_viewer.data_sources.chunk_prefetcher import ChunkPrefetcher
+from mimic_viewer.data_sources.timestamp_index import EpisodeWindow
+from mimic_viewer.data_sources.zarr_batch_loader import ZarrBatchLoader
+from mimic_viewer.data_sources.zarr_point_loader import ZarrPointLoader
+
+def read_episode(path):
+    """
+    topic name -> (values, timestamps) of the whole episode, read directly with zarr.
+    """
+    root = zarr.open(path, mode="r")
+    return {
+        name: (root[name][:], root[f"{name}_timestamps"][:])
+        for name in root.array_keys() if not name.endswith("_timestamps")
+    }
+
+def read_episode_group(root, name):
+    return {name: (root[name][:], root[f"{name}_timestamps"][:])}
+
+def collect_batches(batches):
+    rows = {}
+    for data_batches in batches:
+        for topic_batch in data_batches:
+            topic_rows = rows.setdefault(topic_batch["topic_name"], ([], []))
+            topic_rows[0].append(topic_batch["values"])
+            topic_rows[1].append(topic_batch["timestamps"])
+    return {name: (np.concatenate(values), np.concatenate(timestamps)) for name, (values, timestamps) in rows.items()}
+
+def collect_points(points):
+    rows = {}
+    for name, timestamp, value in points:
+        topic_rows = rows.setdefault(name, ([], []))
+        topic_rows[0].append(value)
+        topic_rows[1].append(timestamp)
+    return {name: (np.stack(values), np.array(timestamps)) for name, (values, timestamps) in rows.items()}
+
+def assert_same_rows(rows, expected):
+    assert sorted(rows) == sorted(expected)
+    for name, (values, timestamps) in expected.items():
+        np.testing.assert_array_equal(rows[name][0], values, err_msg=name)
+        np.testing.assert_array_equal(rows[name][1], timestamps, err_msg=name)
+
+@pytest.fixture(scope="module")
+def executor():
+    with ThreadPoolExecutor(4) as executor:
+        yield executor
+
+@pytest.mark.parametrize("batch_size, max_batch_bytes", [(25, None), (1000, None), (None, 20_000)])
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_batch_loader_reads_every_row(episode, executor, batch_size, max_batch_bytes, prefetch):
+    path, specs = episode
+    loader = ZarrBatchLoader(open_zarr(path), executor if prefetch else None)
+    assert loader.data_group_names == sorted(spec.name for spec in specs)
+    assert_same_rows(collect_batches(loader.get_data(batch_size, max_batch_bytes=max_batch_bytes)), read_episode(path))
+
+def test_byte_budget_batches_are_chunk_aligned(episode):
+    path, specs = episode
+    loader = ZarrBatchLoader(open_zarr(path))
+    chunk_rows = {spec.name: spec.chunk_rows for spec in specs}
+    next_rows = dict.fromkeys(chunk_rows, 0)
+    for data_batches in loader.get_data(max_batch_bytes=20_000):
+        for topic_batch in data_batches:
+            name = topic_batch["topic_name"]
+            # every batch starts on a chunk boundary, so no chunk is read twice
+            assert next_rows[name] % chunk_rows[name] == 0
+            next_rows[name] += len(topic_batch["timestamps"])
+    # cameras get fewer rows per batch than the other topics, but at least a chunk
+    assert loader.get_chunk_aligned_batch_size("cameras__fixed_0", 20_000) == 7
+    assert loader.get_chunk_aligned_batch_size("mimic_hand__left__joint_cmd", 20_000) == 128
+
+class ChunkCountingStore(zarr.MemoryStore):
+    """
+    Counts the reads of every chunk.
+    """
+    def __init__(self):
+        super().__init__()
+        self.chunk_reads = Counter()
+
+    def __getitem__(self, key):
+        if not key.rsplit("/", 1)[-1].startswith("."):
+            self.chunk_reads[key] += 1
+        return super().__getitem__(key)
+
+@pytest.mark.parametrize("timestamp_chunk_rows, expected_batch_size", [(8, 40), (12, 24), (1000, 40)])
+def test_batches_are_aligned_to_the_timestamp_chunks_when_they_fit(timestamp_chunk_rows, expected_batch_size):
+    store = ChunkCountingStore()
+    root = zarr.group(store=store)
+    root.create_dataset("joints", data=np.arange(300 * 3, dtype=np.float64).reshape(300, 3), chunks=(8, 3))
+    root.create_dataset("joints_timestamps", data=np.arange(300, dtype=np.int64), chunks=(timestamp_chunk_rows,))
+    loader = ZarrBatchLoader(root)
+    # 40 rows of 3 float64 values and a timestamp
+    max_batch_bytes = 40 * 32
+    assert loader.get_chunk_aligned_batch_size("joints", max_batch_bytes) == expected_batch_size
+
+    expected = read_episode_group(root, "joints")
+    store.chunk_reads.clear()
+    assert_same_rows(collect_batches(loader.get_data(max_batch_bytes=max_batch_bytes)), expected)
+    timestamp_reads = [count for key, count in store.chunk_reads.items() if key.startswith("joints_timestamps/")]
+    if timestamp_chunk_rows == 1000:
+        # 24000 rows of both chunkings would not fit in the budget, the small timestamp array is read again
+        assert max(timestamp_reads) > 1
+    else:
+        assert timestamp_reads == [1] * -(-300 // timestamp_chunk_rows)
+    assert set(count for key, count in store.chunk_reads.items() if key.startswith("joints/")) == {1}
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_point_loader_matches_the_batch_loader(episode, executor, prefetch):
+    path, _ = episode
+    points = list(ZarrPointLoader(open_zarr(path), executor if prefetch else None).get_data())
+    assert_same_rows(collect_points(points), collect_batches(ZarrBatchLoader(open_zarr(path)).get_data()))
+
+    # one row of every topic after the other, the longest topics last
+    names = sorted({name for name, _, _ in points})
+    assert [name for name, _, _ in points[:len(names)]] == names
+
+WINDOWS = [
+    EpisodeWindow(start_index=10, end_index=50),
+    EpisodeWindow(start_time=200_000_000, end_time=700_000_000),
+    EpisodeWindow(start_time=300_000_000, start_index=5, end_index=40),
+    EpisodeWindow(start_time=10**15),
+]
+
+def get_expected_row_range(window, timestamps):
+    start_row = max(window.start_index or 0, 0)
+    end_row = len(timestamps) if window.end_index is None else min(window.end_index, len(timestamps))
+    if window.start_time is not None:
+        start_row = max(start_row, int(np.searchsorted(timestamps, window.start_time, side="left")))
+    if window.end_time is not None:
+        end_row = min(end_row, int(np.searchsorted(timestamps, window.end_time, side="right")))
+    return start_row, max(start_row, end_row)
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_windows_load_their_row_range(episode, executor, window):
+    path, _ = episode
+    expected = {}
+    for name, (values, timestamps) in read_episode(path).items():
+        start_row, end_row = get_expected_row_range(window, timestamps)
+        if end_row > start_row:
+            expected[name] = (values[start_row:end_row], timestamps[start_row:end_row])
+
+    batch_loader = ZarrBatchLoader(open_zarr(path), window=window)
+    for name, (_, timestamps) in read_episode(path).items():
+        assert batch_loader.get_row_range(name) == get_expected_row_range(window, timestamps)
+    assert_same_rows(collect_batches(batch_loader.get_data(10)), expected)
+    assert_same_rows(collect_batches(ZarrBatchLoader(open_zarr(path), executor, window=window).get_data(max_batch_bytes=20_000)), expected)
+    assert_same_rows(collect_points(ZarrPointLoader(open_zarr(path), executor, window=window).get_data()), expected)
+
+@pytest.mark.parametrize("step, batch_size", [(1, 1000), (3, 4), (10, 2)])
+def test_decimated_data_keeps_every_step_th_row(episode, step, batch_size):
+    path, _ = episode
+    window = EpisodeWindow(start_index=3)
+    loader = ZarrBatchLoader(open_zarr(path), window=window)
+    for data_batches in loader.get_decimated_data(step, batch_size):
+        assert all(len(topic_batch["timestamps"]) <= batch_size for topic_batch in data_batches)
+    expected = {name: (values[3::step], timestamps[3::step]) for name, (values, timestamps) in read_episode(path).items()}
+    assert_same_rows(collect_batches(loader.get_decimated_data(step, batch_size)), expected)
+
+    with pytest.raises(ValueError):
+        next(loader.get_decimated_data(0))
+
+class SlowArray:
+    """
+    An array whose reads take longer the earlier the rows are, so that reads finish out of order.
+    Records how many reads run at the same time.
+    """
+    def __init__(self, values):
+        self.values = values
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def __getitem__(self, rows):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.002 * (len(self.values) - rows.start) / len(self.values))
+        with self.lock:
+            self.running -= 1
+        return self.values[rows]
+
+def test_prefetcher_hands_out_slices_in_order(executor):
+    arrays = {name: (SlowArray(np.arange(100) + offset), SlowArray(np.arange(100))) for name, offset in [("a", 0), ("b", 1000)]}
+    slices = [(start, start + 10) for start in range(0, 100, 10)]
+    with ChunkPrefetcher(executor, readahead=3) as prefetcher:
+        prefetcher.schedule({name: (data_array, timestamp_array, slices) for name, (data_array, timestamp_array) in arrays.items()})
+        for start, end in slices:
+            for name, offset in [("b", 1000), ("a", 0)]:
+                values, timestamps = prefetcher.get(name)
+                np.testing.assert_array_equal(values, np.arange(start, end) + offset)
+                np.testing.assert_array_equal(timestamps, np.arange(start, end))
+        with pytest.raises(IndexError):
+            prefetcher.get("a")
+    # at most readahead reads of a topic are in flight
+    assert all(data_array.max_running <= 3 for data_array, _ in arrays.values())
+
+def test_prefetcher_does_not_read_ahead_of_a_slow_consumer():
+    submitted = []
+
+    class RecordingExecutor(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(args[3:5])
+            return super().submit(fn, *args, **kwargs)
+
+    values = np.arange(100)
+    with RecordingExecutor(2) as executor, ChunkPrefetcher(executor, readahead=2) as prefetcher:
+        prefetcher.schedule({"a": (values, values, [(start, start + 10) for start in range(0, 100, 10)])})
+        assert submitted == [(0, 10), (10, 20)]
+        prefetcher.get("a")
+        assert submitted == [(0, 10), (10, 20), (20, 30)]